@@ -37,6 +37,10 @@ setup(
     python_requires=">=3.8",
     install_requires=requirements,
     extras_require={
+        "fast": [
+            "lxml>=4.9",
+            "numpy>=1.21",
+        ],
         "dev": [
             "pytest>=6.0",
             "pytest-cov",
@@ -18,6 +18,77 @@ class MeasurementConfig:
     validation: Dict[str, Any]
 
 
+@dataclass
+class TypePlan:
+    """Precompiled processing plan for one HealthKit data type."""
+    data_type: str
+    category: str
+    measurement_name: str
+    parser_method: str  # Name of the HealthDataParser method for this type
+    validation_enabled: bool
+    validation_rules: Dict[str, Any]
+    field_name: str  # Field name used for the 'value' field in InfluxDB
+    tags: List[str]
+
+
+# Tags the parsers split a record's device into; a 'device' entry in older
+# configurations stands for all of them
+DEVICE_TAG_NAMES = ['device_name', 'device_model', 'hardware']
+
+
+def expand_device_tags(tags: List[str]) -> List[str]:
+    """Replace a legacy 'device' tag with the device tags, keeping order."""
+    expanded: List[str] = []
+    for tag in tags:
+        for name in (DEVICE_TAG_NAMES if tag == 'device' else [tag]):
+            if name not in expanded:
+                expanded.append(name)
+    return expanded
+
+
+# InfluxDB field names for the 'value' field of common data types
+TYPE_FIELD_NAMES = {
+    'HKQuantityTypeIdentifierHeartRate': 'heart_rate',
+    'HKQuantityTypeIdentifierRestingHeartRate': 'resting_heart_rate',
+    'HKQuantityTypeIdentifierHeartRateVariabilitySDNN': 'hrv_sdnn',
+    'HKQuantityTypeIdentifierBodyMass': 'weight',
+    'HKQuantityTypeIdentifierHeight': 'height',
+    'HKQuantityTypeIdentifierActiveEnergyBurned': 'active_energy',
+    'HKQuantityTypeIdentifierBasalEnergyBurned': 'basal_energy',
+    'HKQuantityTypeIdentifierStepCount': 'steps',
+    'HKQuantityTypeIdentifierDistanceWalkingRunning': 'distance',
+    'HKQuantityTypeIdentifierFlightsClimbed': 'flights',
+    'HKQuantityTypeIdentifierOxygenSaturation': 'oxygen_saturation',
+    'HKQuantityTypeIdentifierRespiratoryRate': 'respiratory_rate',
+    'HKQuantityTypeIdentifierVO2Max': 'vo2_max',
+    'HKQuantityTypeIdentifierWalkingSpeed': 'walking_speed',
+    'HKQuantityTypeIdentifierRunningSpeed': 'running_speed',
+    'HKQuantityTypeIdentifierAppleExerciseTime': 'exercise_time',
+    'HKQuantityTypeIdentifierAppleStandTime': 'stand_time',
+}
+
+
+def get_parser_method(data_type: str) -> str:
+    """Pick the HealthDataParser method for a data type from its identifier."""
+    if data_type == 'HKWorkoutTypeIdentifier':
+        return 'parse_workout'
+    if data_type == 'HKActivitySummary':
+        return 'parse_activity'
+    if data_type.startswith('HKQuantityType') or data_type.startswith('HKDataType'):
+        return 'parse_generic_quantity'
+    if data_type.startswith('HKCategoryType'):
+        return 'parse_category'
+
+    # Legacy parsers for other identifiers
+    if 'HeartRate' in data_type:
+        return 'parse_heart_rate'
+    if any(energy_type in data_type for energy_type in ['EnergyBurned', 'StepCount']):
+        return 'parse_calories'
+    if 'Sleep' in data_type:
+        return 'parse_sleep'
+    return 'parse_generic_quantity'
+
+
 @dataclass
 class GlobalConfig:
     """Global configuration settings."""
@@ -35,6 +106,7 @@ class ConfigManager:
         self.config_path = Path(measurements_config_path)
         self.measurements_config = None
         self.global_config = None
+        self.type_plans: Dict[str, TypePlan] = {}
         self._load_config()
 
     def _load_config(self) -> None:
@@ -42,19 +114,46 @@ class ConfigManager:
         if not self.config_path.exists():
             logging.warning(f"Measurements config file {self.config_path} not found, using defaults")
             self._create_default_config()
-            return
+        else:
+            try:
+                with open(self.config_path, 'r') as f:
+                    config_data = yaml.safe_load(f)
 
-        try:
-            with open(self.config_path, 'r') as f:
-                config_data = yaml.safe_load(f)
+                self._parse_config(config_data)
+                logging.info(f"Loaded measurements configuration from {self.config_path}")
 
-            self._parse_config(config_data)
-            logging.info(f"Loaded measurements configuration from {self.config_path}")
+            except Exception as e:
+                logging.error(f"Error loading measurements config: {e}")
+                logging.info("Using default configuration")
+                self._create_default_config()
 
-        except Exception as e:
-            logging.error(f"Error loading measurements config: {e}")
-            logging.info("Using default configuration")
-            self._create_default_config()
+        self._compile_type_plans()
+
+    def _compile_type_plans(self) -> None:
+        """Build the data type -> TypePlan lookup used for every parsed element."""
+        self.type_plans = {}
+        for category, config in self.measurements_config.items():
+            for data_type in config.types:
+                # The first category listing a type wins, as in a linear scan
+                if data_type not in self.type_plans:
+                    self.type_plans[data_type] = self.build_type_plan(data_type, category)
+
+    def build_type_plan(self, data_type: str, category: str) -> Optional[TypePlan]:
+        """Build the processing plan for a data type in a measurement category."""
+        config = self.get_measurement_config(category)
+        if not config:
+            return None
+
+        return TypePlan(
+            data_type=data_type,
+            category=category,
+            measurement_name=config.measurement_name,
+            parser_method=get_parser_method(data_type),
+            validation_enabled=self.is_validation_enabled(category),
+            validation_rules=self.get_validation_rules(category),
+            field_name=TYPE_FIELD_NAMES.get(data_type, 'value'),
+            tags=expand_device_tags(config.tags)
+        )
 
     def _parse_config(self, config_data: Dict) -> None:
         """Parse loaded configuration data."""
@@ -91,7 +190,7 @@ class ConfigManager:
                 types=['HKQuantityTypeIdentifierHeartRate'],
                 measurement_name='heartrate_bpm',
                 fields={'heart_rate': 'value'},
-                tags=['device', 'source', 'motion_context'],
+                tags=['device_name', 'device_model', 'hardware', 'source', 'motion_context'],
                 validation={'enabled': True, 'rules': {}}
             ),
             'activity': MeasurementConfig(
@@ -114,7 +213,7 @@ class ConfigManager:
                     'exercise_time': 'exercise_minutes',
                     'stand_hours': 'stand_hours'
                 },
-                tags=['activity_type', 'energy_type', 'summary_type', 'device', 'source'],
+                tags=['activity_type', 'energy_type', 'summary_type', 'device_name', 'device_model', 'hardware', 'source'],
                 validation={'enabled': True, 'rules': {}}
             ),
             'sleep': MeasurementConfig(
@@ -122,7 +221,7 @@ class ConfigManager:
                 types=['HKCategoryTypeIdentifierSleepAnalysis'],
                 measurement_name='sleep_duration_min',
                 fields={'duration': 'value', 'quality': 'quality'},
-                tags=['state', 'device', 'source'],
+                tags=['state', 'device_name', 'device_model', 'hardware', 'source'],
                 validation={'enabled': True, 'rules': {}}
             )
         }
@@ -148,12 +247,14 @@ class ConfigManager:
         """Get global configuration."""
         return self.global_config
 
+    def get_type_plan(self, data_type: str) -> Optional[TypePlan]:
+        """Get the precompiled processing plan for a data type."""
+        return self.type_plans.get(data_type)
+
     def find_measurement_category(self, data_type: str) -> Optional[str]:
         """Find which measurement category a data type belongs to."""
-        for category, config in self.measurements_config.items():
-            if data_type in config.types:
-                return category
-        return None
+        plan = self.type_plans.get(data_type)
+        return plan.category if plan else None
 
     def is_validation_enabled(self, category: str) -> bool:
         """Check if validation is enabled for a measurement category."""
@@ -185,6 +286,22 @@ class ConfigManager:
         """Get retry delay base for exponential backoff."""
         return self.global_config.performance.get('retry_delay_base', 2)
 
+    def get_write_workers(self) -> int:
+        """Get the number of concurrent InfluxDB writer threads in streaming mode."""
+        return self.global_config.performance.get('write_workers', 4)
+
+    def get_write_timeout(self) -> float:
+        """Get the InfluxDB HTTP request timeout in seconds."""
+        return self.global_config.performance.get('timeout_seconds', 30)
+
+    def is_write_compression_enabled(self) -> bool:
+        """Check if InfluxDB write requests are gzip-compressed."""
+        return self.global_config.performance.get('compression', True)
+
+    def get_compression_level(self) -> int:
+        """Get the gzip level for compressed write requests."""
+        return self.global_config.performance.get('compression_level', 5)
+
     def is_strict_validation(self) -> bool:
         """Check if strict validation mode is enabled."""
         return self.global_config.validation.get('strict_mode', False)
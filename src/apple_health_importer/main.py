@@ -5,7 +5,7 @@ import logging
 import sys
 import yaml
 import xml.etree.ElementTree as ET
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 from tqdm import tqdm
 from pathlib import Path
@@ -19,6 +19,10 @@ try:
     from .tracking.tracker import ImportTracker
     from .config.manager import ConfigManager
     from .parsers.streaming import StreamingHealthDataProcessor
+    from .parsers.source import is_compressed_export, open_export_stream
+    from .parsers.filters import ElementFilter, parse_time_bound
+    from .parsers.export_index import ExportIndex
+    from .parsers.batch import format_local_time
 except ImportError:
     # For direct execution
     import sys
@@ -32,6 +36,10 @@ except ImportError:
     from tracking.tracker import ImportTracker
     from config.manager import ConfigManager
     from parsers.streaming import StreamingHealthDataProcessor
+    from parsers.source import is_compressed_export, open_export_stream
+    from parsers.filters import ElementFilter, parse_time_bound
+    from parsers.export_index import ExportIndex
+    from parsers.batch import format_local_time
 
 def load_config(config_path: str) -> Dict:
     """Load configuration from YAML file."""
@@ -68,7 +76,18 @@ def setup_logging():
         format='%(asctime)s - %(levelname)s - %(message)s'
     )
 
-def collect_data_points(root: ET.Element, parser: HealthDataParser, validator: HealthDataValidator) -> Dict[str, List[Dict]]:
+def log_series_cardinality(influxdb: InfluxDBWriter) -> None:
+    """Log the number of series written per measurement, largest first."""
+    cardinality = influxdb.serializer.series_cardinality()
+    if not cardinality:
+        return
+    logging.info(f"  Series cardinality by measurement:")
+    for measurement, count in sorted(cardinality.items(), key=lambda item: (-item[1], item[0])):
+        logging.info(f"    - {measurement}: {count:,}")
+    logging.info(f"    - Total: {sum(cardinality.values()):,}")
+
+def collect_data_points(root: ET.Element, parser: HealthDataParser, validator: HealthDataValidator,
+                        element_filter: Optional[ElementFilter] = None) -> Dict[str, List[Dict]]:
     """Collect all data points from XML without writing to database."""
     data_points = {
         'vitals': [],
@@ -87,6 +106,10 @@ def collect_data_points(root: ET.Element, parser: HealthDataParser, validator: H
         for record in root.findall('.//Record'):
             data = None
             record_type = record.get('type', '')
+            
+            if element_filter and not element_filter.accepts(record):
+                pbar.update(1)
+                continue
 
             try:
                 if 'HeartRate' in record_type:
@@ -153,6 +176,9 @@ def collect_data_points(root: ET.Element, parser: HealthDataParser, validator: H
 
         # Process workouts
         for workout in root.findall('.//Workout'):
+            if element_filter and not element_filter.accepts(workout):
+                pbar.update(1)
+                continue
             try:
                 data = parser.parse_workout(workout)
                 if data:
@@ -178,6 +204,9 @@ def collect_data_points(root: ET.Element, parser: HealthDataParser, validator: H
 
         # Process activity summaries (no special validation needed)
         for activity in root.findall('.//ActivitySummary'):
+            if element_filter and not element_filter.accepts(activity):
+                pbar.update(1)
+                continue
             try:
                 data = parser.parse_activity(activity)
                 if data:
@@ -192,7 +221,7 @@ def collect_data_points(root: ET.Element, parser: HealthDataParser, validator: H
 
 def main():
     parser = argparse.ArgumentParser(description='Import Apple Health data to InfluxDB')
-    parser.add_argument('export_file', help='Path to the Apple Health export file')
+    parser.add_argument('export_file', help='Path to the Apple Health export (export.xml, export.zip or .xml.gz)')
     parser.add_argument('--config', default='config.yaml', help='Path to config file')
     parser.add_argument('--incremental', action='store_true', 
                        help='Only import data newer than last import')
@@ -208,7 +237,39 @@ def main():
                        help='Use streaming mode for large files (>100MB)')
     parser.add_argument('--resume', action='store_true',
                        help='Resume interrupted import from checkpoint')
+    parser.add_argument('--engine', choices=['auto', 'lxml', 'stdlib', 'expat'], default='auto',
+                       help='XML engine for streaming mode (auto prefers lxml when installed; '
+                            'expat builds only the elements that are imported)')
+    parser.add_argument('--jobs', type=int, default=1,
+                       help='Worker processes for parsing in streaming mode (splits the export into byte ranges)')
+    parser.add_argument('--write-workers', type=int, default=None,
+                       help='Concurrent InfluxDB write threads in streaming mode (default: performance.write_workers, 4)')
+    parser.add_argument('--dedupe-index', default='dedupe_index.sqlite',
+                       help='Local index of written points used for duplicate detection')
+    parser.add_argument('--no-dedupe-index', action='store_true',
+                       help='Query InfluxDB for duplicates instead of using the local index')
+    parser.add_argument('--rebuild-dedupe-index', action='store_true',
+                       help='Rebuild the local dedupe index from InfluxDB before importing '
+                            '(done automatically when the index is new or was built for another database)')
+    parser.add_argument('--upsert', action='store_true',
+                       help='Skip duplicate checks and let InfluxDB overwrite points that already exist')
+    parser.add_argument('--types',
+                       help='Comma-separated data types to import, e.g. HKQuantityTypeIdentifierHeartRate')
+    parser.add_argument('--exclude-types',
+                       help='Comma-separated data types to skip')
+    parser.add_argument('--since',
+                       help='Only import data from this date or ISO time on (local timezone unless given)')
+    parser.add_argument('--until',
+                       help='Only import data before this date or ISO time (local timezone unless given)')
+    parser.add_argument('--changed-days', action='store_true',
+                       help='Streaming mode: only write the days of each data type whose content changed since the last import')
+    parser.add_argument('--count-elements', action='store_true',
+                       help='Count elements in a separate pass before a streaming import (reads the file twice)')
+    parser.add_argument('--build-index', action='store_true',
+                       help='Index an uncompressed export.xml so filtered imports only read the parts they need, then exit')
     args = parser.parse_args()
+    if args.changed_days and args.incremental:
+        parser.error("--changed-days and --incremental cannot be combined")
 
     setup_logging()
     
@@ -224,6 +285,15 @@ def main():
         tracker.reset_history()
         return
     
+    if args.build_index:
+        if is_compressed_export(args.export_file):
+            logging.error("Only uncompressed export.xml files can be indexed")
+            sys.exit(1)
+        index = ExportIndex.build(args.export_file, tracker.get_file_hash(args.export_file))
+        index.save(args.export_file)
+        logging.info(f"Indexed {sum(index.element_counts.values())} elements in {len(index.blocks)} blocks")
+        return
+    
     config = load_config(args.config)
 
     try:
@@ -247,18 +317,51 @@ def main():
             username=config['influxdb']['username'],
             password=config['influxdb']['password'],
             database=config['influxdb']['database'],
-            config_manager=config_manager
+            config_manager=config_manager,
+            write_workers=args.write_workers,
+            dedupe_index_file=None if args.no_dedupe_index else args.dedupe_index,
+            upsert=args.upsert
         )
         
+        # A new index, or one emptied for another database, is built before it replaces queries
+        series_index = influxdb.series_index
+        if series_index is not None and (args.rebuild_dedupe_index or (not series_index.complete and not args.upsert)):
+            if args.rebuild_dedupe_index:
+                logging.info("Rebuilding dedupe index from InfluxDB...")
+            else:
+                logging.info(f"Dedupe index {series_index.index_file} has not been built for this database; "
+                            f"building it from InfluxDB...")
+            measurement_names = [config.measurement_name for config in config_manager.get_all_measurement_configs().values()]
+            indexed = series_index.rebuild(influxdb, measurement_names)
+            logging.info(f"Dedupe index holds {indexed} points")
+        
         health_parser = HealthDataParser(config['processing']['timezone'])
         validator = HealthDataValidator(config_manager)
+        
+        # Type and time filters, applied to raw elements before parsing
+        try:
+            element_filter = ElementFilter(
+                types=[t.strip() for t in args.types.split(',') if t.strip()] if args.types else None,
+                exclude_types=[t.strip() for t in args.exclude_types.split(',') if t.strip()] if args.exclude_types else None,
+                since=parse_time_bound(args.since, health_parser.timezone) if args.since else None,
+                until=parse_time_bound(args.until, health_parser.timezone) if args.until else None,
+                tz=health_parser.timezone
+            )
+        except ValueError as e:
+            logging.error(f"Invalid --since/--until value: {e}")
+            sys.exit(1)
+        if element_filter:
+            logging.info(f"Filtering elements: types={args.types or 'all'}, excluded={args.exclude_types or 'none'}, "
+                        f"since={args.since or '-'}, until={args.until or '-'}")
 
         # Determine if we should use streaming mode
         file_size_mb = Path(args.export_file).stat().st_size / (1024 * 1024)
-        use_streaming = args.streaming or file_size_mb > 100  # Auto-enable for files >100MB
+        compressed = is_compressed_export(args.export_file)
+        # Auto-enable for files >100MB; archives expand to many times their size
+        use_streaming = args.streaming or file_size_mb > 100 or compressed
         
         if use_streaming:
-            logging.info(f"Using streaming mode for large file ({file_size_mb:.1f} MB)")
+            logging.info(f"Using streaming mode for {'compressed' if compressed else 'large'} file ({file_size_mb:.1f} MB)")
             
             # Initialize streaming processor
             streaming_processor = StreamingHealthDataProcessor(
@@ -268,16 +371,31 @@ def main():
                 tracker=tracker,
                 config_manager=config_manager,
                 process_batch_size=config_manager.get_batch_size(),
-                checkpoint_interval=10000
+                checkpoint_interval=10000,
+                engine=args.engine,
+                write_workers=args.write_workers,
+                element_filter=element_filter or None
             )
+            logging.info(f"XML engine: {streaming_processor.engine}")
             
             # Process file in streaming mode
-            processing_stats = streaming_processor.process_file_streaming(
-                file_path=args.export_file,
-                incremental=args.incremental,
-                preview=args.preview,
-                force=args.force
-            )
+            if args.jobs > 1 and not args.preview:
+                processing_stats = streaming_processor.process_file_parallel(
+                    file_path=args.export_file,
+                    jobs=args.jobs,
+                    incremental=args.incremental,
+                    force=args.force,
+                    changed_days=args.changed_days
+                )
+            else:
+                processing_stats = streaming_processor.process_file_streaming(
+                    file_path=args.export_file,
+                    incremental=args.incremental,
+                    preview=args.preview,
+                    force=args.force,
+                    count_elements=args.count_elements,
+                    changed_days=args.changed_days
+                )
             
             # Get validation statistics
             validation_stats = validator.get_validation_summary()
@@ -293,6 +411,9 @@ def main():
                 logging.info(f"    - {category.title()} processed: {count} (→ {config.measurement_name})")
             
             logging.info(f"    - Unknown types: {processing_stats.get('unknown_types', 0)}")
+            logging.info(f"    - Filtered before parsing: {processing_stats.get('filtered', 0)}")
+            if args.changed_days:
+                logging.info(f"    - Unchanged days skipped: {processing_stats.get('unchanged', 0)} points")
             logging.info(f"    - Parse errors: {processing_stats['errors']}")
             logging.info(f"  Validation statistics:")
             logging.info(f"    - Total validated: {validation_stats['total_validated']}")
@@ -300,8 +421,24 @@ def main():
             logging.info(f"    - Validation warnings: {validation_stats['warnings']}")
             logging.info(f"  Write statistics:")
             logging.info(f"    - Successfully written: {processing_stats['written']}")
-            logging.info(f"    - Duplicates skipped: {processing_stats['duplicates']}")
+            if influxdb.upsert:
+                logging.info(f"    - Upserted (no duplicate check): {processing_stats.get('upserted', 0)}")
+            else:
+                logging.info(f"    - Duplicates skipped: {processing_stats['duplicates']}")
             logging.info(f"    - Write errors: {processing_stats.get('write_errors', 0)}")
+            logging.info(f"    - Bytes on the wire: {processing_stats.get('wire_bytes', 0):,} "
+                        f"({processing_stats.get('line_bytes', 0):,} uncompressed)")
+            if processing_stats.get('parse_seconds'):
+                logging.info(f"  Read statistics:")
+                logging.info(f"    - Parsing (CPU): {processing_stats['parse_seconds']:.1f}s")
+                logging.info(f"    - Waiting for I/O: {processing_stats.get('io_wait_seconds', 0):.1f}s")
+            if processing_stats.get('string_tables', 0) > 1:
+                # Ranges parsed by worker processes intern their tag values separately
+                logging.info(f"    - Tag values interned: {processing_stats['tag_values']:,} "
+                            f"in {processing_stats['string_tables']} per-range string tables")
+            elif processing_stats.get('tag_values'):
+                logging.info(f"    - Distinct tag values interned: {processing_stats['tag_values']:,}")
+            log_series_cardinality(influxdb)
             logging.info(f"  Summary:")
             logging.info(f"    - Total records processed: {total_processed}")
             logging.info(f"    - Coverage: {len(config_manager.get_all_measurement_configs())} measurement categories configured")
@@ -318,11 +455,12 @@ def main():
 
         # Parse the export file
         logging.info(f"Loading XML file: {args.export_file}")
-        tree = ET.parse(args.export_file)
+        with open_export_stream(args.export_file) as export_stream:
+            tree = ET.parse(export_stream)
         root = tree.getroot()
         
         # Collect all data points first
-        data_points = collect_data_points(root, health_parser, validator)
+        data_points = collect_data_points(root, health_parser, validator, element_filter or None)
         
         # Filter for incremental import if requested
         if args.incremental:
@@ -356,7 +494,7 @@ def main():
             for category, points in data_points.items():
                 if category != 'errors' and points:
                     sample = points[0]
-                    logging.info(f"  {category.title()} sample: {sample.get('type', 'Unknown')} at {sample.get('time', 'Unknown time')}")
+                    logging.info(f"  {category.title()} sample: {sample.get('type', 'Unknown')} at {format_local_time(sample['time'], sample.get('utc_offset', 0))}")
             return
         
         # Write data points to InfluxDB using batch processing
@@ -384,8 +522,13 @@ def main():
         logging.info(f"    - Validation warnings: {validation_stats['warnings']}")
         logging.info(f"  Write statistics:")
         logging.info(f"    - Successfully written: {write_stats['written']}")
-        logging.info(f"    - Duplicates skipped: {write_stats['duplicates']}")
+        if influxdb.upsert:
+            logging.info(f"    - Upserted (no duplicate check): {write_stats['upserted']}")
+        else:
+            logging.info(f"    - Duplicates skipped: {write_stats['duplicates']}")
         logging.info(f"    - Write errors: {write_stats['errors']}")
+        logging.info(f"    - Bytes on the wire: {write_stats['wire_bytes']:,} ({write_stats['line_bytes']:,} uncompressed)")
+        log_series_cardinality(influxdb)
         
         if write_stats['errors'] > 0:
             logging.warning(f"Some records failed to write. Check InfluxDB connection and permissions.")
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+from array import array
+from itertools import compress
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+NANOSECONDS_PER_SECOND = 10 ** 9
+
+
+def to_epoch_ns(dt: datetime) -> int:
+    """Convert a timezone-aware datetime to integer nanoseconds since the epoch."""
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * NANOSECONDS_PER_SECOND + delta.microseconds * 1000
+
+
+# Tag a measurement can list to keep the UTC offset each point was recorded in
+UTC_OFFSET_TAG = 'utc_offset'
+
+
+def format_local_time(time_ns: int, utc_offset: int) -> str:
+    """Render an epoch-ns time as an ISO string in the given UTC offset (seconds)."""
+    seconds, nanos = divmod(time_ns, NANOSECONDS_PER_SECOND)
+    tz = timezone(timedelta(seconds=utc_offset))
+    return datetime.fromtimestamp(seconds, tz).replace(microsecond=nanos // 1000).isoformat()
+
+
+def format_utc_offset(utc_offset: int) -> str:
+    """Render a UTC offset in seconds the way Apple writes it, e.g. "+0200"."""
+    sign = '-' if utc_offset < 0 else '+'
+    hours, minutes = divmod(abs(utc_offset) // 60, 60)
+    return f"{sign}{hours:02d}{minutes:02d}"
+
+
+class StringTable:
+    """Interns tag values as small integer ids.
+
+    Id 0 is the empty string; None and blank values map to it, matching how
+    empty tags are dropped when points are written.
+    """
+
+    def __init__(self):
+        self._ids: Dict[Any, int] = {'': 0}
+        self.strings: List[str] = ['']
+
+    def intern(self, value: Any) -> int:
+        """Return the id of a tag value, adding it to the table if needed."""
+        string_id = self._ids.get(value)
+        if string_id is None:
+            text = str(value).strip() if value is not None else ''
+            string_id = self._ids.get(text)
+            if string_id is None:
+                string_id = len(self.strings)
+                self.strings.append(text)
+                self._ids[text] = string_id
+            self._ids[value] = string_id
+        return string_id
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.strings[string_id]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class SeriesColumns:
+    """Parallel arrays for the points of one measurement, data type and field set."""
+
+    __slots__ = ('measurement', 'data_type', 'times', 'offsets', 'fields', 'tags', 'strings')
+
+    def __init__(self, measurement: str, data_type: str, field_names: Tuple[str, ...],
+                 strings: StringTable):
+        self.measurement = measurement
+        self.data_type = data_type
+        self.strings = strings
+        self.times = array('q')  # Epoch nanoseconds
+        self.offsets = array('i')  # UTC offset the point was recorded in, in seconds
+        self.fields: Dict[str, array] = {name: None for name in field_names}
+        self.tags: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def append(self, time_ns: int, utc_offset: int, fields: Dict[str, Any], tags: Dict[str, Any]) -> None:
+        """Append one point."""
+        row = len(self.times)
+        self.times.append(time_ns)
+        self.offsets.append(utc_offset)
+
+        intern = self.strings.intern
+        for name, value in fields.items():
+            column = self.fields[name]
+            if isinstance(value, str):
+                # String fields are interned like tags ('I' columns hold string ids)
+                if column is None:
+                    column = self.fields[name] = array('I')
+                value = intern(value)
+            elif column is None:
+                column = self.fields[name] = array('q' if isinstance(value, int) else 'd')
+            elif column.typecode == 'q' and not isinstance(value, int):
+                column = self.fields[name] = array('d', column)
+            column.append(value)
+
+        columns = self.tags
+        for name, value in tags.items():
+            column = columns.get(name)
+            if column is None:
+                # Tag first seen in this row: earlier rows did not have it
+                column = columns[name] = array('I', [0]) * row
+            column.append(intern(value))
+
+        # Tags this row did not set
+        for name, column in columns.items():
+            if len(column) == row:
+                column.append(0)
+
+    def field_value(self, name: str, row: int) -> Any:
+        """Return a field value with the Python type it was appended with."""
+        column = self.fields[name]
+        return self.strings[column[row]] if column.typecode == 'I' else column[row]
+
+    def tag_value(self, name: str, row: int) -> str:
+        """Return a tag value ('' when unset)."""
+        column = self.tags.get(name)
+        return self.strings[column[row]] if column is not None else ''
+
+    def select(self, rows: List[int]) -> 'SeriesColumns':
+        """Return a copy holding only the given rows, in order."""
+        selected = SeriesColumns(self.measurement, self.data_type, tuple(self.fields), self.strings)
+        selected.times = array('q', (self.times[i] for i in rows))
+        selected.offsets = array('i', (self.offsets[i] for i in rows))
+        for name, column in self.fields.items():
+            selected.fields[name] = array(column.typecode, (column[i] for i in rows))
+        for name, column in self.tags.items():
+            selected.tags[name] = array('I', (column[i] for i in rows))
+        return selected
+
+
+class ColumnarBatch:
+    """A batch of data points stored as columns per series.
+
+    Points are appended from the dicts produced by ``HealthDataParser`` and
+    kept as arrays: epoch-ns times, UTC offsets, one typed array per field
+    (string fields as interned ids) and one interned tag-id array per tag.
+    The dicts can be discarded as soon as they are appended, so a batch costs
+    a few arrays per series instead of three dicts per point.
+
+    Batches of one run can share a ``StringTable``: each distinct source,
+    device, unit or software version string is then stored once for the whole run, and tag
+    values are only turned back into strings when lines are serialized.
+    """
+
+    def __init__(self, strings: Optional[StringTable] = None):
+        self.strings = strings if strings is not None else StringTable()
+        self.series: Dict[Tuple[str, str, Tuple[str, ...]], SeriesColumns] = {}
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def append(self, data_point: Dict[str, Any]) -> None:
+        """Append a parsed data point."""
+        time_ns = data_point['time']
+        if isinstance(time_ns, int):
+            utc_offset = data_point.get('utc_offset', 0)
+        else:
+            # ISO string or datetime from callers that build points themselves
+            dt = datetime.fromisoformat(time_ns.replace('Z', '+00:00')) if isinstance(time_ns, str) else time_ns
+            time_ns, utc_offset = to_epoch_ns(dt), int(dt.utcoffset().total_seconds())
+
+        fields = data_point.get('fields', {})
+        key = (data_point.get('measurement', ''), data_point.get('type', ''), tuple(fields))
+        columns = self.series.get(key)
+        if columns is None:
+            columns = self.series[key] = SeriesColumns(key[0], key[1], key[2], self.strings)
+
+        columns.append(time_ns, utc_offset, fields, data_point.get('tags', {}))
+        self._length += 1
+
+    def extend(self, data_points: List[Dict[str, Any]]) -> None:
+        """Append several parsed data points."""
+        for data_point in data_points:
+            self.append(data_point)
+
+    def measurements(self) -> List[str]:
+        """Measurement names in the batch, in order of first appearance."""
+        return list(dict.fromkeys(columns.measurement for columns in self.series.values()))
+
+    def series_for(self, measurement: str) -> List[SeriesColumns]:
+        """Column groups belonging to one measurement."""
+        return [columns for columns in self.series.values() if columns.measurement == measurement]
+
+    def filter_series(self, keep) -> 'ColumnarBatch':
+        """Return a batch with the rows for which ``keep(columns, row)`` is true."""
+        filtered = ColumnarBatch(self.strings)
+        for key, columns in self.series.items():
+            rows = [row for row in range(len(columns)) if keep(columns, row)]
+            if len(rows) == len(columns):
+                filtered.series[key] = columns
+            elif rows:
+                filtered.series[key] = columns.select(rows)
+            filtered._length += len(rows)
+        return filtered
+
+    def filter_after(self, cutoff) -> 'ColumnarBatch':
+        """Return a batch with the rows newer than ``cutoff(columns)`` (epoch ns).
+
+        Series whose cutoff is None are kept whole.
+        """
+        filtered = ColumnarBatch(self.strings)
+        for key, columns in self.series.items():
+            after = cutoff(columns)
+            if after is None or min(columns.times) > after:
+                filtered.series[key] = columns
+                filtered._length += len(columns)
+                continue
+            rows = [row for row, time_ns in enumerate(columns.times) if time_ns > after]
+            if rows:
+                filtered.series[key] = columns.select(rows)
+                filtered._length += len(rows)
+        return filtered
+
+    def time_ranges(self) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        """Earliest and latest epoch-ns time per (measurement, data type) in the batch."""
+        ranges: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for columns in self.series.values():
+            if not columns.times:
+                continue
+            key = (columns.measurement, columns.data_type)
+            first, last = min(columns.times), max(columns.times)
+            if key in ranges:
+                first, last = min(first, ranges[key][0]), max(last, ranges[key][1])
+            ranges[key] = (first, last)
+        return ranges
+
+    def apply_masks(self, masks: Dict[Tuple[str, str, Tuple[str, ...]], Sequence[bool]]) -> 'ColumnarBatch':
+        """Return a batch keeping only the rows set in ``masks``; series without a mask are kept whole."""
+        filtered = ColumnarBatch(self.strings)
+        for key, columns in self.series.items():
+            mask = masks.get(key)
+            if mask is None:
+                filtered.series[key] = columns
+                filtered._length += len(columns)
+                continue
+            rows = list(compress(range(len(columns)), mask))
+            if rows:
+                filtered.series[key] = columns.select(rows)
+                filtered._length += len(rows)
+        return filtered
+
+    def iter_points(self) -> Iterator[Dict[str, Any]]:
+        """Yield each point as a parser-style dict (for callers that need dicts)."""
+        for columns in self.series.values():
+            for row in range(len(columns)):
+                yield {
+                    'measurement': columns.measurement,
+                    'type': columns.data_type,
+                    'time': columns.times[row],
+                    'utc_offset': columns.offsets[row],
+                    'fields': {name: columns.field_value(name, row) for name in columns.fields},
+                    'tags': {name: self.strings[column[row]] for name, column in columns.tags.items()}
+                }
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+from datetime import date, timedelta
+from hashlib import blake2b
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .batch import NANOSECONDS_PER_SECOND, ColumnarBatch
+
+
+DIGEST_MASK = (1 << 64) - 1
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def point_digest(data_point: Dict[str, Any]) -> int:
+    """64-bit content hash of a parsed data point (time, fields and tags)."""
+    content = repr((
+        data_point['time'],
+        sorted(data_point.get('fields', {}).items()),
+        sorted(data_point.get('tags', {}).items())
+    ))
+    return int.from_bytes(blake2b(content.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class DayBuckets:
+    """Holds back points per (data type, local day) until the day can be compared with the last import.
+
+    A bucket's digest is its point count and the sum of its point hashes, so
+    it does not depend on the order of the points. ``previous`` is the
+    manifest of the last import: ``{data type: {day: digest}}``.
+
+    A point's day is its local day in the UTC offset it was recorded in.
+    Exports are grouped by type and roughly time-ordered, so a bucket closes
+    as soon as a point of another type arrives, or one of the same type two
+    days later (times recorded in another UTC offset while travelling can
+    step back into the previous local day). On closing, its
+    points are dropped if the digest matches ``previous`` (they were imported
+    before) and released for writing otherwise. Points arriving for a bucket
+    that has already closed are released straight away, so a point is only
+    dropped together with exactly the set of points the last import had.
+
+    Types can interleave, and correlations repeat their records after the
+    top-level ones, so a bucket may close before all of its points arrived.
+    A closed bucket with fewer points than in ``previous`` keeps waiting and
+    is only compared once it has as many, or at the end of the export. Past
+    ``max_waiting`` held points the earliest waiting bucket is released.
+    """
+
+    MAX_WAITING_POINTS = 200_000
+
+    def __init__(self, previous: Dict[str, Dict[str, str]], max_waiting: int = MAX_WAITING_POINTS):
+        self.previous = previous
+        self.max_waiting = max_waiting
+        self.unchanged = 0  # Points dropped as already imported
+
+        self._sums: Dict[Tuple[str, str], List[int]] = {}  # Bucket -> [count, hash sum]
+        self._open: Dict[Tuple[str, str], Tuple[List[Dict[str, Any]], Any]] = {}  # Bucket -> (points, position)
+        self._closed: Set[Tuple[str, str]] = set()
+        self._waiting: Dict[Tuple[str, str], int] = {}  # Closed bucket short of points -> count in previous
+        self._waiting_points = 0
+        self._close_before = ('', '')  # (day, the day before it)
+        self._days: Dict[int, str] = {}  # Days since the epoch -> "YYYY-MM-DD"
+
+    def add(self, data_point: Dict[str, Any], position: Callable[[], Any]) -> List[Dict[str, Any]]:
+        """Add a point; returns the points released for writing, in order.
+
+        ``position`` is called when the point opens a bucket and should return
+        the resume position before the point's element; see ``held_position``.
+        """
+        day = self._day((data_point['time'] // NANOSECONDS_PER_SECOND + data_point.get('utc_offset', 0)) // 86400)
+        key = (data_point.get('type', ''), day)
+
+        sums = self._sums.get(key)
+        if sums is None:
+            sums = self._sums[key] = [0, 0]
+        sums[0] += 1
+        sums[1] = (sums[1] + point_digest(data_point)) & DIGEST_MASK
+
+        if self._close_before[0] != day:
+            self._close_before = (day, (date.fromisoformat(day) - timedelta(days=1)).isoformat())
+        close_before = self._close_before[1]
+
+        released = []
+        for open_key in list(self._open):
+            if open_key not in self._waiting and (open_key[0] != key[0] or open_key[1] < close_before):
+                released.extend(self._close(open_key))
+
+        if key in self._closed:
+            released.append(data_point)
+        elif key in self._waiting:
+            self._open[key][0].append(data_point)
+            self._waiting_points += 1
+            if sums[0] >= self._waiting[key]:
+                released.extend(self._settle(key))
+            elif self._waiting_points > self.max_waiting:
+                released.extend(self._settle(next(k for k in self._open if k in self._waiting)))
+        elif key in self._open:
+            self._open[key][0].append(data_point)
+        else:
+            self._open[key] = ([data_point], position())
+        return released
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Close every open bucket; returns the released points."""
+        released = []
+        for key in list(self._open):
+            released.extend(self._settle(key))
+        return released
+
+    def held_position(self) -> Optional[Any]:
+        """Resume position before the earliest held point, or None when nothing is held."""
+        for _, position in self._open.values():
+            return position
+        return None
+
+    def manifest(self, exclude: Set[Tuple[str, str]] = frozenset()) -> Dict[str, Dict[str, str]]:
+        """Digests of every bucket seen but ``exclude``, as ``{data type: {day: digest}}``."""
+        manifest: Dict[str, Dict[str, str]] = {}
+        for (data_type, day), (count, digest) in self._sums.items():
+            if (data_type, day) not in exclude:
+                manifest.setdefault(data_type, {})[day] = f"{count}:{digest:016x}"
+        return manifest
+
+    def buckets_of(self, batch: ColumnarBatch) -> Set[Tuple[str, str]]:
+        """The (data type, day) buckets of the points in a batch."""
+        buckets = set()
+        for columns in batch.series.values():
+            local_days = {(time_ns // NANOSECONDS_PER_SECOND + offset) // 86400
+                          for time_ns, offset in zip(columns.times, columns.offsets)}
+            buckets.update((columns.data_type, self._day(days)) for days in local_days)
+        return buckets
+
+    def _day(self, local_days: int) -> str:
+        """"YYYY-MM-DD" of a number of days since the epoch."""
+        day = self._days.get(local_days)
+        if day is None:
+            day = self._days[local_days] = date.fromordinal(_EPOCH_ORDINAL + local_days).isoformat()
+        return day
+
+    def _close(self, key: Tuple[str, str]) -> List[Dict[str, Any]]:
+        """Close a bucket; one with fewer points than the last import's waits for the rest."""
+        digest = self.previous.get(key[0], {}).get(key[1])
+        if digest is not None:
+            expected = int(digest.split(':', 1)[0])
+            if self._sums[key][0] < expected:
+                self._waiting[key] = expected
+                self._waiting_points += len(self._open[key][0])
+                return []
+        return self._settle(key)
+
+    def _settle(self, key: Tuple[str, str]) -> List[Dict[str, Any]]:
+        """Drop a bucket's points if its digest matches the last import's, else release them."""
+        points, _ = self._open.pop(key)
+        self._closed.add(key)
+        if self._waiting.pop(key, None) is not None:
+            self._waiting_points -= len(points)
+
+        count, digest = self._sums[key]
+        if self.previous.get(key[0], {}).get(key[1]) == f"{count}:{digest:016x}":
+            self.unchanged += len(points)
+            return []
+        return points
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from lxml import etree as LET
+    LXML_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on installed packages
+    LET = None
+    LXML_AVAILABLE = False
+
+
+# Top-level elements the importer turns into data points
+HEALTH_ELEMENT_TAGS = ('Record', 'Workout', 'ActivitySummary')
+
+PARSER_ENGINES = ('auto', 'lxml', 'stdlib', 'expat')
+
+# Bytes fed to the expat parser per call
+EXPAT_CHUNK_BYTES = 1024 * 1024
+
+
+class ExportElement(dict):
+    """Lightweight element built by the expat engine: the attribute dict itself.
+
+    Supports the part of the ElementTree API the importer uses: ``tag``,
+    ``get`` and ``attrib``, iteration over the children, and ``find``,
+    ``findall`` and ``iter`` by child tag (not by path). Attribute lookups are
+    plain dict lookups.
+    """
+
+    __slots__ = ('tag', 'children')
+
+    def __init__(self, tag: str, attrib: Dict[str, str]):
+        super().__init__(attrib)
+        self.tag = tag
+        self.children: List['ExportElement'] = []
+
+    @property
+    def attrib(self) -> Dict[str, str]:
+        return self
+
+    def __iter__(self) -> Iterator['ExportElement']:
+        return iter(self.children)
+
+    def clear(self) -> None:
+        super().clear()
+        self.children = []
+
+    def find(self, tag: str) -> Optional['ExportElement']:
+        for child in self.children:
+            if child.tag == tag:
+                return child
+        return None
+
+    def findall(self, tag: str) -> List['ExportElement']:
+        return [child for child in self.children if child.tag == tag]
+
+    def iter(self, tag: Optional[str] = None) -> Iterator['ExportElement']:
+        if tag is None or self.tag == tag:
+            yield self
+        for child in self.children:
+            yield from child.iter(tag)
+
+
+def resolve_engine(engine: str = 'auto') -> str:
+    """Resolve the requested XML engine name to one that is available."""
+    if engine not in PARSER_ENGINES:
+        raise ValueError(f"Unknown XML engine '{engine}', expected one of {', '.join(PARSER_ENGINES)}")
+
+    if engine == 'auto':
+        return 'lxml' if LXML_AVAILABLE else 'stdlib'
+
+    if engine == 'lxml' and not LXML_AVAILABLE:
+        logging.warning("lxml is not installed, falling back to the stdlib XML engine")
+        return 'stdlib'
+
+    return engine
+
+
+def iter_health_elements(source: Any, engine: str = 'auto',
+                         clear_elements: bool = True) -> Iterator[Any]:
+    """Yield Record, Workout and ActivitySummary elements from an Apple Health export.
+
+    ``source`` is a file path or a binary file object. Elements are yielded on
+    their end event, so attributes and children are complete. Once the consumer
+    resumes the generator the element is cleared (unless ``clear_elements`` is
+    False) and every finished sibling is detached from the root, which keeps
+    memory flat no matter how large the export is. The expat engine yields
+    fresh ``ExportElement`` objects instead and keeps no tree at all.
+    """
+    engine = resolve_engine(engine)
+    if engine == 'lxml':
+        return _iter_lxml(source, clear_elements)
+    if engine == 'expat':
+        return _iter_expat(source)
+    return _iter_stdlib(source, clear_elements)
+
+
+def _iter_lxml(source: Any, clear_elements: bool) -> Iterator[Any]:
+    """lxml engine: tag-filtered end events with ancestor pruning."""
+    context = LET.iterparse(
+        source,
+        events=('end',),
+        tag=HEALTH_ELEMENT_TAGS,
+        huge_tree=True,
+        resolve_entities=False,
+        load_dtd=False,
+        no_network=True,
+    )
+
+    for _, elem in context:
+        yield elem
+
+        if clear_elements:
+            elem.clear(keep_tail=True)
+
+        # Detach finished siblings (including untracked ones such as ExportDate,
+        # Me or Correlation) so the root does not accumulate empty shells
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+    del context
+
+
+def _iter_stdlib(source: Any, clear_elements: bool) -> Iterator[Any]:
+    """Stdlib engine: ElementTree iterparse with root pruning."""
+    context = ET.iterparse(source, events=('start', 'end'))
+    root = None
+    depth = 0
+
+    for event, elem in context:
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if elem.tag in HEALTH_ELEMENT_TAGS:
+            yield elem
+
+            if clear_elements:
+                elem.clear()
+
+        # A direct child of the root has finished: drop everything collected so far
+        if depth == 1 and root is not None:
+            del root[:]
+
+    del context
+
+
+def _iter_expat(source: Any) -> Iterator[ExportElement]:
+    """Expat engine: start/end callbacks that build only the elements we import.
+
+    Outside a health element nothing is built. A Record, Workout or
+    ActivitySummary start opens an ``ExportElement`` and every element inside
+    it (MetadataEntry, HeartRateVariabilityMetadataList, WorkoutEvent...)
+    becomes its child, so there is no tree to prune and nothing to clear.
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    health_tags = frozenset(HEALTH_ELEMENT_TAGS)
+    completed: List[ExportElement] = []
+    open_elements: List[ExportElement] = []  # Health element and its open descendants
+
+    def start(tag: str, attrib: Dict[str, str]) -> None:
+        if open_elements:
+            element = ExportElement(tag, attrib)
+            open_elements[-1].children.append(element)
+            open_elements.append(element)
+        elif tag in health_tags:
+            open_elements.append(ExportElement(tag, attrib))
+
+    def end(tag: str) -> None:
+        if open_elements:
+            element = open_elements.pop()
+            if element.tag in health_tags:
+                completed.append(element)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+
+    stream = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    try:
+        while True:
+            data = stream.read(EXPAT_CHUNK_BYTES)
+            try:
+                parser.Parse(data, not data)
+            except xml.parsers.expat.ExpatError as e:
+                # Same exception as the ElementTree engines
+                error = ET.ParseError(str(e))
+                error.code, error.position = e.code, (e.lineno, e.offset)
+                raise error from e
+
+            if completed:
+                elements = completed[:]
+                del completed[:]
+                yield from elements
+            if not data:
+                break
+    finally:
+        if stream is not source:
+            stream.close()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import calendar
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .engines import HEALTH_ELEMENT_TAGS
+from .filters import ELEMENT_DATA_TYPES
+from .source import detect_export_layout
+
+
+INDEX_VERSION = 1
+
+# Blocks are cut at the first top-level element after this many bytes, or when
+# the type of the top-level elements changes
+INDEX_BLOCK_BYTES = 1024 * 1024
+
+SCAN_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Start tag of any Record/Workout/ActivitySummary with its attributes, and its
+# indentation when it begins a line
+_START_TAG = re.compile(rb'(?:\n([ \t]*))?<(Record|Workout|ActivitySummary)[\s/>]([^>]*)')
+_TYPE_ATTR = re.compile(rb'(?:^|\s)type="([^"]*)"')
+_START_DATE_ATTR = re.compile(rb'(?:^|\s)startDate="([^"]*)"')
+_DAY_ATTR = re.compile(rb'(?:^|\s)dateComponents="([^"]*)"')
+
+# A local day spans at most these many seconds around its UTC midnight
+_DAY_SLACK_BEFORE = 14 * 3600
+_DAY_SLACK_AFTER = 38 * 3600
+
+
+def index_path_for(file_path: str) -> Path:
+    """Location of the index of an export: next to it, as ``<name>.index.json``."""
+    path = Path(file_path)
+    return path.with_name(path.name + '.index.json')
+
+
+def _apple_epoch_seconds(date: bytes) -> Optional[int]:
+    """Epoch seconds of an Apple "YYYY-MM-DD HH:MM:SS +HHMM" date, or None."""
+    if len(date) != 25 or date[20:21] not in (b'+', b'-'):
+        return None
+    try:
+        seconds = calendar.timegm((int(date[0:4]), int(date[5:7]), int(date[8:10]),
+                                   int(date[11:13]), int(date[14:16]), int(date[17:19]), 0, 0, 0))
+        offset = int(date[21:23]) * 3600 + int(date[23:25]) * 60
+    except ValueError:
+        return None
+    return seconds - offset if date[20:21] == b'+' else seconds + offset
+
+
+def _day_epoch_range(day: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """Epoch seconds a "YYYY-MM-DD" local day can cover, in any timezone."""
+    try:
+        midnight = calendar.timegm((int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0, 0, 0, 0))
+    except ValueError:
+        return None, None
+    return midnight - _DAY_SLACK_BEFORE, midnight + _DAY_SLACK_AFTER
+
+
+class ExportIndex:
+    """Byte-offset blocks of an export with the data types and time range in each.
+
+    Built by scanning the raw bytes for start tags, without parsing XML. Each
+    block starts at a top-level element boundary, so any run of blocks can be
+    parsed on its own behind a synthetic root (see ``BlockReader``). For each
+    data type in a block it records the element count and the first and last
+    time in epoch seconds (None when a date could not be read).
+
+    The index is stored next to the export and tied to its
+    ``ImportTracker.get_file_hash``; a changed export gets a new index.
+    """
+
+    def __init__(self, file_hash: str, blocks: List[Dict[str, Any]], body: Tuple[int, int]):
+        self.file_hash = file_hash
+        self.blocks = blocks
+        self.body = body
+
+    @property
+    def element_counts(self) -> Dict[str, int]:
+        """Number of elements per tag in the export."""
+        counts = {tag: 0 for tag in HEALTH_ELEMENT_TAGS}
+        for block in self.blocks:
+            for tag, count in block['tags'].items():
+                counts[tag] += count
+        return counts
+
+    @property
+    def total_bytes(self) -> int:
+        """Size of the data section covered by the blocks."""
+        return self.body[1] - self.body[0]
+
+    @classmethod
+    def build(cls, file_path: str, file_hash: str) -> 'ExportIndex':
+        """Scan a plain XML export and index it."""
+        body_start, body_end, top_indent = detect_export_layout(file_path)
+        blocks: List[Dict[str, Any]] = []
+        block = None
+        top_type = None
+
+        with open(file_path, 'rb') as f:
+            f.seek(max(body_start - 1, 0))
+            offset = f.tell()
+            carry = b''
+            while offset - len(carry) < body_end:
+                chunk = f.read(SCAN_CHUNK_BYTES)
+                buf = carry + chunk
+                # Scan up to the last newline unless this is the end of the file
+                cut = buf.rfind(b'\n') if chunk else len(buf)
+                if cut < 0:
+                    carry = buf
+                    offset += len(chunk)
+                    continue
+                base = offset - len(carry)
+
+                for match in _START_TAG.finditer(buf, 0, cut):
+                    indent = match.group(1)
+                    position = base + match.start() + (1 if indent is not None else 0)
+                    if position >= body_end:
+                        break
+                    tag = match.group(2).decode('ascii')
+                    attributes = match.group(3)
+
+                    if tag == 'Record':
+                        type_match = _TYPE_ATTR.search(attributes)
+                        data_type = type_match.group(1).decode('utf-8') if type_match else ''
+                    else:
+                        data_type = ELEMENT_DATA_TYPES[tag]
+
+                    if indent == top_indent:
+                        if (block is None or data_type != top_type
+                                or position - block['start'] >= INDEX_BLOCK_BYTES):
+                            if block is not None:
+                                block['end'] = position
+                                blocks.append(block)
+                            block = {'start': position, 'end': None, 'tags': {}, 'types': {}}
+                            top_type = data_type
+                    if block is None:
+                        continue
+
+                    if tag == 'ActivitySummary':
+                        day_match = _DAY_ATTR.search(attributes)
+                        first, last = _day_epoch_range(day_match.group(1)) if day_match else (None, None)
+                    else:
+                        date_match = _START_DATE_ATTR.search(attributes)
+                        first = last = _apple_epoch_seconds(date_match.group(1)) if date_match else None
+
+                    block['tags'][tag] = block['tags'].get(tag, 0) + 1
+                    stats = block['types'].get(data_type)
+                    if stats is None:
+                        block['types'][data_type] = [1, first, last]
+                    else:
+                        stats[0] += 1
+                        if first is None or stats[1] is None:
+                            stats[1] = stats[2] = None  # Unknown times: the block always qualifies
+                        else:
+                            stats[1] = min(stats[1], first)
+                            stats[2] = max(stats[2], last)
+
+                if not chunk:
+                    break
+                offset += len(chunk)
+                carry = buf[cut:]
+
+        if block is not None:
+            block['end'] = body_end
+            blocks.append(block)
+        return cls(file_hash, blocks, (body_start, body_end))
+
+    @classmethod
+    def load(cls, file_path: str, file_hash: str) -> Optional['ExportIndex']:
+        """Load the stored index of an export, or None if it is missing or stale."""
+        path = index_path_for(file_path)
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            logging.warning(f"Could not load export index {path}: {e}")
+            return None
+        if data.get('version') != INDEX_VERSION or data.get('file_hash') != file_hash:
+            return None
+        return cls(file_hash, data['blocks'], tuple(data['body']))
+
+    def save(self, file_path: str) -> None:
+        """Store the index next to the export."""
+        path = index_path_for(file_path)
+        try:
+            with open(path, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'file_hash': self.file_hash,
+                           'body': list(self.body), 'blocks': self.blocks},
+                          f, separators=(',', ':'))
+        except Exception as e:
+            logging.warning(f"Could not save export index {path}: {e}")
+
+    def select(self, accepts: Callable[[str, Optional[int], Optional[int]], bool],
+               max_range_bytes: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Byte ranges of the blocks holding data ``accepts(type, first, last)`` may want.
+
+        Adjacent blocks are merged into one range, up to ``max_range_bytes``.
+        """
+        ranges: List[Tuple[int, int]] = []
+        for block in self.blocks:
+            if not any(accepts(data_type, first, last)
+                       for data_type, (_, first, last) in block['types'].items()):
+                continue
+            if (ranges and ranges[-1][1] == block['start']
+                    and (max_range_bytes is None or block['end'] - ranges[-1][0] <= max_range_bytes)):
+                ranges[-1] = (ranges[-1][0], block['end'])
+            else:
+                ranges.append((block['start'], block['end']))
+        return ranges
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .batch import NANOSECONDS_PER_SECOND
+
+
+# Data types of the points parsed from Workout and ActivitySummary elements
+ELEMENT_DATA_TYPES = {
+    'Workout': 'HKWorkoutTypeIdentifier',
+    'ActivitySummary': 'HKActivitySummary'
+}
+
+# Layout of Apple's dates: "YYYY-MM-DD HH:MM:SS +HHMM"
+APPLE_DATETIME_LENGTH = 25
+
+
+def parse_time_bound(value: str, tz: Any) -> datetime:
+    """Parse a --since/--until value (ISO date or datetime); naive values are in ``tz``."""
+    dt = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = tz.localize(dt) if hasattr(tz, 'localize') else dt.replace(tzinfo=tz)
+    return dt
+
+
+def _offset_delta(offset: str) -> Optional[timedelta]:
+    """The timedelta of a "+HHMM" offset, or None if it is malformed."""
+    if len(offset) != 5 or offset[0] not in '+-' or not offset[1:].isdigit():
+        return None
+    delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+    return -delta if offset[0] == '-' else delta
+
+
+class ElementFilter:
+    """Rejects export elements by type and time before they are parsed.
+
+    Decisions are made on the raw ``type`` and ``startDate`` attribute
+    strings. Apple dates have a fixed layout, so a date compares correctly
+    with a bound written in the same UTC offset; the bounds are rendered once
+    per offset seen in the export and compared as plain strings.
+
+    ``since`` is inclusive and ``until`` exclusive. ``watermarks`` maps data
+    types to the epoch-ns time of their last import; only newer points are
+    kept. Activity summaries have only a date and are kept when their day
+    overlaps ``[since, until)`` in ``tz``. Elements whose dates do not have
+    Apple's layout are kept and left to the parser.
+    """
+
+    def __init__(self, types: Optional[Iterable[str]] = None, exclude_types: Optional[Iterable[str]] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 watermarks: Optional[Dict[str, int]] = None, tz: Any = timezone.utc):
+        self.types = frozenset(types) if types else None
+        self.exclude_types = frozenset(exclude_types or ())
+        self.since = since
+        self.until = until
+        self.watermarks = dict(watermarks or {})
+        self.tz = tz
+
+        # UTC bounds as naive datetimes; the lower bound is inclusive
+        self._since_utc = since.astimezone(timezone.utc).replace(tzinfo=None) if since else None
+        self._until_utc = until.astimezone(timezone.utc).replace(tzinfo=None) if until else None
+        self._has_time_bounds = bool(since or until or self.watermarks)
+
+        # (data type, offset) -> local (lower, upper) bound strings
+        self._bounds: Dict[Tuple[str, str], Tuple[Optional[str], Optional[str]]] = {}
+        self._day_bounds = self._activity_day_bounds()
+
+    def __bool__(self) -> bool:
+        return bool(self.types is not None or self.exclude_types or self._has_time_bounds)
+
+    def with_watermarks(self, watermarks: Dict[str, int]) -> 'ElementFilter':
+        """Return a copy that also rejects points at or before each type's watermark."""
+        return ElementFilter(self.types, self.exclude_types, self.since, self.until, watermarks, self.tz)
+
+    def accepts(self, element: Any) -> bool:
+        """Whether an element may produce a point that passes the filter."""
+        tag = element.tag
+        data_type = element.get('type', '') if tag == 'Record' else ELEMENT_DATA_TYPES.get(tag, '')
+
+        if self.types is not None and data_type not in self.types:
+            return False
+        if data_type in self.exclude_types:
+            return False
+        if not self._has_time_bounds:
+            return True
+
+        if tag == 'ActivitySummary':
+            return self._accepts_day(element.get('dateComponents', ''))
+
+        date = element.get('startDate', '')
+        if len(date) != APPLE_DATETIME_LENGTH or date[19] != ' ':
+            return True
+
+        bounds = self._bounds.get((data_type, date[20:]))
+        if bounds is None:
+            bounds = self._local_bounds(data_type, date[20:])
+        lower, upper = bounds
+
+        local = date[:19]
+        if lower is not None and local < lower:
+            return False
+        if upper is not None and local >= upper:
+            return False
+        return True
+
+    def may_accept(self, data_type: str, first: Optional[int], last: Optional[int]) -> bool:
+        """Whether points of a type between two epoch-second times may pass the filter.
+
+        Used to pick export blocks; ``None`` times mean the range is unknown.
+        """
+        if self.types is not None and data_type not in self.types:
+            return False
+        if data_type in self.exclude_types:
+            return False
+        if first is None or last is None:
+            return True
+
+        if self.since is not None and last < self.since.timestamp():
+            return False
+        if self.until is not None and first >= self.until.timestamp():
+            return False
+        watermark = self.watermarks.get(data_type)
+        if watermark is not None and last * NANOSECONDS_PER_SECOND <= watermark:
+            return False
+        return True
+
+    def _local_bounds(self, data_type: str, offset: str) -> Tuple[Optional[str], Optional[str]]:
+        """Render the bounds for a data type in a UTC offset, and cache them."""
+        delta = _offset_delta(offset)
+        if delta is None:
+            return None, None
+
+        lower = self._since_utc
+        watermark = self.watermarks.get(data_type)
+        if watermark is not None:
+            # Apple times are whole seconds: newer than the mark means at least a second later
+            after = datetime(1970, 1, 1) + timedelta(seconds=watermark // NANOSECONDS_PER_SECOND + 1)
+            lower = after if lower is None else max(lower, after)
+
+        bounds = (
+            (lower + delta).strftime('%Y-%m-%d %H:%M:%S') if lower is not None else None,
+            (self._until_utc + delta).strftime('%Y-%m-%d %H:%M:%S') if self._until_utc is not None else None
+        )
+        self._bounds[(data_type, offset)] = bounds
+        return bounds
+
+    def _activity_day_bounds(self) -> Tuple[Optional[str], Optional[str]]:
+        """First day and the day after the last day overlapping ``[since, until)`` in ``tz``."""
+        first = self.since.astimezone(self.tz).date().isoformat() if self.since else None
+        end = None
+        if self.until:
+            until = self.until.astimezone(self.tz)
+            end_day = until.date() if until.time() == time(0) else until.date() + timedelta(days=1)
+            end = end_day.isoformat()
+        return first, end
+
+    def _accepts_day(self, day: str) -> bool:
+        """Whether an activity summary day overlaps the time range."""
+        if len(day) != 10:
+            return True
+        first, end = self._day_bounds
+        if first is not None and day < first:
+            return False
+        if end is not None and day >= end:
+            return False
+        return True
@@ -1,19 +1,82 @@
 import xml.etree.ElementTree as ET
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 import pytz
 import logging
-from typing import Dict, List, Optional, Union
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+from .batch import NANOSECONDS_PER_SECOND, to_epoch_ns
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Properties of an HKDevice description that identify the device, and the tags
+# they become. The description also holds an object address and software and
+# firmware versions, which change without the device changing.
+DEVICE_TAGS = {'name': 'device_name', 'model': 'device_model', 'hardware': 'hardware'}
+
+# "key:value" pairs of "<<HKDevice: 0x...>, name:Apple Watch, hardware:Watch6,2, software:10.2>";
+# values may contain ", " so a pair ends only where the next "key:" begins
+_DEVICE_PROPERTY = re.compile(r'(\w[\w ]*?):(.*?)(?=, \w[\w ]*:|>\s*$|$)')
 
 class HealthDataParser:
     # Constants for unit conversions
     KM_TO_METERS = 1000
     MINUTES_TO_SECONDS = 60.0
     
+    # Length of Apple's "YYYY-MM-DD HH:MM:SS +HHMM" datetime layout
+    APPLE_DATETIME_LENGTH = 25
+    
     def __init__(self, timezone: str):
         self.timezone = pytz.timezone(timezone)
+        # Fixed-offset tzinfo objects and offsets in seconds keyed by the "+HHMM" suffix
+        self._offset_cache: Dict[str, dt_timezone] = {}
+        self._offset_seconds: Dict[str, int] = {}
+        # Epoch seconds of UTC midnight keyed by "YYYY-MM-DD"
+        self._day_cache: Dict[str, int] = {}
+        # Device tags and software version keyed by device description
+        self._device_cache: Dict[Tuple[bool, str], Tuple[Dict[str, str], Optional[str]]] = {}
+        
+    def _get_offset_timezone(self, offset: str) -> dt_timezone:
+        """Return the cached fixed-offset timezone for a "+HHMM" string."""
+        tz = self._offset_cache.get(offset)
+        if tz is None:
+            if offset[0] not in '+-' or not offset[1:].isdigit():
+                raise ValueError(f"Invalid UTC offset: {offset}")
+            delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+            tz = dt_timezone(-delta if offset[0] == '-' else delta)
+            self._offset_cache[offset] = tz
+        return tz
+    
+    def _get_offset_seconds(self, offset: str) -> int:
+        """Return the cached offset in seconds of a "+HHMM" string."""
+        seconds = self._offset_seconds.get(offset)
+        if seconds is None:
+            seconds = self._offset_seconds[offset] = int(
+                self._get_offset_timezone(offset).utcoffset(None).total_seconds())
+        return seconds
+    
+    def _parse_apple_datetime(self, date_str: str) -> Optional[datetime]:
+        """Parse the fixed Apple layout by slicing; None if the string does not match it."""
+        if (len(date_str) != self.APPLE_DATETIME_LENGTH or date_str[4] != '-' or date_str[7] != '-'
+                or date_str[10] != ' ' or date_str[13] != ':' or date_str[16] != ':'
+                or date_str[19] != ' '):
+            return None
+        
+        try:
+            return datetime(
+                int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]),
+                int(date_str[11:13]), int(date_str[14:16]), int(date_str[17:19]),
+                tzinfo=self._get_offset_timezone(date_str[20:25])
+            )
+        except ValueError:
+            return None
         
     def parse_datetime(self, date_str: str) -> datetime:
         """Convert Apple Health datetime string to timezone-aware datetime object."""
+        dt = self._parse_apple_datetime(date_str)
+        if dt is not None:
+            return dt.astimezone(self.timezone)
+        
         try:
             dt = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S %z")
             return dt.astimezone(self.timezone)
@@ -26,6 +89,71 @@ class HealthDataParser:
                 logging.error(f"Unable to parse datetime: {date_str}")
                 raise ValueError(f"Cannot parse datetime format: {date_str}")
     
+    def parse_timestamp(self, date_str: str) -> Tuple[int, int]:
+        """Convert an Apple Health datetime string to epoch nanoseconds and its UTC offset in seconds.
+        
+        Apple's layout is read by slicing, without building a datetime. Times
+        are whole seconds, the precision points are written with.
+        """
+        if (len(date_str) == self.APPLE_DATETIME_LENGTH and date_str[4] == '-' and date_str[7] == '-'
+                and date_str[10] == ' ' and date_str[13] == ':' and date_str[16] == ':'
+                and date_str[19] == ' '):
+            try:
+                day = date_str[:10]
+                midnight = self._day_cache.get(day)
+                if midnight is None:
+                    ordinal = date(int(day[0:4]), int(day[5:7]), int(day[8:10])).toordinal()
+                    midnight = self._day_cache[day] = (ordinal - _EPOCH_ORDINAL) * 86400
+                hour, minute, second = int(date_str[11:13]), int(date_str[14:16]), int(date_str[17:19])
+                offset = self._get_offset_seconds(date_str[20:25])
+                if 0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60:
+                    seconds = midnight + hour * 3600 + minute * 60 + second - offset
+                    return seconds * NANOSECONDS_PER_SECOND, offset
+            except ValueError:
+                pass
+        
+        dt = self.parse_datetime(date_str)
+        return to_epoch_ns(dt.replace(microsecond=0)), int(dt.utcoffset().total_seconds())
+    
+    def parse_device(self, device: str) -> Tuple[Dict[str, str], Optional[str]]:
+        """Split an HKDevice description into device tags and its software version.
+        
+        Descriptions that are not HKDevice strings become the ``device_name``;
+        malformed HKDevice strings give only the properties that can be read.
+        """
+        hk_device = device.startswith('<<HKDevice')
+        # The object address differs between records of the same device
+        key = (True, device.partition('>')[2]) if hk_device else (False, device)
+        cached = self._device_cache.get(key)
+        if cached is None:
+            if hk_device:
+                properties = {name: value.strip() for name, value in _DEVICE_PROPERTY.findall(key[1])}
+                tags = {tag: properties[name] for name, tag in DEVICE_TAGS.items() if properties.get(name)}
+                cached = (tags, properties.get('software') or None)
+            else:
+                name = device.strip()
+                cached = ({'device_name': name} if name else {}, None)
+            self._device_cache[key] = cached
+        return cached
+    
+    def _add_device(self, data: Dict[str, Dict], device: Optional[str]) -> None:
+        """Add the device tags and software version field of a record's device."""
+        if not device:
+            return
+        tags, software = self.parse_device(device)
+        data['tags'].update(tags)
+        if software:
+            data['fields']['software_version'] = software
+    
+    def parse_date(self, date_str: str) -> datetime:
+        """Convert a YYYY-MM-DD date string to a naive datetime at midnight."""
+        if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+            try:
+                return datetime(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]))
+            except ValueError:
+                pass
+        return datetime.strptime(date_str, "%Y-%m-%d")
+    
     def parse_heart_rate(self, record: ET.Element) -> Optional[Dict[str, Union[str, Dict]]]:
         """Parse heart rate record."""
         if record.get('type') != 'HKQuantityTypeIdentifierHeartRate':
@@ -42,8 +170,7 @@ class HealthDataParser:
                 logging.warning(f"Invalid heart rate value: {value}")
                 return None
                 
-            start_date = self.parse_datetime(record.get('startDate'))
-            device = record.get('device', '')
+            time_ns, utc_offset = self.parse_timestamp(record.get('startDate'))
             
             # Get motion context if available
             motion_context = None
@@ -51,19 +178,21 @@ class HealthDataParser:
                 if metadata.get('key') == 'HKMetadataKeyHeartRateMotionContext':
                     motion_context = int(metadata.get('value'))
                     
-            return {
+            data = {
                 'measurement': 'heartrate_bpm',
                 'type': 'HKQuantityTypeIdentifierHeartRate',
-                'time': start_date.isoformat(),
+                'time': time_ns,
+                'utc_offset': utc_offset,
                 'fields': {
                     'value': value
                 },
                 'tags': {
-                    'device': device,
                     'source': record.get('sourceName'),
                     'motion_context': str(motion_context) if motion_context is not None else None
                 }
             }
+            self._add_device(data, record.get('device'))
+            return data
         except (ValueError, TypeError, AttributeError) as e:
             logging.error(f"Error parsing heart rate record: {e}")
             return None
@@ -86,12 +215,13 @@ class HealthDataParser:
                 logging.warning(f"Invalid workout values: duration={duration}, distance={distance}, energy={energy}")
                 return None
                 
-            start_date = self.parse_datetime(workout.get('startDate'))
+            time_ns, utc_offset = self.parse_timestamp(workout.get('startDate'))
             
             return {
                 'measurement': 'energy_kcal',
                 'type': 'HKWorkoutTypeIdentifier',
-                'time': start_date.isoformat(),
+                'time': time_ns,
+                'utc_offset': utc_offset,
                 'fields': {
                     'value': energy,
                     'duration': duration,
@@ -114,14 +244,13 @@ class HealthDataParser:
                 return None
                 
             # Convert YYYY-MM-DD to datetime at start of day
-            activity_date = datetime.strptime(date, "%Y-%m-%d").replace(
-                tzinfo=self.timezone
-            )
+            activity_date = self.parse_date(date).replace(tzinfo=self.timezone)
             
             return {
                 'measurement': 'energy_kcal',
                 'type': 'HKActivitySummary',
-                'time': activity_date.isoformat(),
+                'time': to_epoch_ns(activity_date),
+                'utc_offset': int(activity_date.utcoffset().total_seconds()),
                 'fields': {
                     'value': float(activity.get('activeEnergyBurned', 0)),
                     'target': float(activity.get('activeEnergyBurnedGoal', 0)),
@@ -156,22 +285,23 @@ class HealthDataParser:
                 logging.warning(f"{record_type} has extreme value: {value}")
                 return None
                 
-            start_date = self.parse_datetime(start_date_str)
+            time_ns, utc_offset = self.parse_timestamp(start_date_str)
             
             # Create base data structure
             data = {
                 'measurement': 'generic_quantity',  # Will be overridden by config
                 'type': record_type,
-                'time': start_date.isoformat(),
+                'time': time_ns,
+                'utc_offset': utc_offset,
                 'fields': {
                     'value': value
                 },
                 'tags': {
                     'source': record.get('sourceName', ''),
-                    'unit': record.get('unit', ''),
-                    'device': record.get('device', '')
+                    'unit': record.get('unit', '')
                 }
             }
+            self._add_device(data, record.get('device'))
             
             # Add record-type specific tags
             if 'Energy' in record_type:
@@ -204,14 +334,14 @@ class HealthDataParser:
             return None
             
         try:
-            start_date = self.parse_datetime(start_date_str)
-            end_date = self.parse_datetime(end_date_str)
+            time_ns, utc_offset = self.parse_timestamp(start_date_str)
+            end_ns, _ = self.parse_timestamp(end_date_str)
             
             # Validate date logic
-            if end_date <= start_date:
+            if end_ns <= time_ns:
                 logging.warning(f"{record_type} has invalid date range: {start_date_str} to {end_date_str}")
                 return None
-            duration_seconds = (end_date - start_date).total_seconds()  # Keep in seconds for consistency
+            duration_seconds = (end_ns - time_ns) / NANOSECONDS_PER_SECOND  # Keep in seconds for consistency
             
             # Validate duration is reasonable (not negative, not too long)
             if duration_seconds < 0:
@@ -227,17 +357,18 @@ class HealthDataParser:
             data = {
                 'measurement': 'generic_category',  # Will be overridden by config
                 'type': record_type,
-                'time': start_date.isoformat(),
+                'time': time_ns,
+                'utc_offset': utc_offset,
                 'fields': {
                     'duration': duration_seconds,  # Store in seconds consistently
                     'value': 1.0 if 'Audio' in record_type else 1  # Float for environmental, int for sleep compatibility
                 },
                 'tags': {
                     'source': record.get('sourceName', ''),
-                    'device': record.get('device', ''),
                     'category_value': category_value
                 }
             }
+            self._add_device(data, record.get('device'))
             
             # Add type-specific tags
             if 'Sleep' in record_type:
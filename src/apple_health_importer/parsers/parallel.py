@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import logging
+import multiprocessing
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .batch import ColumnarBatch, StringTable
+from .engines import iter_health_elements
+from .filters import ElementFilter
+from .source import RangeReader
+
+
+# Per-process state created by the pool initializer
+_worker_processor = None
+
+
+def _init_worker(timezone: str, measurements_config_path: str, engine: str,
+                 process_batch_size: int, element_filter: Optional[ElementFilter]) -> None:
+    """Build the parsing pipeline once per worker process."""
+    global _worker_processor
+
+    # Imported here: the streaming module imports this one
+    from .health_data import HealthDataParser
+    from .streaming import StreamingHealthDataProcessor
+    from ..validation.validator import HealthDataValidator
+    from ..config.manager import ConfigManager
+
+    config_manager = ConfigManager(measurements_config_path)
+    _worker_processor = StreamingHealthDataProcessor(
+        parser=HealthDataParser(timezone),
+        validator=HealthDataValidator(config_manager),
+        influxdb=None,
+        tracker=None,
+        config_manager=config_manager,
+        process_batch_size=process_batch_size,
+        engine=engine,
+        element_filter=element_filter
+    )
+
+
+def _parse_range(task: Tuple[str, int, int]) -> Dict[str, Any]:
+    """Parse, map and validate one byte range in a worker process."""
+    file_path, start, end = task
+    processor = _worker_processor
+    processor.reset_stats()
+    processor.validator.reset_stats()
+
+    # Points go into columnar batches of at most process_batch_size points,
+    # which are also much cheaper to send back than lists of dicts. The batches
+    # of a range share one string table, which is pickled once with them
+    strings = StringTable()
+    batches = [ColumnarBatch(strings)]
+    counts = {'records': 0, 'workouts': 0, 'activities': 0}
+    element_filter = processor.element_filter
+    parse_started = time.thread_time()
+
+    with RangeReader(file_path, start, end) as reader:
+        for element in iter_health_elements(reader, processor.engine):
+            element_type = processor.ELEMENT_TYPES[element.tag]
+            counts[processor.POSITION_KEYS[element_type]] += 1
+            if element_filter and not element_filter.accepts(element):
+                processor.total_stats['filtered'] += 1
+                continue
+            try:
+                data = processor.convert_element(element_type, element, validate=False)
+                if data:
+                    if len(batches[-1]) >= processor.process_batch_size:
+                        batches.append(ColumnarBatch(strings))
+                    batches[-1].append(data)
+            except Exception as e:
+                logging.error(f"Error processing {element_type}: {e}")
+                processor.total_stats['errors'] += 1
+
+    # Validate whole batches; this updates the stats returned below
+    valid_batches = [valid for valid in map(processor.validate_batch, batches) if valid]
+    processor.total_stats['parse_seconds'] += time.thread_time() - parse_started
+    processor.total_stats['tag_values'] = len(strings)
+    processor.total_stats['string_tables'] = 1
+
+    return {
+        'start': start,
+        'end': end,
+        'batches': valid_batches,
+        'stats': processor.total_stats.copy(),
+        'counts': counts,
+        'validation': processor.validator.get_validation_summary()
+    }
+
+
+class ParallelRangeParser:
+    """Parses byte ranges of an export in a pool of worker processes.
+
+    Results are yielded in file order. At most ``max_pending`` ranges are in
+    flight, so workers cannot run arbitrarily far ahead of the writer.
+    """
+
+    def __init__(self, file_path: str, jobs: int, timezone: str,
+                 measurements_config_path: str, engine: str = 'auto',
+                 process_batch_size: int = 5000, max_pending: Optional[int] = None,
+                 element_filter: Optional[ElementFilter] = None):
+        self.file_path = str(file_path)
+        self.jobs = jobs
+        self.max_pending = max_pending or jobs * 2
+        self._pool = multiprocessing.Pool(
+            processes=jobs,
+            initializer=_init_worker,
+            initargs=(timezone, measurements_config_path, engine, process_batch_size, element_filter)
+        )
+
+    def iter_results(self, ranges: List[Tuple[int, int]]) -> Iterator[Dict[str, Any]]:
+        """Yield parsed range results in order."""
+        pending = deque()
+        tasks = iter(ranges)
+
+        for start, end in tasks:
+            pending.append(self._pool.apply_async(_parse_range, ((self.file_path, start, end),)))
+            if len(pending) >= self.max_pending:
+                break
+
+        while pending:
+            result = pending.popleft().get()
+            next_range = next(tasks, None)
+            if next_range is not None:
+                pending.append(self._pool.apply_async(_parse_range, ((self.file_path,) + tuple(next_range),)))
+            yield result
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self) -> 'ParallelRangeParser':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
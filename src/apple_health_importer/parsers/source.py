@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+
+import gzip
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zipfile
+from collections import deque
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from .engines import HEALTH_ELEMENT_TAGS
+
+
+# Apple exports write every Record/Workout/ActivitySummary on its own line,
+# indented one level below <HealthData>. Records nested in a Correlation are
+# indented further, so the indentation tells top-level elements apart.
+_ELEMENT_START = re.compile(rb'\n([ \t]*)<(?:Record|Workout|ActivitySummary)[\s/>]')
+
+# Start tag of any Record/Workout/ActivitySummary, with its indentation when it
+# begins a line
+_ELEMENT_TAG = re.compile(rb'(?:\n([ \t]*))?<(Record|Workout|ActivitySummary)[\s/>]')
+
+# Synthetic root used when parsing a slice of the export on its own
+SYNTHETIC_ROOT_OPEN = b'<HealthData>\n'
+SYNTHETIC_ROOT_CLOSE = b'\n</HealthData>\n'
+
+SCAN_WINDOW_BYTES = 1024 * 1024
+
+# Location of the export inside the zip produced by the Health app
+ZIP_EXPORT_MEMBER = 'apple_health_export/export.xml'
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Decompressed chunk size and number of chunks buffered ahead of the parser
+DECOMPRESS_CHUNK_BYTES = 1024 * 1024
+DECOMPRESS_QUEUE_DEPTH = 8
+
+# Read-ahead of plain exports: large reads, at most 32 MB buffered ahead
+READ_AHEAD_CHUNK_BYTES = 8 * 1024 * 1024
+READ_AHEAD_QUEUE_DEPTH = 4
+
+
+def get_export_format(file_path: str) -> str:
+    """Return 'zip', 'gzip' or 'xml' for an export path."""
+    if zipfile.is_zipfile(file_path):
+        return 'zip'
+    with open(file_path, 'rb') as f:
+        if f.read(2) == GZIP_MAGIC:
+            return 'gzip'
+    return 'xml'
+
+
+def is_compressed_export(file_path: str) -> bool:
+    """Check whether an export path is a zip archive or gzip-compressed XML."""
+    return get_export_format(file_path) != 'xml'
+
+
+def find_zip_export_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Find the export.xml member of an Apple Health export zip."""
+    members = archive.infolist()
+    for info in members:
+        if info.filename == ZIP_EXPORT_MEMBER:
+            return info
+
+    # Renamed top-level folders or hand-made archives
+    for info in members:
+        if info.filename.rsplit('/', 1)[-1].lower() == 'export.xml':
+            return info
+
+    raise ValueError(f"No export.xml found in archive {archive.filename}")
+
+
+def advise_sequential(f: BinaryIO, offset: int = 0) -> None:
+    """Tell the kernel a file is read sequentially from ``offset``, where supported."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(f.fileno(), offset, 0, os.POSIX_FADV_SEQUENTIAL)
+    except OSError as e:
+        logging.debug(f"posix_fadvise failed: {e}")
+
+
+def open_export_stream(file_path: str) -> BinaryIO:
+    """Open the XML stream of a plain, zipped or gzip-compressed export."""
+    export_format = get_export_format(file_path)
+
+    if export_format == 'zip':
+        archive = zipfile.ZipFile(file_path)
+        return archive.open(find_zip_export_member(archive))
+    if export_format == 'gzip':
+        return gzip.open(file_path, 'rb')
+    return open(file_path, 'rb')
+
+
+class ThreadedStreamReader:
+    """Reads a stream on a background thread into a bounded queue of chunks.
+
+    File reads and zlib inflation release the GIL, so reading and
+    decompression overlap with parsing on the consumer thread.
+    ``wait_seconds`` is the time the consumer spent blocked on an empty queue
+    (the I/O the read-ahead could not hide) and ``read_seconds`` the time the
+    background thread spent in ``read``.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = DECOMPRESS_CHUNK_BYTES,
+                 queue_depth: int = DECOMPRESS_QUEUE_DEPTH, raw_file: Optional[BinaryIO] = None):
+        self._stream = stream
+        self._raw_file = raw_file
+        self._chunk_size = chunk_size
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._buffer = b''
+        self._offset = 0
+        self._eof = False
+        # Bytes of the compressed file read so far (when ``raw_file`` is known)
+        self.raw_position = 0
+        self.read_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name='export-reader', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """Producer loop: read chunks until EOF, an error, or close()."""
+        try:
+            while not self._stop.is_set():
+                started = time.perf_counter()
+                data = self._stream.read(self._chunk_size)
+                self.read_seconds += time.perf_counter() - started
+                if self._raw_file is not None:
+                    self.raw_position = self._raw_file.tell()
+                self._put(data)
+                if not data:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item) -> None:
+        """Queue an item, giving up if the reader is closed meanwhile."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to ``size`` bytes from the buffered chunks."""
+        if self._offset >= len(self._buffer):
+            if self._eof:
+                return b''
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                started = time.perf_counter()
+                item = self._queue.get()
+                self.wait_seconds += time.perf_counter() - started
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return b''
+            self._buffer = item
+            self._offset = 0
+
+        if size is None or size < 0:
+            size = len(self._buffer) - self._offset
+
+        data = self._buffer[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+    def close(self) -> None:
+        """Stop the producer thread and close the stream."""
+        self._stop.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join()
+        self._stream.close()
+
+
+class ElementBoundaryTracker:
+    """Tracks top-level element boundaries in the bytes handed to a parser.
+
+    Every chunk fed to the tracker is scanned for element start tags. For each
+    chunk the last top-level boundary is remembered together with the number of
+    elements of each tag that start before it, so a consumer that has finished
+    N elements can find the furthest offset it could restart parsing from.
+
+    ``counts`` are absolute when the tracker starts at a resume offset with the
+    counts recorded for that offset.
+    """
+
+    def __init__(self, offset: int = 0, counts: Optional[Dict[str, int]] = None):
+        self.counts = {tag: 0 for tag in HEALTH_ELEMENT_TAGS}
+        if counts:
+            self.counts.update(counts)
+        self.reliable = True
+        self._offset = offset
+        self._carry = b''
+        self._top_indent: Optional[int] = None
+        self._start = (offset, self.counts.copy())
+        self._boundaries = deque([self._start])
+
+    def feed(self, data: bytes) -> None:
+        """Scan the next chunk of XML handed to the parser."""
+        buf = self._carry + data
+        # Scan up to the last newline; a tag cut off at the end of the chunk is
+        # matched on the next call instead
+        cut = buf.rfind(b'\n')
+        if cut < 0:
+            self._carry = buf
+            return
+
+        last_boundary = None
+        for match in _ELEMENT_TAG.finditer(buf, 0, cut + 1):
+            indent = match.group(1)
+            if indent is not None:
+                if self._top_indent is None or len(indent) < self._top_indent:
+                    # Shallower than anything seen before: earlier candidates
+                    # were nested elements, not top-level ones
+                    self._top_indent = len(indent)
+                    self._boundaries = deque([self._start])
+                if len(indent) == self._top_indent:
+                    last_boundary = self._offset + match.start() + 1
+                    boundary_counts = self.counts.copy()
+            self.counts[match.group(2).decode('ascii')] += 1
+
+        if last_boundary is not None:
+            self._boundaries.append((last_boundary, boundary_counts))
+
+        self._offset += cut
+        self._carry = buf[cut:]
+
+    @property
+    def total(self) -> int:
+        """Number of element start tags seen so far."""
+        return sum(self.counts.values())
+
+    def resume_point(self, elements_done: int) -> Tuple[int, Dict[str, int]]:
+        """Return ``(offset, counts)`` of the furthest boundary before ``elements_done`` elements.
+
+        If the parser has yielded more elements than the scan found start
+        tags, the export is not laid out as expected and the tracker falls
+        back to the offset it started from.
+        """
+        if elements_done > self.total:
+            if self.reliable:
+                logging.warning("Export layout not recognized; checkpoints will not advance the resume offset")
+            self.reliable = False
+        if not self.reliable:
+            return self._start[0], self._start[1].copy()
+
+        while len(self._boundaries) > 1 and sum(self._boundaries[1][1].values()) <= elements_done:
+            self._boundaries.popleft()
+        offset, counts = self._boundaries[0]
+        return offset, counts.copy()
+
+
+class ExportReader:
+    """Binary reader over an export that tracks how many bytes were consumed.
+
+    Accepts a plain ``export.xml``, the ``export.zip`` produced by the Health
+    app, or gzip-compressed XML. Compressed exports are streamed without being
+    extracted to disk and are decompressed on a background thread; plain ones
+    are read ahead in large chunks on one. ``io_wait_seconds`` is the time the
+    parser waited for data.
+
+    The parser engines pull data through ``read()``, so ``position`` is the
+    offset into the XML reached by the parser. ``progress`` and ``total_size``
+    measure the same advance in bytes of the file on disk (compressed bytes for
+    gzip, whose uncompressed size is not known up front), so progress and ETA
+    can be reported without a separate counting pass.
+
+    With a ``start_offset`` (a top-level element boundary recorded by
+    ``ElementBoundaryTracker``) reading starts there, behind a synthetic
+    ``<HealthData>`` root; the export's own closing tag closes it. Plain files
+    seek to the offset, compressed ones decompress and discard the bytes before
+    it without parsing them. ``track_boundaries`` attaches a tracker as
+    ``boundaries``.
+    """
+
+    def __init__(self, file_path: str, start_offset: int = 0,
+                 start_counts: Optional[Dict[str, int]] = None,
+                 track_boundaries: bool = False):
+        self.file_path = str(file_path)
+        self.format = get_export_format(self.file_path)
+        self.position = 0
+        self._prefix = b''
+        self._raw_file: Optional[BinaryIO] = None
+        self._archive: Optional[zipfile.ZipFile] = None
+
+        if self.format == 'zip':
+            self._archive = zipfile.ZipFile(self.file_path)
+            member = find_zip_export_member(self._archive)
+            self.total_size = member.file_size
+            logging.info(f"Streaming {member.filename} from {self.file_path}")
+            self._file = ThreadedStreamReader(self._archive.open(member))
+        elif self.format == 'gzip':
+            self.total_size = os.path.getsize(self.file_path)
+            self._raw_file = open(self.file_path, 'rb')
+            self._file = ThreadedStreamReader(gzip.GzipFile(fileobj=self._raw_file, mode='rb'),
+                                              raw_file=self._raw_file)
+        else:
+            self.total_size = os.path.getsize(self.file_path)
+            raw_file = open(self.file_path, 'rb', buffering=0)
+            raw_file.seek(start_offset)
+            self.position = start_offset
+            advise_sequential(raw_file, start_offset)
+            self._file = ThreadedStreamReader(raw_file, READ_AHEAD_CHUNK_BYTES, READ_AHEAD_QUEUE_DEPTH)
+
+        if start_offset:
+            self._skip_to(start_offset)
+            self._prefix = SYNTHETIC_ROOT_OPEN
+
+        self.boundaries = ElementBoundaryTracker(start_offset, start_counts) if track_boundaries else None
+
+    def _skip_to(self, offset: int) -> None:
+        """Advance the stream to ``offset`` without handing the bytes to the parser."""
+        while self.position < offset:
+            data = self._file.read(min(DECOMPRESS_CHUNK_BYTES, offset - self.position))
+            if not data:
+                raise ValueError(f"Resume offset {offset} is beyond the end of {self.file_path}")
+            self.position += len(data)
+
+    @property
+    def progress(self) -> int:
+        """Bytes processed, in the same unit as ``total_size``."""
+        if self.format == 'gzip':
+            return self._file.raw_position
+        return self.position
+
+    @property
+    def io_wait_seconds(self) -> float:
+        """Seconds the parser spent waiting for data from the background reader."""
+        return self._file.wait_seconds if self._file is not None else 0.0
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to ``size`` bytes and advance the tracked position."""
+        if self._prefix:
+            if size is None or size < 0:
+                size = len(self._prefix)
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            return data
+
+        data = self._file.read(size)
+        self.position += len(data)
+        if self.boundaries is not None:
+            self.boundaries.feed(data)
+        return data
+
+    def close(self) -> None:
+        """Close the underlying file or archive."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._raw_file is not None:
+            self._raw_file.close()
+            self._raw_file = None
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def __enter__(self) -> 'ExportReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class RangeReader:
+    """Binary reader over a byte range of the export, wrapped in a synthetic root.
+
+    The range must start at a top-level element boundary (see
+    ``split_export_ranges``) so that the slice is well-formed XML once it is
+    enclosed in ``<HealthData>``. ``position`` counts bytes consumed from the
+    underlying file, excluding the synthetic root.
+    """
+
+    def __init__(self, file_path: str, start: int, end: int):
+        self.file_path = str(file_path)
+        self.start = start
+        self.end = end
+        self.position = 0
+        self._file: Optional[BinaryIO] = open(self.file_path, 'rb')
+        self._file.seek(start)
+        self._prefix = SYNTHETIC_ROOT_OPEN
+        self._suffix = SYNTHETIC_ROOT_CLOSE
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to ``size`` bytes of the wrapped range."""
+        if size is None or size < 0:
+            size = (self.end - self.start) + len(SYNTHETIC_ROOT_OPEN) + len(SYNTHETIC_ROOT_CLOSE)
+
+        if self._prefix:
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            return data
+
+        remaining = self.end - self.start - self.position
+        if remaining > 0:
+            data = self._file.read(min(size, remaining))
+            self.position += len(data)
+            if data:
+                return data
+
+        data, self._suffix = self._suffix[:size], self._suffix[size:]
+        return data
+
+    def close(self) -> None:
+        """Close the underlying file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'RangeReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class BlockReader:
+    """Binary reader over several byte ranges of a plain export, wrapped in one synthetic root.
+
+    Every range must start at a top-level element boundary and end at another
+    one (or at the closing root tag), as the blocks of an ``ExportIndex`` do;
+    the ranges are read in order and everything between them is skipped.
+    Offers the ``ExportReader`` interface used for progress reporting, with
+    ``total_size`` being the bytes in the ranges. No boundaries are tracked.
+    """
+
+    format = 'xml'
+    boundaries = None
+
+    def __init__(self, file_path: str, ranges: List[Tuple[int, int]]):
+        self.file_path = str(file_path)
+        self.ranges = list(ranges)
+        self.total_size = sum(end - start for start, end in self.ranges)
+        self.position = 0
+        self._file: Optional[BinaryIO] = open(self.file_path, 'rb')
+        self._range = 0
+        self._remaining = 0
+        self._prefix = SYNTHETIC_ROOT_OPEN
+        self._suffix = SYNTHETIC_ROOT_CLOSE
+
+    @property
+    def progress(self) -> int:
+        """Bytes of the ranges read so far."""
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to ``size`` bytes of the wrapped ranges."""
+        if size is None or size < 0:
+            size = self.total_size + len(SYNTHETIC_ROOT_OPEN) + len(SYNTHETIC_ROOT_CLOSE)
+
+        if self._prefix:
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            return data
+
+        while self._remaining <= 0 and self._range < len(self.ranges):
+            start, end = self.ranges[self._range]
+            self._range += 1
+            self._file.seek(start)
+            self._remaining = end - start
+
+        if self._remaining > 0:
+            data = self._file.read(min(size, self._remaining))
+            self._remaining -= len(data)
+            self.position += len(data)
+            if data:
+                return data
+            self._remaining = 0
+
+        data, self._suffix = self._suffix[:size], self._suffix[size:]
+        return data
+
+    def close(self) -> None:
+        """Close the underlying file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'BlockReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def detect_export_layout(file_path: str) -> Tuple[int, int, bytes]:
+    """Locate the data section of an export.
+
+    Returns ``(body_start, body_end, indent)``: the offset of the first
+    top-level data element, the offset of the closing ``</HealthData>`` tag and
+    the indentation used for top-level elements.
+    """
+    file_size = os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as f:
+        body_start = None
+        indent = b''
+        offset = 0
+        carry = b''
+        while body_start is None:
+            chunk = f.read(SCAN_WINDOW_BYTES)
+            if not chunk:
+                break
+            window = carry + chunk
+            match = _ELEMENT_START.search(window)
+            if match:
+                body_start = offset - len(carry) + match.start() + 1
+                indent = match.group(1)
+            else:
+                # Keep a short tail so a match split across reads is not lost
+                carry = window[-64:]
+                offset += len(chunk)
+
+        if body_start is None:
+            return file_size, file_size, b''
+
+        tail_start = max(body_start, file_size - SCAN_WINDOW_BYTES)
+        f.seek(tail_start)
+        tail = f.read()
+        close_pos = tail.rfind(b'</HealthData>')
+        body_end = tail_start + close_pos if close_pos >= 0 else file_size
+
+    return body_start, body_end, indent
+
+
+def find_element_boundary(f: BinaryIO, offset: int, limit: int, indent: bytes) -> int:
+    """Return the offset of the first top-level element starting at or after ``offset``.
+
+    Returns ``limit`` when no element starts before it.
+    """
+    pattern = re.compile(b'\n' + re.escape(indent) + rb'<(?:Record|Workout|ActivitySummary)[\s/>]')
+    position = max(offset - 1, 0)
+
+    while position < limit:
+        f.seek(position)
+        window = f.read(min(SCAN_WINDOW_BYTES, limit - position) + 64)
+        if not window:
+            break
+        match = pattern.search(window)
+        if match:
+            return min(position + match.start() + 1, limit)
+        position += SCAN_WINDOW_BYTES
+
+    return limit
+
+
+def split_export_ranges(file_path: str, num_ranges: int) -> List[Tuple[int, int]]:
+    """Split the data section of an export into byte ranges at element boundaries.
+
+    Every range starts at a top-level Record/Workout/ActivitySummary and can be
+    parsed on its own with ``RangeReader``.
+    """
+    body_start, body_end, indent = detect_export_layout(file_path)
+    if body_start >= body_end:
+        return []
+
+    num_ranges = max(1, num_ranges)
+    step = (body_end - body_start) / num_ranges
+    boundaries = [body_start]
+
+    with open(file_path, 'rb') as f:
+        for i in range(1, num_ranges):
+            target = int(body_start + step * i)
+            if target <= boundaries[-1]:
+                continue
+            boundary = find_element_boundary(f, target, body_end, indent)
+            if boundaries[-1] < boundary < body_end:
+                boundaries.append(boundary)
+
+    boundaries.append(body_end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
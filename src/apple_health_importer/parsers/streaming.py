@@ -1,22 +1,40 @@
 #!/usr/bin/env python3
 
 import logging
-import xml.etree.ElementTree as ET
-from typing import Dict, List, Iterator, Tuple, Optional
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Iterator, Set, Tuple, Optional, Union
 from datetime import datetime
 import json
 from pathlib import Path
 from tqdm import tqdm
 
 from .health_data import HealthDataParser
+from .batch import ColumnarBatch, StringTable, to_epoch_ns
+from .engines import iter_health_elements, resolve_engine
+from .filters import ElementFilter
+from .day_buckets import DayBuckets
+from .source import BlockReader, ExportReader, is_compressed_export, split_export_ranges
+from .export_index import ExportIndex
+from .parallel import ParallelRangeParser
 from ..validation.validator import HealthDataValidator
 from ..writers.influxdb import InfluxDBWriter
+from ..writers.line_protocol import point_time_ns
+from ..writers.pipeline import WriteBehindPipeline
 from ..tracking.tracker import ImportTracker
-from ..config.manager import ConfigManager
+from ..config.manager import ConfigManager, TypePlan
 
 
 class ProgressCheckpoint:
-    """Manages progress checkpoints for resumable imports."""
+    """Manages progress checkpoints for resumable imports.
+    
+    Besides element counts, a checkpoint records ``byte_offset``: a top-level
+    element boundary in the export before which everything has been written.
+    ``byte_offset_counts`` are the element counts at that offset and
+    ``skip_elements`` the number of already written elements that follow it.
+    Checkpoints without an offset (older versions) resume by count.
+    """
     
     def __init__(self, checkpoint_file: str = "import_progress.json"):
         self.checkpoint_file = Path(checkpoint_file)
@@ -25,20 +43,7 @@ class ProgressCheckpoint:
     def _load_checkpoint(self) -> Dict:
         """Load checkpoint data from file."""
         if not self.checkpoint_file.exists():
-            return {
-                'file_hash': None,
-                'processed_records': 0,
-                'processed_workouts': 0,
-                'processed_activities': 0,
-                'last_checkpoint_time': None,
-                'stats': {
-                    'errors': 0,
-                    'written': 0,
-                    'duplicates': 0,
-                    'validation_errors': 0,
-                    'unknown_types': 0
-                }
-            }
+            return self._get_empty_checkpoint()
         
         try:
             with open(self.checkpoint_file, 'r') as f:
@@ -54,6 +59,9 @@ class ProgressCheckpoint:
             'processed_records': 0,
             'processed_workouts': 0,
             'processed_activities': 0,
+            'byte_offset': None,
+            'byte_offset_counts': None,
+            'skip_elements': 0,
             'last_checkpoint_time': None,
             'stats': {
                 'errors': 0,
@@ -64,22 +72,38 @@ class ProgressCheckpoint:
             }
         }
     
-    def save_checkpoint(self, file_hash: str, processed_counts: Dict, stats: Dict) -> None:
+    def save_checkpoint(self, file_hash: str, processed_counts: Dict, stats: Dict,
+                        byte_offset: Optional[int] = None, offset_counts: Optional[Dict] = None,
+                        skip_elements: int = 0) -> None:
         """Save current progress to checkpoint file."""
         self.checkpoint_data.update({
             'file_hash': file_hash,
             'processed_records': processed_counts.get('records', 0),
             'processed_workouts': processed_counts.get('workouts', 0),
             'processed_activities': processed_counts.get('activities', 0),
+            'byte_offset': byte_offset,
+            'byte_offset_counts': offset_counts,
+            'skip_elements': skip_elements,
             'last_checkpoint_time': datetime.now().isoformat(),
             'stats': stats
         })
         
+        # Write to a temporary file and rename it over the checkpoint, so an
+        # interrupted save never leaves a truncated checkpoint behind
+        temp_path = None
         try:
-            with open(self.checkpoint_file, 'w') as f:
+            fd, temp_path = tempfile.mkstemp(prefix=self.checkpoint_file.name + '.',
+                                             suffix='.tmp',
+                                             dir=self.checkpoint_file.parent)
+            with os.fdopen(fd, 'w') as f:
                 json.dump(self.checkpoint_data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.checkpoint_file)
         except Exception as e:
             logging.error(f"Could not save checkpoint: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
     
     def can_resume(self, file_hash: str) -> bool:
         """Check if we can resume processing this file."""
@@ -94,6 +118,14 @@ class ProgressCheckpoint:
             'activities': self.checkpoint_data.get('processed_activities', 0)
         }
     
+    def get_resume_offset(self) -> Optional[Tuple[int, Dict, int]]:
+        """Get ``(byte_offset, offset_counts, skip_elements)``, or None for count-only checkpoints."""
+        byte_offset = self.checkpoint_data.get('byte_offset')
+        offset_counts = self.checkpoint_data.get('byte_offset_counts')
+        if byte_offset is None or offset_counts is None:
+            return None
+        return byte_offset, offset_counts, self.checkpoint_data.get('skip_elements', 0)
+    
     def get_resume_stats(self) -> Dict:
         """Get accumulated stats from previous processing."""
         return self.checkpoint_data.get('stats', {
@@ -114,10 +146,51 @@ class ProgressCheckpoint:
 class StreamingHealthDataProcessor:
     """Processes large Apple Health XML files in streaming fashion."""
     
+    # Target size of the byte ranges handed to worker processes
+    PARALLEL_RANGE_BYTES = 16 * 1024 * 1024
+    
+    # Elements between progress bar refreshes from the reader's byte offset
+    PROGRESS_UPDATE_INTERVAL = 1000
+    
+    # Element types used by the processing loop, keyed by XML tag
+    ELEMENT_TYPES = {
+        'Record': 'record',
+        'Workout': 'workout',
+        'ActivitySummary': 'activity'
+    }
+    
+    # Keys of the resume position / checkpoint counts per element type
+    POSITION_KEYS = {
+        'record': 'records',
+        'workout': 'workouts',
+        'activity': 'activities'
+    }
+    
+    # Data types of the points parsed from Workout and ActivitySummary elements
+    WORKOUT_TYPE = 'HKWorkoutTypeIdentifier'
+    ACTIVITY_TYPE = 'HKActivitySummary'
+    
+    # Checkpoint count keys keyed by XML tag
+    COUNT_KEYS = {
+        'Record': 'records',
+        'Workout': 'workouts',
+        'ActivitySummary': 'activities'
+    }
+    
+    # Counters in total_stats that are not per-category point counts
+    NON_CATEGORY_STATS = ('errors', 'written', 'duplicates', 'upserted', 'validation_errors',
+                          'unknown_types', 'filtered', 'unchanged', 'line_bytes', 'wire_bytes',
+                          'io_wait_seconds', 'parse_seconds', 'tag_values', 'string_tables')
+    
+    # Stats reported by batch writes
+    WRITE_STAT_KEYS = ('written', 'duplicates', 'upserted', 'errors', 'line_bytes', 'wire_bytes')
+    
     def __init__(self, parser: HealthDataParser, validator: HealthDataValidator, 
                  influxdb: InfluxDBWriter, tracker: ImportTracker,
                  config_manager: ConfigManager = None,
-                 process_batch_size: int = 5000, checkpoint_interval: int = 10000):
+                 process_batch_size: int = 5000, checkpoint_interval: int = 10000,
+                 engine: str = 'auto', write_workers: Optional[int] = None,
+                 element_filter: Optional[ElementFilter] = None):
         self.parser = parser
         self.validator = validator
         self.influxdb = influxdb
@@ -125,16 +198,72 @@ class StreamingHealthDataProcessor:
         self.config_manager = config_manager or ConfigManager()
         self.process_batch_size = process_batch_size  # Records to collect before processing
         self.checkpoint_interval = checkpoint_interval  # Records between checkpoints
+        self.engine = resolve_engine(engine)  # 'lxml', 'stdlib' or 'expat'
+        self.write_workers = write_workers or self.config_manager.get_write_workers()  # Batches in flight
+        self.element_filter = element_filter  # Rejects elements before they are parsed
+        self._run_filter = element_filter  # element_filter plus incremental watermarks, per run
         
         self.checkpoint = ProgressCheckpoint()
         
+        # Record type -> (plan, bound parser method), compiled once
+        self._record_dispatch = self._build_record_dispatch()
+        
+        # Types validated per batch: type -> plan (None if unconfigured) and stats category
+        self._validation_plans, self._validation_categories = self._build_validation_plans()
+        
         # Initialize stats with all known categories from config
+        self.reset_stats()
+        self._reset_write_progress(None)
+        
+        # Incremental import cutoffs, loaded from the tracker when first needed
+        self._type_cutoffs: Optional[Dict[str, int]] = None
+        self._measurement_cutoffs: Dict[str, int] = {}
+        
+        # Element counts from the last single-pass run
+        self.element_counts = {'records': 0, 'workouts': 0, 'activities': 0}
+    
+    def _build_record_dispatch(self) -> Dict[str, Tuple[TypePlan, Any]]:
+        """Bind each configured type's plan to its parser method."""
+        return {
+            data_type: (plan, getattr(self.parser, plan.parser_method))
+            for data_type, plan in self.config_manager.type_plans.items()
+        }
+    
+    def _build_validation_plans(self) -> Tuple[Dict[str, Optional[TypePlan]], Dict[str, str]]:
+        """Find the types ``convert_element`` validates, with the category they are counted in."""
+        plans = {}
+        categories = {}
+        for data_type, plan in self.config_manager.type_plans.items():
+            # Activity summaries are never validated
+            if plan.validation_enabled and data_type not in (self.WORKOUT_TYPE, self.ACTIVITY_TYPE):
+                plans[data_type] = plan
+                categories[data_type] = plan.category
+        
+        # Workouts fall back to the 'workouts' category when it is not configured
+        workout_category = self.config_manager.find_measurement_category(self.WORKOUT_TYPE) or 'workouts'
+        if self.config_manager.is_validation_enabled(workout_category):
+            plans[self.WORKOUT_TYPE] = self.config_manager.get_type_plan(self.WORKOUT_TYPE)
+            categories[self.WORKOUT_TYPE] = workout_category
+        
+        return plans, categories
+    
+    def reset_stats(self) -> None:
+        """Reset processing statistics to zero for every configured category."""
         self.total_stats = {
             'errors': 0,
             'written': 0,
             'duplicates': 0,
+            'upserted': 0,
             'validation_errors': 0,
-            'unknown_types': 0
+            'unknown_types': 0,
+            'filtered': 0,
+            'unchanged': 0,
+            'line_bytes': 0,
+            'wire_bytes': 0,
+            'io_wait_seconds': 0.0,  # Parser blocked on reading the export
+            'parse_seconds': 0.0,  # CPU time of the parsing thread
+            'tag_values': 0,  # Distinct tag values interned, summed over the string tables
+            'string_tables': 0  # One per run, or one per byte range with --jobs
         }
         
         # Add categories from config
@@ -146,19 +275,20 @@ class StreamingHealthDataProcessor:
         logging.info("Counting XML elements for progress tracking...")
         counts = {'records': 0, 'workouts': 0, 'activities': 0}
         
+        # A stored export index already has the counts
+        if not is_compressed_export(file_path):
+            index = ExportIndex.load(file_path, self.tracker.get_file_hash(file_path))
+            if index is not None:
+                for tag, count in index.element_counts.items():
+                    counts[self.COUNT_KEYS[tag]] += count
+                logging.info(f"Found {counts['records']} records, {counts['workouts']} workouts, {counts['activities']} activities")
+                return counts
+        
         try:
-            # Use iterparse to count without loading everything into memory
-            for event, elem in ET.iterparse(file_path, events=('start', 'end')):
-                if event == 'start':
-                    if elem.tag == 'Record':
-                        counts['records'] += 1
-                    elif elem.tag == 'Workout':
-                        counts['workouts'] += 1
-                    elif elem.tag == 'ActivitySummary':
-                        counts['activities'] += 1
-                # Clear element to free memory
-                if event == 'end':
-                    elem.clear()
+            # Stream with the selected engine so memory stays flat while counting
+            with ExportReader(file_path) as reader:
+                for elem in iter_health_elements(reader, self.engine):
+                    counts[self.COUNT_KEYS[elem.tag]] += 1
             
             logging.info(f"Found {counts['records']} records, {counts['workouts']} workouts, {counts['activities']} activities")
             return counts
@@ -167,60 +297,189 @@ class StreamingHealthDataProcessor:
             logging.warning(f"Could not count XML elements: {e}. Using approximate progress.")
             return {'records': 1000000, 'workouts': 10000, 'activities': 1000}  # Rough estimates
     
-    def stream_xml_elements(self, file_path: str, resume_position: Dict = None) -> Iterator[Tuple[str, ET.Element, int]]:
-        """Stream XML elements with position tracking."""
+    def stream_xml_elements(self, source: Any, resume_position: Dict = None,
+                            start_position: Dict = None) -> Iterator[Tuple[str, Any, int]]:
+        """Stream XML elements with position tracking.
+        
+        ``source`` is a file path or a binary file object such as ``ExportReader``.
+        ``start_position`` holds the element counts before the first byte of
+        ``source`` when it starts at a resume offset, so positions stay absolute.
+        """
         if resume_position is None:
             resume_position = {'records': 0, 'workouts': 0, 'activities': 0}
         
         current_position = {'records': 0, 'workouts': 0, 'activities': 0}
+        if start_position:
+            current_position.update(start_position)
         
         try:
-            for event, elem in ET.iterparse(file_path, events=('start', 'end')):
-                if event == 'end':
-                    if elem.tag == 'Record':
-                        current_position['records'] += 1
-                        if current_position['records'] > resume_position['records']:
-                            yield ('record', elem, current_position['records'])
-                    
-                    elif elem.tag == 'Workout':
-                        current_position['workouts'] += 1
-                        if current_position['workouts'] > resume_position['workouts']:
-                            yield ('workout', elem, current_position['workouts'])
-                    
-                    elif elem.tag == 'ActivitySummary':
-                        current_position['activities'] += 1
-                        if current_position['activities'] > resume_position['activities']:
-                            yield ('activity', elem, current_position['activities'])
-                    
-                    # Clear element to free memory
-                    elem.clear()
+            # The engine clears each element and prunes finished siblings from
+            # the root once we resume it, so memory does not grow with file size
+            for elem in iter_health_elements(source, self.engine):
+                if elem.tag == 'Record':
+                    current_position['records'] += 1
+                    if current_position['records'] > resume_position['records']:
+                        yield ('record', elem, current_position['records'])
+                
+                elif elem.tag == 'Workout':
+                    current_position['workouts'] += 1
+                    if current_position['workouts'] > resume_position['workouts']:
+                        yield ('workout', elem, current_position['workouts'])
+                
+                elif elem.tag == 'ActivitySummary':
+                    current_position['activities'] += 1
+                    if current_position['activities'] > resume_position['activities']:
+                        yield ('activity', elem, current_position['activities'])
                     
         except Exception as e:
             logging.error(f"Error streaming XML: {e}")
             raise
     
-    def process_batch(self, batch_data: List[Dict], incremental: bool = False) -> Dict:
-        """Process a batch of data points."""
+    def convert_element(self, element_type: str, element: Any, validate: bool = True) -> Optional[Dict]:
+        """Parse, map and validate a single element.
+        
+        Returns the data point to write, or None when the element is skipped.
+        Category, validation and unknown-type counters in ``total_stats`` are
+        updated as a side effect. With ``validate=False`` points that need
+        validation are returned unvalidated and uncounted; ``validate_batch``
+        then validates and counts them for a whole batch at once.
+        """
+        data = None
+        
+        # Parse element using configuration-driven approach
+        if element_type == 'record':
+            record_type = element.get('type', '')
+            
+            # Single lookup for the category, parser, measurement and validation rules
+            dispatch = self._record_dispatch.get(record_type)
+            
+            if dispatch:
+                plan, parse = dispatch
+                data = parse(element)
+                
+                if data:
+                    # Override measurement name with config
+                    data['measurement'] = plan.measurement_name
+                    
+                    # Validate data if enabled for this category
+                    if plan.validation_enabled:
+                        if not validate:
+                            return data
+                        
+                        validation_result = self.validator.validate_data_point(data, plan)
+                        if validation_result.is_valid:
+                            self.total_stats[plan.category] += 1
+                            
+                            # Log warnings if configured
+                            if self.config_manager.should_log_warnings():
+                                for warning in validation_result.warnings:
+                                    logging.warning(f"Data quality warning for {record_type}: {warning}")
+                            return data
+                        
+                        self.total_stats['validation_errors'] += 1
+                        if self.config_manager.should_log_warnings():
+                            for error in validation_result.errors:
+                                logging.warning(f"Validation error for {record_type}: {error}")
+                        return None
+                    
+                    # Skip validation, add directly
+                    self.total_stats[plan.category] += 1
+                    return data
+            else:
+                # Unknown data type - log for configuration improvement
+                self.total_stats['unknown_types'] += 1
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug(f"Unknown data type not in config: {record_type}")
+            
+            return None
+        
+        if element_type == 'workout':
+            # Workouts are categorized as 'workouts' in the comprehensive config
+            category = self.config_manager.find_measurement_category('HKWorkoutTypeIdentifier')
+            if not category:
+                category = 'workouts'  # Default fallback
+                
+            data = self.parser.parse_workout(element)
+            if data:
+                # Override measurement name with config
+                config = self.config_manager.get_measurement_config(category)
+                if config:
+                    data['measurement'] = config.measurement_name
+                    
+                # Validate if enabled for this category
+                if self.config_manager.is_validation_enabled(category):
+                    if not validate:
+                        return data
+                    
+                    validation_result = self.validator.validate_data_point(data)
+                    if not validation_result.is_valid:
+                        self.total_stats['validation_errors'] += 1
+                        return None
+                
+                self.total_stats[category] += 1
+            
+            return data
+        
+        if element_type == 'activity':
+            # Activity summaries are categorized as 'workouts' in the comprehensive config
+            category = self.config_manager.find_measurement_category('HKActivitySummary')
+            if not category:
+                category = 'workouts'  # Default fallback
+                
+            data = self.parser.parse_activity(element)
+            if data:
+                # Override measurement name with config
+                config = self.config_manager.get_measurement_config(category)
+                if config:
+                    data['measurement'] = config.measurement_name
+                    
+                self.total_stats[category] += 1
+            
+            return data
+        
+        return None
+    
+    def validate_batch(self, batch: ColumnarBatch) -> ColumnarBatch:
+        """Validate the points ``convert_element(validate=False)`` deferred.
+        
+        Updates category and validation counters and returns the batch without
+        the invalid points.
+        """
+        result = self.validator.validate_batch(batch, self._validation_plans)
+        
+        for key, columns in batch.series.items():
+            category = self._validation_categories.get(columns.data_type)
+            if category is None:
+                continue
+            invalid = result.invalid.get(key, 0)
+            self.total_stats[category] += len(columns) - invalid
+            self.total_stats['validation_errors'] += invalid
+        
+        # Workout validation messages were never logged per point
+        if self.config_manager.should_log_warnings():
+            for data_type, warning in result.warning_messages:
+                if data_type != self.WORKOUT_TYPE:
+                    logging.warning(f"Data quality warning for {data_type}: {warning}")
+            for data_type, error in result.error_messages:
+                if data_type != self.WORKOUT_TYPE:
+                    logging.warning(f"Validation error for {data_type}: {error}")
+        
+        return batch.apply_masks(result.masks) if result.masks else batch
+    
+    def process_batch(self, batch_data: Union[ColumnarBatch, List[Dict]], incremental: bool = False) -> Dict:
+        """Process a batch of data points (a ColumnarBatch or a list of point dicts)."""
         if not batch_data:
             return {'written': 0, 'duplicates': 0, 'errors': 0}
         
+        if isinstance(batch_data, ColumnarBatch):
+            return self._process_columnar_batch(batch_data, incremental)
+        
         # Filter for incremental import
         if incremental:
-            # Get all configured measurement names
-            measurement_names = set()
-            for config in self.config_manager.get_all_measurement_configs().values():
-                measurement_names.add(config.measurement_name)
-            
             filtered_points = []
             for point in batch_data:
-                measurement = point.get('measurement', '')
-                
-                # Check if this measurement should be imported based on timestamp
-                if measurement in measurement_names:
-                    if self.tracker.should_import_record(point['time'], measurement):
-                        filtered_points.append(point)
-                else:
-                    # Unknown measurement, include it (could be legacy data)
+                cutoff = self._incremental_cutoff(point.get('type', ''), point.get('measurement', ''))
+                if cutoff is None or point_time_ns(point) > cutoff:
                     filtered_points.append(point)
             
             all_points = filtered_points
@@ -233,230 +492,504 @@ class StreamingHealthDataProcessor:
         # Write batch to InfluxDB with per-batch duplicate detection
         return self.influxdb.write_points_batch_streaming(all_points)
     
+    def _process_columnar_batch(self, batch: ColumnarBatch, incremental: bool = False) -> Dict:
+        """Filter a ColumnarBatch for incremental import and write it."""
+        if incremental:
+            batch = batch.filter_after(
+                lambda columns: self._incremental_cutoff(columns.data_type, columns.measurement))
+        
+        if not batch:
+            return {'written': 0, 'duplicates': 0, 'errors': 0}
+        
+        # Write batch to InfluxDB with per-batch duplicate detection
+        return self.influxdb.write_batch_streaming(batch)
+    
     def process_file_streaming(self, file_path: str, incremental: bool = False, 
-                             preview: bool = False, force: bool = False) -> Dict:
-        """Process large XML file in streaming fashion."""
+                             preview: bool = False, force: bool = False,
+                             count_elements: bool = False, changed_days: bool = False) -> Dict:
+        """Process large XML file in streaming fashion.
+        
+        The export is read exactly once; progress and ETA are derived from the
+        byte offset of the reader. Set ``count_elements`` to run the optional
+        counting pre-pass and log element totals before importing.
+        
+        Batches are written by ``write_workers`` background threads, so parsing
+        continues while writes are in flight. Checkpoints are saved once a
+        batch and every batch before it have been written and record the byte
+        offset of an element boundary before the written data, so a resumed
+        import seeks there instead of re-parsing the export.
+        
+        With ``changed_days`` only the (type, day) buckets whose digest
+        differs from the last import's manifest are written; see ``DayBuckets``.
+        """
         file_hash = self.tracker.get_file_hash(file_path)
         
         # Check if we can resume
         resume_position = None
+        start_offset, start_counts, skip_elements = 0, None, 0
         if not force and self.checkpoint.can_resume(file_hash):
-            resume_position = self.checkpoint.get_resume_position()
-            self.total_stats = self.checkpoint.get_resume_stats()
-            logging.info(f"Resuming import from: Records={resume_position['records']}, "
-                        f"Workouts={resume_position['workouts']}, Activities={resume_position['activities']}")
+            # Older checkpoints lack some categories; they keep their zero counts
+            self.total_stats.update(self.checkpoint.get_resume_stats())
+            resume_offset = self.checkpoint.get_resume_offset()
+            if resume_offset:
+                start_offset, start_counts, skip_elements = resume_offset
+                logging.info(f"Resuming import at byte {start_offset:,} "
+                            f"(Records={start_counts['records']}, Workouts={start_counts['workouts']}, "
+                            f"Activities={start_counts['activities']}, skipping {skip_elements} written elements)")
+            else:
+                # Checkpoint without an offset: re-parse and skip by count
+                resume_position = self.checkpoint.get_resume_position()
+                logging.info(f"Resuming import from: Records={resume_position['records']}, "
+                            f"Workouts={resume_position['workouts']}, Activities={resume_position['activities']}")
         elif not force and self.tracker.is_file_already_imported(file_path):
             logging.info(f"File {file_path} was already imported. Use --force to import again.")
             return self.total_stats
         
-        # Count elements for progress tracking
-        element_counts = self.count_xml_elements(file_path)
-        total_elements = sum(element_counts.values())
+        # Optional pre-pass; doubles the amount of XML parsed, so it is opt-in
+        if count_elements:
+            element_counts = self.count_xml_elements(file_path)
+            logging.info(f"Export contains {sum(element_counts.values())} elements")
+        
+        if preview:
+            logging.info("PREVIEW MODE - Processing first batch only")
+        
+        self._prepare_run_filter(incremental)
+        element_filter = self.element_filter if preview else self._run_filter
         
-        if resume_position:
-            processed_elements = sum(resume_position.values())
-            remaining_elements = total_elements - processed_elements
+        # With a type or time filter and an index from --build-index only the blocks it needs are read
+        ranges = None
+        if not start_offset and not resume_position:
+            ranges = self._index_ranges(file_path, file_hash, element_filter)
+        
+        if ranges is not None:
+            # Checkpoints need contiguous reads; filtered imports touch little of the export
+            logging.info("Reading through the export index; no checkpoints are saved")
+            reader = BlockReader(file_path, ranges)
         else:
-            processed_elements = 0
-            remaining_elements = total_elements
+            tag_counts = None
+            if start_counts:
+                tag_counts = {tag: start_counts.get(key, 0) for tag, key in self.COUNT_KEYS.items()}
+            reader = ExportReader(file_path, start_offset=start_offset, start_counts=tag_counts,
+                                  track_boundaries=not preview)
+        logging.info(f"Processing {reader.total_size / (1024 * 1024):.1f} MB ({reader.format}) in streaming mode")
         
-        logging.info(f"Processing {remaining_elements} remaining elements in streaming mode")
+        # Progress is measured in bytes consumed, so tqdm's rate and ETA are bytes/sec
+        progress_bar = tqdm(total=reader.total_size,
+                          initial=reader.progress,
+                          desc="Processing export",
+                          unit="B",
+                          unit_scale=True,
+                          unit_divisor=1024)
         
-        if preview:
-            logging.info("PREVIEW MODE - Processing first batch only")
+        # Tag values are interned once per run and shared by every batch
+        strings = StringTable()
+        batch_data = ColumnarBatch(strings)
+        processed_counts = {'records': 0, 'workouts': 0, 'activities': 0}
+        processed_counts.update(resume_position or start_counts or {})
+        
+        # Counts and stats as of the last acknowledged batch; checkpoints never run ahead of them
+        self._reset_write_progress(processed_counts.copy())
+        last_checkpoint = sum(processed_counts.values())
+        elements_seen = 0
+        
+        # Batches are written on background threads while parsing continues
+        writer = None if preview else self._start_writer(incremental)
         
-        # Initialize progress bar
-        progress_bar = tqdm(total=remaining_elements, 
-                          initial=processed_elements,
-                          desc="Processing elements", 
-                          unit="elements")
+        # Points held back until their day can be compared with the last import
+        day_buckets = None
+        if changed_days and not preview:
+            day_buckets = self._day_buckets = DayBuckets(self.tracker.get_day_digests(self.influxdb.target))
         
-        batch_data = []
-        processed_counts = resume_position.copy() if resume_position else {'records': 0, 'workouts': 0, 'activities': 0}
-        last_checkpoint = processed_elements
+        def position_before_element() -> Dict:
+            before = processed_counts.copy()
+            before[self.POSITION_KEYS[element_type]] -= 1
+            return before
         
+        parse_started = time.thread_time()
         try:
             # Stream and process elements
-            for element_type, element, position in self.stream_xml_elements(file_path, resume_position):
-                data = None
+            for element_type, element, position in self.stream_xml_elements(reader, resume_position, start_counts):
+                processed_counts[self.POSITION_KEYS[element_type]] = position
+                
+                # Elements between the checkpoint offset and the last written batch
+                if skip_elements:
+                    skip_elements -= 1
+                    continue
+                
+                # Unwanted types and times are dropped before any parsing
+                if element_filter and not element_filter.accepts(element):
+                    self.total_stats['filtered'] += 1
+                    continue
                 
                 try:
-                    # Parse element using configuration-driven approach
-                    if element_type == 'record':
-                        record_type = element.get('type', '')
-                        data = None
-                        
-                        # Find the measurement category for this data type
-                        category = self.config_manager.find_measurement_category(record_type)
-                        
-                        if category:
-                            # Use appropriate parser based on record type prefix
-                            if record_type.startswith('HKQuantityType') or record_type.startswith('HKDataType'):
-                                data = self.parser.parse_generic_quantity(element)
-                            elif record_type.startswith('HKCategoryType'):
-                                data = self.parser.parse_category(element)
-                            else:
-                                # Fallback to legacy parsers for backward compatibility
-                                if 'HeartRate' in record_type:
-                                    data = self.parser.parse_heart_rate(element)
-                                elif any(energy_type in record_type for energy_type in ['EnergyBurned', 'StepCount']):
-                                    data = self.parser.parse_calories(element)
-                                elif 'Sleep' in record_type:
-                                    data = self.parser.parse_sleep(element)
-                                else:
-                                    # Use generic quantity parser as fallback
-                                    data = self.parser.parse_generic_quantity(element)
-                            
-                            if data:
-                                # Override measurement name with config
-                                config = self.config_manager.get_measurement_config(category)
-                                if config:
-                                    data['measurement'] = config.measurement_name
-                                
-                                # Validate data if enabled for this category
-                                if self.config_manager.is_validation_enabled(category):
-                                    validation_result = self.validator.validate_data_point(data)
-                                    if validation_result.is_valid:
-                                        batch_data.append(data)
-                                        self.total_stats[category] += 1
-                                        
-                                        # Log warnings if configured
-                                        if self.config_manager.should_log_warnings():
-                                            for warning in validation_result.warnings:
-                                                logging.warning(f"Data quality warning for {record_type}: {warning}")
-                                    else:
-                                        self.total_stats['validation_errors'] += 1
-                                        if self.config_manager.should_log_warnings():
-                                            for error in validation_result.errors:
-                                                logging.warning(f"Validation error for {record_type}: {error}")
-                                else:
-                                    # Skip validation, add directly
-                                    batch_data.append(data)
-                                    self.total_stats[category] += 1
+                    # Validation is deferred to whole batches, except in preview
+                    # mode, which stops after the first 100 valid points
+                    data = self.convert_element(element_type, element, validate=preview)
+                    if data:
+                        if day_buckets is not None:
+                            batch_data.extend(day_buckets.add(data, position_before_element))
                         else:
-                            # Unknown data type - log for configuration improvement
-                            self.total_stats['unknown_types'] += 1
-                            if logging.getLogger().isEnabledFor(logging.DEBUG):
-                                logging.debug(f"Unknown data type not in config: {record_type}")
-                        
-                        processed_counts['records'] = position
-                    
-                    elif element_type == 'workout':
-                        # Workouts are categorized as 'workouts' in the comprehensive config
-                        category = self.config_manager.find_measurement_category('HKWorkoutTypeIdentifier')
-                        if not category:
-                            category = 'workouts'  # Default fallback
-                            
-                        data = self.parser.parse_workout(element)
-                        if data:
-                            # Override measurement name with config
-                            config = self.config_manager.get_measurement_config(category)
-                            if config:
-                                data['measurement'] = config.measurement_name
-                                
-                            # Validate if enabled for this category
-                            if self.config_manager.is_validation_enabled(category):
-                                validation_result = self.validator.validate_data_point(data)
-                                if validation_result.is_valid:
-                                    batch_data.append(data)
-                                    self.total_stats[category] += 1
-                                else:
-                                    self.total_stats['validation_errors'] += 1
-                            else:
-                                batch_data.append(data)
-                                self.total_stats[category] += 1
-                        
-                        processed_counts['workouts'] = position
-                    
-                    elif element_type == 'activity':
-                        # Activity summaries are categorized as 'workouts' in the comprehensive config
-                        category = self.config_manager.find_measurement_category('HKActivitySummary')
-                        if not category:
-                            category = 'workouts'  # Default fallback
-                            
-                        data = self.parser.parse_activity(element)
-                        if data:
-                            # Override measurement name with config
-                            config = self.config_manager.get_measurement_config(category)
-                            if config:
-                                data['measurement'] = config.measurement_name
-                                
                             batch_data.append(data)
-                            self.total_stats[category] += 1
-                        
-                        processed_counts['activities'] = position
-                    
                 except Exception as e:
                     logging.error(f"Error processing {element_type}: {e}")
                     self.total_stats['errors'] += 1
                 
-                progress_bar.update(1)
+                elements_seen += 1
+                if elements_seen % self.PROGRESS_UPDATE_INTERVAL == 0:
+                    progress_bar.update(reader.progress - progress_bar.n)
                 
                 # Process batch when it reaches target size
                 if len(batch_data) >= self.process_batch_size:
                     if not preview:
-                        batch_stats = self.process_batch(batch_data, incremental)
-                        self.total_stats['written'] += batch_stats['written']
-                        self.total_stats['duplicates'] += batch_stats['duplicates']
-                        self.total_stats['errors'] += batch_stats['errors']
+                        # A checkpoint must not pass points that are still held back
+                        position = day_buckets.held_position() if day_buckets is not None else None
+                        self._submit_write(writer, self.validate_batch(batch_data), position or processed_counts.copy())
+                        self._acknowledge_writes(writer)
+                        
+                        # Save checkpoint periodically
+                        current_processed = sum(self._flushed_position.values())
+                        if current_processed - last_checkpoint >= self.checkpoint_interval:
+                            self._save_streaming_checkpoint(file_hash, reader, self._flushed_position, self._flushed_stats)
+                            last_checkpoint = current_processed
                     
-                    batch_data = []  # Clear batch to free memory
-                
-                # Save checkpoint periodically
-                current_processed = sum(processed_counts.values())
-                if current_processed - last_checkpoint >= self.checkpoint_interval:
-                    if not preview:
-                        self.checkpoint.save_checkpoint(file_hash, processed_counts, self.total_stats)
-                    last_checkpoint = current_processed
+                    batch_data = ColumnarBatch(strings)  # Start a new batch to free memory
                 
                 # Preview mode - process only first batch
                 if preview:
                     total_processed = sum(self.total_stats[key] for key in self.total_stats 
-                                        if key not in ['errors', 'written', 'duplicates', 'validation_errors', 'unknown_types'])
+                                        if key not in self.NON_CATEGORY_STATS)
                     if total_processed >= 100:
                         break
             
-            # Process remaining batch
-            if batch_data and not preview:
-                batch_stats = self.process_batch(batch_data, incremental)
-                self.total_stats['written'] += batch_stats['written']
-                self.total_stats['duplicates'] += batch_stats['duplicates']
-                self.total_stats['errors'] += batch_stats['errors']
+            # Process remaining batch and wait for all writes
+            if not preview:
+                if day_buckets is not None:
+                    batch_data.extend(day_buckets.flush())
+                    self.total_stats['unchanged'] = day_buckets.unchanged
+                    logging.info(f"Skipped {day_buckets.unchanged} points of days unchanged since the last import")
+                if batch_data:
+                    self._submit_write(writer, self.validate_batch(batch_data), processed_counts.copy())
+                self._acknowledge_writes(writer, wait=True)
             
-            progress_bar.close()
+            progress_bar.update(reader.progress - progress_bar.n)
+            self._record_read_times(reader, parse_started)
+            self.total_stats['tag_values'] = len(strings)
+            self.total_stats['string_tables'] = 1
+            
+            self.element_counts = processed_counts.copy()
+            logging.info(f"Parsed {processed_counts['records']} records, {processed_counts['workouts']} workouts, "
+                        f"{processed_counts['activities']} activities")
             
             if not preview:
-                # Update import tracking
-                if self.total_stats['written'] > 0:
-                    # We'll need to recreate data_points structure for tracker
-                    data_points = self._create_data_points_for_tracker()
-                    self.tracker.update_last_timestamps(data_points)
-                    self.tracker.record_file_import(file_path, self.total_stats)
-                
-                # Clear checkpoint on successful completion
-                self.checkpoint.clear_checkpoint()
+                self._finish_import(file_path, day_buckets)
             
             return self.total_stats
             
         except KeyboardInterrupt:
             logging.info("Import interrupted by user. Progress has been saved.")
             if not preview:
-                self.checkpoint.save_checkpoint(file_hash, processed_counts, self.total_stats)
+                self._settle_writes(writer)
+                self._save_streaming_checkpoint(file_hash, reader, self._flushed_position, self._flushed_stats)
             raise
         except Exception as e:
             logging.error(f"Error during streaming processing: {e}")
             if not preview:
-                self.checkpoint.save_checkpoint(file_hash, processed_counts, self.total_stats)
+                self._settle_writes(writer)
+                self._save_streaming_checkpoint(file_hash, reader, self._flushed_position, self._flushed_stats)
             raise
+        finally:
+            if writer:
+                writer.close()
+            progress_bar.close()
+            reader.close()
+    
+    def _record_read_times(self, reader: Any, parse_started: float) -> None:
+        """Add the run's I/O wait and parsing thread CPU time to the stats."""
+        io_wait = getattr(reader, 'io_wait_seconds', 0.0)
+        parse_seconds = time.thread_time() - parse_started
+        self.total_stats['io_wait_seconds'] += io_wait
+        self.total_stats['parse_seconds'] += parse_seconds
+        logging.info(f"Parsing thread: {parse_seconds:.1f}s CPU, {io_wait:.1f}s waiting for the export to be read")
     
-    def _create_data_points_for_tracker(self) -> Dict:
-        """Create minimal data points structure for timestamp tracking."""
-        # This is a simplified version just for timestamp tracking
-        # In a real scenario, we'd need to track the latest timestamps during processing
-        data_points = {}
+    def _load_incremental_cutoffs(self) -> None:
+        """Read the high-water marks an incremental import filters against.
         
-        # Initialize with all configured categories
-        for category in self.config_manager.get_all_measurement_configs().keys():
-            data_points[category] = []
+        Types are compared with their own mark. Histories written before
+        per-type marks existed only have per-measurement times, which are used
+        instead; unknown measurements are kept (could be legacy data).
+        """
+        self._type_cutoffs = self.tracker.get_type_watermarks()
+        self._measurement_cutoffs = {}
+        if not self._type_cutoffs:
+            for config in self.config_manager.get_all_measurement_configs().values():
+                last_import = self.tracker.get_last_import_time(config.measurement_name)
+                if last_import is not None:
+                    self._measurement_cutoffs[config.measurement_name] = to_epoch_ns(last_import)
+    
+    def _incremental_cutoff(self, data_type: str, measurement: str) -> Optional[int]:
+        """Epoch-ns time a point must be newer than to be imported incrementally."""
+        if self._type_cutoffs is None:
+            self._load_incremental_cutoffs()
+        if self._type_cutoffs:
+            return self._type_cutoffs.get(data_type)
+        return self._measurement_cutoffs.get(measurement)
+    
+    def _prepare_run_filter(self, incremental: bool) -> None:
+        """Set the element filter of a run: ``element_filter`` plus incremental watermarks."""
+        self._run_filter = self.element_filter
+        if incremental:
+            self._load_incremental_cutoffs()
+            if self._type_cutoffs:
+                self._run_filter = (self.element_filter or ElementFilter()).with_watermarks(self._type_cutoffs)
+    
+    def _index_ranges(self, file_path: str, file_hash: str, element_filter: Optional[ElementFilter],
+                      max_range_bytes: Optional[int] = None) -> Optional[List[Tuple[int, int]]]:
+        """Byte ranges of a plain export the element filter needs, from its stored index.
+        
+        Returns None when every block has to be read anyway: no filter, a
+        compressed export, or no index. Indexes are only built by --build-index.
+        """
+        if not element_filter or is_compressed_export(file_path):
+            return None
+        
+        index = ExportIndex.load(file_path, file_hash)
+        if index is None:
+            return None
+        
+        ranges = index.select(element_filter.may_accept, max_range_bytes)
+        selected = sum(end - start for start, end in ranges)
+        logging.info(f"Export index: reading {selected / (1024 * 1024):.1f} of "
+                    f"{index.total_bytes / (1024 * 1024):.1f} MB in {len(ranges)} ranges")
+        return ranges
+    
+    def _start_writer(self, incremental: bool) -> WriteBehindPipeline:
+        """Start the background writer threads for an import."""
+        return WriteBehindPipeline(lambda batch: self.process_batch(batch, incremental),
+                                   workers=self.write_workers)
+    
+    def _reset_write_progress(self, position: Any) -> None:
+        """Start tracking acknowledged writes from ``position``."""
+        self._write_totals = {key: 0 for key in self.WRITE_STAT_KEYS}
+        self._flushed_position = position
+        self._flushed_stats = self.total_stats.copy()
+        self._latest_times: Dict[Tuple[str, str], int] = {}  # Written (measurement, type) -> epoch ns
+        self._failed_times: Dict[Tuple[str, str], int] = {}  # Earliest time in a failed batch, per series
+        self._failed_writes = 0  # Batches acknowledged with write errors
+        self._failed_buckets: Set[Tuple[str, str]] = set()  # (type, day) buckets of failed batches
+        self._day_buckets: Optional[DayBuckets] = None
+    
+    def _submit_write(self, writer: WriteBehindPipeline, batch: Any, position: Any = None) -> None:
+        """Queue a batch for writing.
+        
+        ``position`` is where a checkpoint may resume once this batch and all
+        batches before it are written (None if the batch ends no position).
+        """
+        ranges, buckets = {}, None
+        if isinstance(batch, ColumnarBatch):
+            ranges = batch.time_ranges()
+            if self._day_buckets is not None:
+                buckets = self._day_buckets.buckets_of(batch)
+        writer.submit(batch, (position, self.total_stats.copy(), self._write_totals.copy(), ranges, buckets))
+    
+    def _acknowledge_writes(self, writer: WriteBehindPipeline, wait: bool = False) -> None:
+        """Fold completed writes into the stats in order and advance the flushed position."""
+        while True:
+            for (position, stats, totals_at_submit, ranges, buckets), batch_stats in writer.acknowledged(wait):
+                for key in self.WRITE_STAT_KEYS:
+                    value = batch_stats.get(key, 0)
+                    self.total_stats[key] = self.total_stats.get(key, 0) + value
+                    self._write_totals[key] += value
+                    # The stats snapshot predates writes acknowledged since submission
+                    stats[key] = stats.get(key, 0) + self._write_totals[key] - totals_at_submit[key]
+                if batch_stats.get('wire_bytes'):
+                    logging.debug(f"Batch written: {batch_stats['written']} points, "
+                                  f"{batch_stats['wire_bytes']} bytes on the wire")
+                # High-water marks advance past batches written without errors and
+                # are held below the points of failed ones in _finish_import
+                if batch_stats.get('errors'):
+                    self._failed_writes += 1
+                    self._failed_buckets.update(buckets or ())
+                    for key, (first, _) in ranges.items():
+                        if key not in self._failed_times or first < self._failed_times[key]:
+                            self._failed_times[key] = first
+                else:
+                    for key, (_, last) in ranges.items():
+                        if key not in self._latest_times or last > self._latest_times[key]:
+                            self._latest_times[key] = last
+                
+                # Checkpoints stop before the first failed batch, so a resumed import writes it again
+                if position is not None and not self._failed_writes:
+                    self._flushed_position, self._flushed_stats = position, stats
+            
+            if not wait or not writer.pending:
+                return
+    
+    def _settle_writes(self, writer: Optional[WriteBehindPipeline]) -> None:
+        """Acknowledge whatever has been written before saving a checkpoint on failure."""
+        if writer is None:
+            return
+        try:
+            self._acknowledge_writes(writer)
+        except Exception:
+            pass  # Failed writes were logged by the writer thread
+    
+    def _save_streaming_checkpoint(self, file_hash: str, reader: ExportReader,
+                                   flushed_counts: Dict, flushed_stats: Dict) -> None:
+        """Checkpoint the written position as a byte offset plus elements to skip after it."""
+        if reader.boundaries is None:
+            return  # Reads through the export index are not contiguous
+        elements_done = sum(flushed_counts.values())
+        offset, tag_counts = reader.boundaries.resume_point(elements_done)
+        offset_counts = {self.COUNT_KEYS[tag]: count for tag, count in tag_counts.items()}
+        self.checkpoint.save_checkpoint(
+            file_hash, flushed_counts, flushed_stats,
+            byte_offset=offset,
+            offset_counts=offset_counts,
+            skip_elements=elements_done - sum(offset_counts.values())
+        )
+    
+    def process_file_parallel(self, file_path: str, jobs: int, incremental: bool = False,
+                              force: bool = False, changed_days: bool = False) -> Dict:
+        """Process an export with ``jobs`` worker processes parsing byte ranges.
+        
+        The export is split at top-level element boundaries. Workers parse, map
+        and validate their ranges; this process merges the statistics and queues
+        the returned points for the writer threads in file order.
+        """
+        file_hash = self.tracker.get_file_hash(file_path)
+        
+        if not force and self.checkpoint.can_resume(file_hash):
+            logging.info("Checkpoint found; resuming in single-process streaming mode")
+            return self.process_file_streaming(file_path, incremental=incremental, force=force, changed_days=changed_days)
+        elif not force and self.tracker.is_file_already_imported(file_path):
+            logging.info(f"File {file_path} was already imported. Use --force to import again.")
+            return self.total_stats
+        
+        if changed_days:
+            # Day buckets follow the export order, which workers do not share
+            logging.info("Changed-days import needs the whole export in order; using single-process streaming mode")
+            return self.process_file_streaming(file_path, incremental=incremental, force=force, changed_days=True)
+        
+        if is_compressed_export(file_path):
+            # Byte ranges need random access into the XML, which compressed streams lack
+            logging.info("Compressed export cannot be split into byte ranges; using single-process streaming mode")
+            return self.process_file_streaming(file_path, incremental=incremental, force=force)
+        
+        file_size = Path(file_path).stat().st_size
+        self._prepare_run_filter(incremental)
+        ranges = self._index_ranges(file_path, file_hash, self._run_filter,
+                                    max_range_bytes=self.PARALLEL_RANGE_BYTES)
+        if ranges is None:
+            num_ranges = max(jobs, -(-file_size // self.PARALLEL_RANGE_BYTES))
+            ranges = split_export_ranges(file_path, num_ranges)
+        logging.info(f"Parsing {file_size / (1024 * 1024):.1f} MB in {len(ranges)} ranges with {jobs} worker processes")
+        
+        progress_bar = tqdm(total=file_size,
+                          desc="Processing export",
+                          unit="B",
+                          unit_scale=True,
+                          unit_divisor=1024)
+        
+        processed_counts = {'records': 0, 'workouts': 0, 'activities': 0}
+        last_checkpoint = 0
+        
+        # End offset and counts of the last range whose points have all been written
+        self._reset_write_progress((0, processed_counts.copy()))
+        writer = self._start_writer(incremental)
+        
+        range_parser = ParallelRangeParser(
+            file_path,
+            jobs=jobs,
+            timezone=self.parser.timezone.zone,
+            measurements_config_path=str(self.config_manager.config_path),
+            engine=self.engine,
+            process_batch_size=self.process_batch_size,
+            element_filter=self._run_filter
+        )
+        
+        try:
+            for result in range_parser.iter_results(ranges):
+                for key, value in result['stats'].items():
+                    self.total_stats[key] = self.total_stats.get(key, 0) + value
+                self.validator.merge_stats(result['validation'])
+                for key, value in result['counts'].items():
+                    processed_counts[key] += value
+                
+                # Ranges complete in file order and end on element boundaries,
+                # so the end of a written range is a sequential resume offset.
+                # An empty batch still carries the position of a range without points.
+                batches = result['batches'] or [ColumnarBatch()]
+                for batch in batches[:-1]:
+                    self._submit_write(writer, batch)
+                self._submit_write(writer, batches[-1], (result['end'], processed_counts.copy()))
+                self._acknowledge_writes(writer)
+                
+                progress_bar.update(result['end'] - progress_bar.n)
+                
+                current_processed = sum(self._flushed_position[1].values())
+                if current_processed - last_checkpoint >= self.checkpoint_interval:
+                    self._save_parallel_checkpoint(file_hash)
+                    last_checkpoint = current_processed
+            
+            self._acknowledge_writes(writer, wait=True)
+            progress_bar.update(file_size - progress_bar.n)
+            
+            self.element_counts = processed_counts.copy()
+            logging.info(f"Parsed {processed_counts['records']} records, {processed_counts['workouts']} workouts, "
+                        f"{processed_counts['activities']} activities")
+            
+            self._finish_import(file_path)
+            return self.total_stats
+            
+        except KeyboardInterrupt:
+            logging.info("Import interrupted by user. Progress has been saved.")
+            self._settle_writes(writer)
+            self._save_parallel_checkpoint(file_hash)
+            raise
+        except Exception as e:
+            logging.error(f"Error during parallel processing: {e}")
+            self._settle_writes(writer)
+            self._save_parallel_checkpoint(file_hash)
+            raise
+        finally:
+            writer.close()
+            progress_bar.close()
+            range_parser.close()
+    
+    def _save_parallel_checkpoint(self, file_hash: str) -> None:
+        """Checkpoint the end of the last fully written range."""
+        offset, counts = self._flushed_position
+        self.checkpoint.save_checkpoint(file_hash, counts, self._flushed_stats,
+                                        byte_offset=offset, offset_counts=counts)
+    
+    def _finish_import(self, file_path: str, day_buckets: Optional[DayBuckets] = None) -> None:
+        """Record a completed import and clear the checkpoint."""
+        # Days with failed writes keep their old digests, so the next run writes them again
+        if day_buckets is not None:
+            self.tracker.update_day_digests(self.influxdb.target, day_buckets.manifest(exclude=self._failed_buckets))
+        
+        # Update import tracking
+        if self.total_stats['written'] > 0:
+            type_watermarks: Dict[str, int] = {}
+            measurement_watermarks: Dict[str, int] = {}
+            for (measurement, data_type), time_ns in self._latest_times.items():
+                type_watermarks[data_type] = max(time_ns, type_watermarks.get(data_type, time_ns))
+                measurement_watermarks[measurement] = max(time_ns, measurement_watermarks.get(measurement, time_ns))
             
-        return data_points
\ No newline at end of file
+            # Points of failed batches stay after the marks, so incremental runs retry them
+            for (measurement, data_type), first in self._failed_times.items():
+                if data_type in type_watermarks:
+                    type_watermarks[data_type] = min(type_watermarks[data_type], first - 1)
+                if measurement in measurement_watermarks:
+                    measurement_watermarks[measurement] = min(measurement_watermarks[measurement], first - 1)
+            self.tracker.update_watermarks(type_watermarks, measurement_watermarks)
+            
+            # A file with failed writes is not recorded, so it can be imported again without --force
+            if self._failed_writes:
+                logging.warning(f"{self._failed_writes} batches had write errors; "
+                                f"{Path(file_path).name} is not recorded as imported")
+            else:
+                self.tracker.record_file_import(file_path, self.total_stats)
+        
+        # Clear checkpoint on successful completion
+        self.checkpoint.clear_checkpoint()
@@ -3,10 +3,13 @@
 import json
 import logging
 import os
+import tempfile
 from datetime import datetime, timezone
-from typing import Dict, Optional, Set
+from typing import Dict, Optional, Set, Union
 from pathlib import Path
 
+from ..parsers.batch import format_local_time, to_epoch_ns
+
 
 class ImportTracker:
     """Tracks import history for incremental imports."""
@@ -14,6 +17,9 @@ class ImportTracker:
     def __init__(self, tracker_file: str = "import_history.json"):
         self.tracker_file = Path(tracker_file)
         self.import_history = self._load_history()
+        
+        # Per-(type, day) content digests for each InfluxDB target, kept beside the history file
+        self.manifest_file = self.tracker_file.with_name("import_manifest.json")
     
     def _load_history(self) -> Dict:
         """Load import history from file."""
@@ -25,7 +31,8 @@ class ImportTracker:
                     'heartrate_bpm': None,
                     'energy_kcal': None,
                     'sleep_duration_min': None
-                }
+                },
+                'type_watermarks': {}
             }
         
         try:
@@ -38,6 +45,7 @@ class ImportTracker:
                         'energy_kcal': None,
                         'sleep_duration_min': None
                     }
+                history.setdefault('type_watermarks', {})
                 return history
         except Exception as e:
             logging.warning(f"Could not load import history: {e}. Starting fresh.")
@@ -48,7 +56,8 @@ class ImportTracker:
                     'heartrate_bpm': None,
                     'energy_kcal': None,
                     'sleep_duration_min': None
-                }
+                },
+                'type_watermarks': {}
             }
     
     def _save_history(self) -> None:
@@ -97,17 +106,35 @@ class ImportTracker:
                 logging.warning(f"Invalid timestamp format for {measurement}: {timestamp_str}")
         return None
     
-    def should_import_record(self, record_time: str, measurement: str) -> bool:
-        """Check if a record should be imported based on timestamp."""
+    def get_last_import_ns(self, measurement: str) -> Optional[int]:
+        """Get the last import timestamp for a measurement as epoch nanoseconds."""
+        last_import = self.get_last_import_time(measurement)
+        if last_import is None:
+            return None
         try:
-            record_dt = datetime.fromisoformat(record_time.replace('Z', '+00:00'))
-            last_import = self.get_last_import_time(measurement)
+            return to_epoch_ns(last_import)
+        except TypeError:
+            logging.warning(f"Timestamp without UTC offset for {measurement}: {last_import}")
+            return None
+    
+    def should_import_record(self, record_time: Union[int, str], measurement: str,
+                             last_import_ns: Optional[int] = None) -> bool:
+        """Check if a record (epoch-ns time or ISO string) should be imported based on timestamp.
+        
+        Pass ``last_import_ns`` to compare against an already looked-up cutoff.
+        """
+        try:
+            if last_import_ns is None:
+                last_import_ns = self.get_last_import_ns(measurement)
             
-            if last_import is None:
+            if last_import_ns is None:
                 return True  # No previous import, import everything
             
+            if not isinstance(record_time, int):
+                record_time = to_epoch_ns(datetime.fromisoformat(record_time.replace('Z', '+00:00')))
+            
             # Import if record is newer than last import
-            return record_dt > last_import
+            return record_time > last_import_ns
             
         except Exception as e:
             logging.warning(f"Error checking import timestamp: {e}")
@@ -127,26 +154,15 @@ class ImportTracker:
         
         skipped_counts = {'vitals': 0, 'activity': 0, 'sleep': 0}
         
-        # Filter vitals (heart rate)
-        for point in data_points.get('vitals', []):
-            if self.should_import_record(point['time'], 'heartrate_bpm'):
-                filtered_points['vitals'].append(point)
-            else:
-                skipped_counts['vitals'] += 1
-        
-        # Filter activity (energy and workouts)
-        for point in data_points.get('activity', []):
-            if self.should_import_record(point['time'], 'energy_kcal'):
-                filtered_points['activity'].append(point)
-            else:
-                skipped_counts['activity'] += 1
-        
-        # Filter sleep
-        for point in data_points.get('sleep', []):
-            if self.should_import_record(point['time'], 'sleep_duration_min'):
-                filtered_points['sleep'].append(point)
-            else:
-                skipped_counts['sleep'] += 1
+        # Vitals are heart rate, activity is energy and workouts
+        for category, measurement in (('vitals', 'heartrate_bpm'), ('activity', 'energy_kcal'),
+                                      ('sleep', 'sleep_duration_min')):
+            last_import_ns = self.get_last_import_ns(measurement)
+            for point in data_points.get(category, []):
+                if self.should_import_record(point['time'], measurement, last_import_ns):
+                    filtered_points[category].append(point)
+                else:
+                    skipped_counts[category] += 1
         
         # Log filtering results
         total_skipped = sum(skipped_counts.values())
@@ -180,10 +196,78 @@ class ImportTracker:
         
         # Update history
         for measurement, timestamp in latest_timestamps.items():
+            if isinstance(timestamp, int):
+                timestamp = format_local_time(timestamp, 0)
             if timestamp:
                 self.import_history['last_timestamps'][measurement] = timestamp
                 logging.info(f"Updated last import timestamp for {measurement}: {timestamp}")
     
+    def get_type_watermarks(self) -> Dict[str, int]:
+        """Get the latest imported time per data type, as epoch nanoseconds."""
+        return dict(self.import_history['type_watermarks'])
+    
+    def update_watermarks(self, type_watermarks: Dict[str, int], measurement_watermarks: Dict[str, int]) -> None:
+        """Advance the per-type and per-measurement high-water marks (epoch ns).
+        
+        Marks only move forward; measurement marks are stored as UTC ISO
+        strings in ``last_timestamps``.
+        """
+        stored = self.import_history['type_watermarks']
+        for data_type, time_ns in type_watermarks.items():
+            if data_type not in stored or time_ns > stored[data_type]:
+                stored[data_type] = time_ns
+        
+        for measurement, time_ns in measurement_watermarks.items():
+            timestamp = format_local_time(time_ns, 0)
+            last_import = self.get_last_import_time(measurement)
+            if last_import is None or datetime.fromisoformat(timestamp) > last_import:
+                self.import_history['last_timestamps'][measurement] = timestamp
+                logging.info(f"Updated last import timestamp for {measurement}: {timestamp}")
+    
+    def _load_manifest(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """Load the digests of every target: ``{target: {type: {day: digest}}}``."""
+        if not self.manifest_file.exists():
+            return {}
+        try:
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            logging.warning(f"Could not load import manifest: {e}. Importing every day.")
+            return {}
+        if 'targets' not in manifest:
+            # Written before manifests named their target; its days may be in any database
+            logging.info("Import manifest has no InfluxDB target; importing every day")
+            return {}
+        return manifest['targets']
+    
+    def get_day_digests(self, target: str) -> Dict[str, Dict[str, str]]:
+        """Get the content digest of each data type per local day imported into ``target``:
+        ``{type: {day: digest}}``."""
+        return self._load_manifest().get(target, {})
+    
+    def update_day_digests(self, target: str, digests: Dict[str, Dict[str, str]]) -> None:
+        """Store the digests of the days an import wrote to ``target``; other days keep theirs."""
+        manifest = self._load_manifest()
+        target_digests = manifest.setdefault(target, {})
+        for data_type, days in digests.items():
+            target_digests.setdefault(data_type, {}).update(days)
+        
+        # Written to a temporary file and renamed, so an interrupted save keeps the old manifest
+        temp_path = None
+        try:
+            self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix=self.manifest_file.name + '.', suffix='.tmp',
+                                             dir=self.manifest_file.parent)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'targets': manifest}, f, separators=(',', ':'), sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.manifest_file)
+        except Exception as e:
+            logging.error(f"Could not save import manifest: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+    
     def record_file_import(self, file_path: str, stats: Dict) -> None:
         """Record successful import of a file."""
         abs_path = str(Path(file_path).resolve())
@@ -203,7 +287,8 @@ class ImportTracker:
         summary = {
             'total_files_imported': len(self.import_history['imported_files']),
             'last_import': self.import_history['last_import'],
-            'last_timestamps': self.import_history['last_timestamps'].copy()
+            'last_timestamps': self.import_history['last_timestamps'].copy(),
+            'type_watermarks': self.get_type_watermarks()
         }
         
         # Convert timestamp strings to readable format
@@ -225,9 +310,12 @@ class ImportTracker:
                 'heartrate_bpm': None,
                 'energy_kcal': None,
                 'sleep_duration_min': None
-            }
+            },
+            'type_watermarks': {}
         }
         self._save_history()
+        if self.manifest_file.exists():
+            self.manifest_file.unlink()
         logging.info("Import history has been reset")
     
     def show_history(self) -> None:
@@ -254,6 +342,11 @@ class ImportTracker:
             else:
                 print(f"  {measurement}: Never imported")
         
+        if summary['type_watermarks']:
+            print("\nLatest imported point by data type:")
+            for data_type, time_ns in sorted(summary['type_watermarks'].items()):
+                print(f"  {data_type}: {format_local_time(time_ns, 0)[:19].replace('T', ' ')}")
+        
         if self.import_history['imported_files']:
             print(f"\nImported files:")
             for file_path, info in self.import_history['imported_files'].items():
@@ -12,6 +12,9 @@ from threading import Lock
 import queue
 import multiprocessing
 
+from ..parsers.day_buckets import DayBuckets
+from ..parsers.engines import iter_health_elements, resolve_engine
+
 
 @dataclass
 class PerformanceMetrics:
@@ -129,55 +132,51 @@ class PerformanceOptimizer:
 class OptimizedXMLProcessor:
     """Optimized XML processor for large Apple Health files."""
     
-    def __init__(self, batch_size: int = 2000, num_workers: int = None):
+    def __init__(self, batch_size: int = 2000, num_workers: int = None, engine: str = 'auto'):
         self.batch_size = batch_size
         self.num_workers = num_workers or min(multiprocessing.cpu_count(), 4)
+        self.engine = resolve_engine(engine)
         self.processed_count = 0
         self.error_count = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
         
     def process_large_xml_streaming(self, file_path: str, processor_func, progress_callback=None):
         """Process large XML files in streaming mode with optimizations."""
         logging.info(f"Processing {file_path} in optimized streaming mode")
         
-        # Use iterparse for memory-efficient parsing
-        context = ET.iterparse(file_path, events=('start', 'end'))
-        context = iter(context)
-        
-        # Get root element
-        event, root = next(context)
-        
         batch = []
         
         try:
-            for event, element in context:
-                if event == 'end' and element.tag in ['Record', 'Workout', 'ActivitySummary']:
-                    batch.append(element)
-                    
-                    # Clear processed element to save memory
-                    element.clear()
-                    
-                    # Process batch when full
-                    if len(batch) >= self.batch_size:
-                        self._process_batch(batch, processor_func)
-                        batch = []
-                        
-                        if progress_callback:
-                            progress_callback(self.processed_count)
+            # Elements stay populated until their batch is processed; the engine
+            # still detaches them from the root so the tree does not grow
+            for element in iter_health_elements(file_path, self.engine, clear_elements=False):
+                batch.append(element)
+                
+                # Process batch when full
+                if len(batch) >= self.batch_size:
+                    self._process_batch(batch, processor_func)
+                    self._clear_batch(batch)
+                    batch = []
                     
-                    # Clear ancestors to prevent memory buildup
-                    while element.getprevious() is not None:
-                        del element.getparent()[0]
+                    if progress_callback:
+                        progress_callback(self.processed_count)
             
             # Process remaining batch
             if batch:
                 self._process_batch(batch, processor_func)
+                self._clear_batch(batch)
                 
         except Exception as e:
             logging.error(f"Error processing XML: {e}")
             raise
         finally:
-            # Clear root to free memory
-            root.clear()
+            self._shutdown_executor()
+    
+    @staticmethod
+    def _clear_batch(elements: List[Any]) -> None:
+        """Release element contents once a batch has been processed."""
+        for element in elements:
+            element.clear()
     
     def _process_batch(self, elements: List[ET.Element], processor_func):
         """Process a batch of XML elements with error handling."""
@@ -198,36 +197,99 @@ class OptimizedXMLProcessor:
                 logging.warning(f"Error processing element: {e}")
     
     def _process_batch_parallel(self, elements: List[ET.Element], processor_func):
-        """Process batch using parallel processing."""
+        """Process batch using a thread pool shared across batches.
+        
+        Threads only help when ``processor_func`` waits on I/O; CPU-bound
+        parsing is parallelized with worker processes (``--jobs``) instead.
+        """
         try:
-            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-                futures = [executor.submit(processor_func, element) for element in elements]
-                
-                for future in futures:
-                    try:
-                        result = future.result(timeout=30)  # 30 second timeout
-                        if result:
-                            self.processed_count += 1
-                    except Exception as e:
-                        self.error_count += 1
-                        logging.warning(f"Error in parallel processing: {e}")
-                        
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
+            
+            futures = [self._executor.submit(processor_func, element) for element in elements]
+            
+            for future in futures:
+                try:
+                    result = future.result(timeout=30)  # 30 second timeout
+                    if result:
+                        self.processed_count += 1
+                except Exception as e:
+                    self.error_count += 1
+                    logging.warning(f"Error in parallel processing: {e}")
+                    
         except Exception as e:
             logging.error(f"Parallel processing failed: {e}")
             # Fallback to sequential processing
             self._process_batch_sequential(elements, processor_func)
+    
+    def _shutdown_executor(self) -> None:
+        """Shut down the shared thread pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
 
 
 class MemoryOptimizer:
     """Memory optimization utilities."""
     
+    # Peak RSS of a streaming import apart from its buffered points: interpreter,
+    # XML engine, configuration, tracker and writer threads, about 110 MB. Parsed
+    # elements are cleared and pruned, so it does not grow with the export
+    # (see tests/integration/test_streaming_memory.py)
+    STREAMING_BASE_MB = 128
+    
+    # Upper bound for one buffered point: parsed columns plus its line protocol
+    STREAMING_POINT_BYTES = 1024
+    
+    # Upper bound for one point held back by --changed-days day buckets, which
+    # keep points as dicts (about 750 bytes each)
+    HELD_POINT_BYTES = 1024
+    
+    # A parsed range waiting in the main process with --jobs, as a share of the
+    # range's XML: columnar points are about a tenth of it, plus the pickle
+    RANGE_RESULT_RATIO = 0.25
+    
+    @staticmethod
+    def estimate_streaming_memory(batch_size: int = 5000, write_workers: int = 4,
+                                  changed_days: bool = False, jobs: int = 1) -> float:
+        """Peak memory (MB) of a streaming import, independent of the file size.
+        
+        Up to ``write_workers`` batches are in flight while one is collected
+        and one is converted. ``changed_days`` also holds back the points of
+        up to ``DayBuckets.MAX_WAITING_POINTS`` waiting buckets. With ``jobs``
+        worker processes, each worker adds an interpreter of its own and up to
+        two parsed ranges per worker wait for the writer. Changed-days imports
+        always run in a single process.
+        """
+        # Imported here: the streaming module imports this one through the writer
+        from ..parsers.streaming import StreamingHealthDataProcessor
+        
+        buffered_points = batch_size * (write_workers + 2)
+        memory_bytes = buffered_points * MemoryOptimizer.STREAMING_POINT_BYTES
+        base_mb = MemoryOptimizer.STREAMING_BASE_MB
+        if changed_days:
+            memory_bytes += DayBuckets.MAX_WAITING_POINTS * MemoryOptimizer.HELD_POINT_BYTES
+        elif jobs > 1:
+            base_mb += jobs * MemoryOptimizer.STREAMING_BASE_MB
+            pending_ranges = jobs * 2
+            memory_bytes += (pending_ranges * StreamingHealthDataProcessor.PARALLEL_RANGE_BYTES
+                             * MemoryOptimizer.RANGE_RESULT_RATIO)
+        return base_mb + memory_bytes / (1024 * 1024)
+    
     @staticmethod
-    def estimate_memory_needs(file_path: str) -> Dict[str, Any]:
-        """Estimate memory requirements for processing a file."""
+    def estimate_memory_needs(file_path: str, batch_size: int = 5000, write_workers: int = 4,
+                              changed_days: bool = False, jobs: int = 1) -> Dict[str, Any]:
+        """Estimate memory requirements for processing a file.
+        
+        ``estimated_memory_mb`` is for loading the whole export as a tree;
+        ``streaming_memory_mb`` is the bound of a streaming import.
+        """
         file_size_mb = Path(file_path).stat().st_size / (1024 * 1024)
         
         # Estimate based on file size and XML parsing overhead
         estimated_memory_mb = file_size_mb * 2.5  # Conservative estimate
+        streaming_memory_mb = MemoryOptimizer.estimate_streaming_memory(batch_size, write_workers,
+                                                                        changed_days, jobs)
         
         # Check available memory
         available_memory_mb = psutil.virtual_memory().available / (1024 * 1024)
@@ -235,9 +297,11 @@ class MemoryOptimizer:
         return {
             'file_size_mb': file_size_mb,
             'estimated_memory_mb': estimated_memory_mb,
+            'streaming_memory_mb': streaming_memory_mb,
             'available_memory_mb': available_memory_mb,
             'can_load_in_memory': estimated_memory_mb < (available_memory_mb * 0.7),
-            'recommended_batch_size': max(100, int(available_memory_mb / estimated_memory_mb * 1000))
+            'can_stream': streaming_memory_mb < (available_memory_mb * 0.7),
+            'recommended_batch_size': max(100, int(available_memory_mb / max(estimated_memory_mb, 1) * 1000))
         }
     
     @staticmethod
@@ -257,16 +321,24 @@ class DatabaseOptimizer:
     """Database connection and query optimization."""
     
     @staticmethod
-    def optimize_influxdb_writes(batch_size: int = 1000, parallel_writes: bool = True) -> Dict[str, Any]:
-        """Get optimized settings for InfluxDB writes."""
+    def optimize_influxdb_writes(batch_size: int = 1000, parallel_writes: bool = True,
+                                 write_workers: int = 5, timeout_seconds: float = 30,
+                                 compression: bool = True, compression_level: int = 5,
+                                 retry_attempts: int = 3) -> Dict[str, Any]:
+        """Get optimized settings for InfluxDB writes.
+        
+        The connection pool holds one keep-alive connection per concurrent
+        writer, so in-flight batches never wait for or reopen a connection.
+        """
         return {
             'batch_size': batch_size,
             'parallel_writes': parallel_writes,
-            'connection_pool_size': 5 if parallel_writes else 1,
-            'retry_attempts': 3,
+            'connection_pool_size': max(1, write_workers) if parallel_writes else 1,
+            'retry_attempts': retry_attempts,
             'retry_delay': 1,
-            'timeout_seconds': 30,
-            'compression': True
+            'timeout_seconds': timeout_seconds,
+            'compression': compression,
+            'compression_level': compression_level
         }
     
     @staticmethod
@@ -336,6 +408,37 @@ def benchmark_processing_methods(file_path: str) -> Dict[str, float]:
     return results
 
 
+def benchmark_datetime_parsing(timezone: str = 'UTC', iterations: int = 100000) -> Dict[str, float]:
+    """Compare the fixed-layout datetime and epoch timestamp parsers with the strptime path."""
+    from datetime import datetime
+    from ..parsers.health_data import HealthDataParser
+    
+    parser = HealthDataParser(timezone)
+    samples = [
+        f"2024-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d} {offset}"
+        for month, day, hour, minute, second, offset in (
+            (1, 15, 7, 30, 5, '+0200'), (3, 31, 2, 59, 59, '+0300'),
+            (6, 1, 12, 0, 0, '-0500'), (10, 27, 23, 45, 12, '+0000'),
+        )
+    ]
+    results = {'iterations': iterations}
+    
+    def strptime_path(date_str: str):
+        return datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S %z").astimezone(parser.timezone)
+    
+    for name, parse in (('strptime_parse', strptime_path), ('fast_parse', parser.parse_datetime),
+                        ('timestamp_parse', parser.parse_timestamp)):
+        start_time = time.perf_counter()
+        for i in range(iterations):
+            parse(samples[i % len(samples)])
+        results[name] = time.perf_counter() - start_time
+    
+    results['speedup'] = results['strptime_parse'] / results['fast_parse'] if results['fast_parse'] else float('inf')
+    results['timestamp_speedup'] = (results['strptime_parse'] / results['timestamp_parse']
+                                    if results['timestamp_parse'] else float('inf'))
+    return results
+
+
 if __name__ == '__main__':
     # Example usage
     optimizer = PerformanceOptimizer()
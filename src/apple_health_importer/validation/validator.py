@@ -2,8 +2,18 @@
 
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Union
-from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass, field
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on installed packages
+    np = None
+    NUMPY_AVAILABLE = False
+
+from ..config.manager import TypePlan
+from ..parsers.batch import NANOSECONDS_PER_SECOND, ColumnarBatch
 
 
 @dataclass
@@ -15,6 +25,23 @@ class ValidationResult:
     corrected_value: Optional[Union[int, float]] = None
 
 
+@dataclass
+class BatchValidationResult:
+    """Result of validating a ColumnarBatch.
+
+    ``masks`` holds a valid-row mask for each series key that has invalid
+    rows; series without an entry are entirely valid. Messages are only built
+    for offending rows, as ``(data_type, message)`` pairs.
+    """
+    masks: Dict[Tuple, Sequence[bool]] = field(default_factory=dict)
+    validated: int = 0
+    invalid: Dict[Tuple, int] = field(default_factory=dict)
+    errors: int = 0
+    warnings: int = 0
+    error_messages: List[Tuple[str, str]] = field(default_factory=list)
+    warning_messages: List[Tuple[str, str]] = field(default_factory=list)
+
+
 class HealthDataValidator:
     """Validates and cleans Apple Health data using configuration-driven rules."""
 
@@ -76,14 +103,10 @@ class HealthDataValidator:
     def _get_validation_rules(self, data_type: str, field_name: str = 'value') -> Dict:
         """Get validation rules for a specific data type from config or fallback."""
         if self.config_manager:
-            # Find the category this data type belongs to
-            category = self.config_manager.find_measurement_category(data_type)
-            if category:
-                config = self.config_manager.get_measurement_config(category)
-                if config and config.validation and config.validation.get('enabled', True):
-                    rules = config.validation.get('rules', {})
-                    if field_name in rules:
-                        return rules[field_name]
+            # Rules of the category this data type belongs to
+            plan = self.config_manager.get_type_plan(data_type)
+            if plan and plan.validation_enabled and field_name in plan.validation_rules:
+                return plan.validation_rules[field_name]
 
         # Fallback to legacy rules
         if data_type in ['HKQuantityTypeIdentifierHeartRate']:
@@ -97,7 +120,7 @@ class HealthDataValidator:
 
         return {}
 
-    def validate_heart_rate(self, value: float, timestamp: str, context: Dict = None) -> ValidationResult:
+    def validate_heart_rate(self, value: float, timestamp: Union[int, str], context: Dict = None) -> ValidationResult:
         """Validate heart rate data."""
         rules = self._get_validation_rules('HKQuantityTypeIdentifierHeartRate')
         errors = []
@@ -200,8 +223,11 @@ class HealthDataValidator:
         timestamp = data.get('time', '')
         if timestamp:
             try:
-                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                hour = dt.hour
+                if isinstance(timestamp, int):
+                    # Hour in the UTC offset the sleep was recorded in
+                    hour = (timestamp // NANOSECONDS_PER_SECOND + data.get('utc_offset', 0)) // 3600 % 24
+                else:
+                    hour = datetime.fromisoformat(timestamp.replace('Z', '+00:00')).hour
 
                 # Sleep starting during unusual hours
                 if 6 <= hour <= 18:  # 6 AM to 6 PM
@@ -239,8 +265,12 @@ class HealthDataValidator:
             warnings=warnings
         )
 
-    def validate_generic_data_point(self, data_point: Dict) -> ValidationResult:
-        """Generic validation for any data point using configuration-driven rules."""
+    def validate_generic_data_point(self, data_point: Dict, plan: Optional[TypePlan] = None) -> ValidationResult:
+        """Generic validation for any data point using configuration-driven rules.
+
+        ``plan`` is the precompiled TypePlan of the data point's type; it is
+        looked up when not given.
+        """
         data_type = data_point.get('type', '')
         # measurement = data_point.get('measurement', '')  # unused for now
         fields = data_point.get('fields', {})
@@ -252,18 +282,19 @@ class HealthDataValidator:
         if not self.config_manager:
             return ValidationResult(is_valid=True, errors=[], warnings=[])
 
-        # Find the category this data type belongs to
-        category = self.config_manager.find_measurement_category(data_type)
-        if not category:
+        # Find the plan (category and rules) for this data type
+        if plan is None:
+            plan = self.config_manager.get_type_plan(data_type)
+        if not plan:
             # No validation rules for this type
             return ValidationResult(is_valid=True, errors=[], warnings=[])
 
         # Check if validation is enabled for this category
-        if not self.config_manager.is_validation_enabled(category):
+        if not plan.validation_enabled:
             return ValidationResult(is_valid=True, errors=[], warnings=[])
 
         # Get validation rules for this category
-        validation_rules = self.config_manager.get_validation_rules(category)
+        validation_rules = plan.validation_rules
         if not validation_rules:
             return ValidationResult(is_valid=True, errors=[], warnings=[])
 
@@ -291,12 +322,12 @@ class HealthDataValidator:
         # Basic range validation
         if 'min' in rules and 'max' in rules:
             if value < rules['min'] or value > rules['max']:
-                errors.append(f"{field_name.replace('_', ' ').title()} {value} is outside valid range ({rules['min']}-{rules['max']}) for {data_type}")
+                errors.append(self._format_range_message(value, field_name, rules['min'], rules['max'], 'valid', data_type))
 
         # Typical range warnings
         if 'typical_min' in rules and 'typical_max' in rules and len(errors) == 0:
             if value < rules['typical_min'] or value > rules['typical_max']:
-                warnings.append(f"{field_name.replace('_', ' ').title()} {value} is outside typical range ({rules['typical_min']}-{rules['typical_max']}) for {data_type}")
+                warnings.append(self._format_range_message(value, field_name, rules['typical_min'], rules['typical_max'], 'typical', data_type))
 
         return ValidationResult(
             is_valid=len(errors) == 0,
@@ -324,7 +355,7 @@ class HealthDataValidator:
             warnings=warnings
         )
 
-    def validate_data_point(self, data_point: Dict) -> ValidationResult:
+    def validate_data_point(self, data_point: Dict, plan: Optional[TypePlan] = None) -> ValidationResult:
         """Main validation entry point for any data point."""
         self.validation_stats['total_validated'] += 1
 
@@ -333,7 +364,7 @@ class HealthDataValidator:
         try:
             # Use configuration-driven validation first
             if self.config_manager:
-                result = self.validate_generic_data_point(data_point)
+                result = self.validate_generic_data_point(data_point, plan)
             else:
                 # Fall back to legacy validation for specific types
                 if 'HeartRate' in data_type:
@@ -371,10 +402,122 @@ class HealthDataValidator:
                 warnings=[]
             )
 
+    def validate_batch(self, batch: ColumnarBatch, plans: Dict[str, Optional[TypePlan]]) -> BatchValidationResult:
+        """Validate every point of a batch with one range check per rule and column.
+
+        ``plans`` maps the data types to validate to their TypePlan (None for
+        types that are validated but have no rules); series of other types are
+        left out. Produces the same outcome and statistics as calling
+        ``validate_data_point`` per point.
+        """
+        result = BatchValidationResult()
+
+        for key, columns in batch.series.items():
+            if columns.data_type not in plans:
+                continue
+
+            rows = len(columns)
+            result.validated += rows
+            plan = plans[columns.data_type]
+            if not self.config_manager or not plan or not plan.validation_enabled or not plan.validation_rules:
+                continue
+
+            error_rows = None
+            warning_rows = None
+            for field_name, values in columns.fields.items():
+                field_rules = plan.validation_rules.get(field_name)
+                if not field_rules:
+                    continue
+
+                field_errors, field_warnings = self._range_masks(values, field_rules)
+                if field_errors is not None:
+                    error_rows = field_errors if error_rows is None else self._mask_or(error_rows, field_errors)
+                    for row in self._mask_rows(field_errors):
+                        result.error_messages.append((columns.data_type, self._format_range_message(
+                            values[row], field_name, field_rules['min'], field_rules['max'], 'valid', columns.data_type)))
+                if field_warnings is not None:
+                    warning_rows = field_warnings if warning_rows is None else self._mask_or(warning_rows, field_warnings)
+                    for row in self._mask_rows(field_warnings):
+                        result.warning_messages.append((columns.data_type, self._format_range_message(
+                            values[row], field_name, field_rules['typical_min'], field_rules['typical_max'],
+                            'typical', columns.data_type)))
+
+            if warning_rows is not None:
+                result.warnings += self._mask_count(warning_rows)
+            if error_rows is not None:
+                invalid = self._mask_count(error_rows)
+                if invalid:
+                    result.errors += invalid
+                    result.invalid[key] = invalid
+                    result.masks[key] = ~error_rows if NUMPY_AVAILABLE else [not e for e in error_rows]
+
+        self.validation_stats['total_validated'] += result.validated
+        self.validation_stats['errors'] += result.errors
+        self.validation_stats['warnings'] += result.warnings
+        return result
+
+    @staticmethod
+    def _range_masks(values: Any, rules: Dict) -> Tuple[Any, Any]:
+        """Return (error, warning) row masks for one column, None where a check does not apply."""
+        errors = None
+        warnings = None
+
+        if NUMPY_AVAILABLE:
+            column = np.frombuffer(values, dtype=np.int64 if values.typecode == 'q' else np.float64)
+            if 'min' in rules and 'max' in rules:
+                errors = (column < rules['min']) | (column > rules['max'])
+            if 'typical_min' in rules and 'typical_max' in rules:
+                warnings = (column < rules['typical_min']) | (column > rules['typical_max'])
+                if errors is not None:
+                    warnings &= ~errors
+            return errors, warnings
+
+        if 'min' in rules and 'max' in rules:
+            low, high = rules['min'], rules['max']
+            errors = [value < low or value > high for value in values]
+        if 'typical_min' in rules and 'typical_max' in rules:
+            low, high = rules['typical_min'], rules['typical_max']
+            warnings = [value < low or value > high for value in values]
+            if errors is not None:
+                warnings = [w and not e for w, e in zip(warnings, errors)]
+        return errors, warnings
+
+    @staticmethod
+    def _mask_or(left: Any, right: Any) -> Any:
+        """Element-wise OR of two masks."""
+        if NUMPY_AVAILABLE:
+            return left | right
+        return [a or b for a, b in zip(left, right)]
+
+    @staticmethod
+    def _mask_rows(mask: Any) -> List[int]:
+        """Indices of the set rows of a mask."""
+        if NUMPY_AVAILABLE:
+            return np.flatnonzero(mask).tolist()
+        return [row for row, flagged in enumerate(mask) if flagged]
+
+    @staticmethod
+    def _mask_count(mask: Any) -> int:
+        """Number of set rows of a mask."""
+        if NUMPY_AVAILABLE:
+            return int(np.count_nonzero(mask))
+        return sum(mask)
+
+    @staticmethod
+    def _format_range_message(value: Union[int, float], field_name: str, low: Any, high: Any,
+                              kind: str, data_type: str) -> str:
+        """Message for a value outside a valid or typical range."""
+        return f"{field_name.replace('_', ' ').title()} {value} is outside {kind} range ({low}-{high}) for {data_type}"
+
     def get_validation_summary(self) -> Dict[str, int]:
         """Get validation statistics summary."""
         return self.validation_stats.copy()
 
+    def merge_stats(self, stats: Dict[str, int]) -> None:
+        """Add validation statistics gathered elsewhere (e.g. in a worker process)."""
+        for key, value in stats.items():
+            self.validation_stats[key] = self.validation_stats.get(key, 0) + value
+
     def reset_stats(self) -> None:
         """Reset validation statistics."""
         self.validation_stats = {
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Set, Tuple
+
+
+# (type, source, epoch-ns time) of a point within one measurement
+SeriesKey = Tuple[str, str, int]
+
+
+class SeriesIndex:
+    """On-disk index of the points written to InfluxDB, for duplicate detection.
+
+    Each written point is recorded by measurement, ``type`` tag, ``source``
+    tag and epoch-ns time. Before a batch is written the keys in its time
+    range are loaded in one query and checked in memory, so no InfluxDB
+    queries are needed; keys are added once a write has succeeded.
+
+    The index belongs to one InfluxDB database (``target``); opening it for
+    another target empties it. ``rebuild`` repopulates it from InfluxDB.
+    Until it has been rebuilt for its target the index is not ``complete``:
+    points written by other runs may be missing from it.
+    """
+
+    def __init__(self, index_file: str = "dedupe_index.sqlite", target: str = ""):
+        self.index_file = Path(index_file)
+        self.target = target
+        self.complete = False  # Rebuilt from the target and kept up to date since
+        self._lock = threading.Lock()
+
+        # Writer threads share the connection; every use holds the lock
+        self._connection = sqlite3.connect(str(self.index_file), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS written_points ("
+            " measurement TEXT NOT NULL, time INTEGER NOT NULL,"
+            " type TEXT NOT NULL, source TEXT NOT NULL,"
+            " PRIMARY KEY (measurement, time, type, source)) WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS index_info (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._check_target()
+
+    def _check_target(self) -> None:
+        """Empty the index if it was built for a different database."""
+        row = self._connection.execute("SELECT value FROM index_info WHERE key = 'target'").fetchone()
+        if row and row[0] != self.target:
+            logging.info(f"Dedupe index {self.index_file} was built for {row[0]}; starting a new index")
+            self._connection.execute("DELETE FROM written_points")
+            self._connection.execute("DELETE FROM index_info WHERE key = 'complete'")
+        self._connection.execute("INSERT OR REPLACE INTO index_info (key, value) VALUES ('target', ?)",
+                                 (self.target,))
+        self._connection.commit()
+        self.complete = self._connection.execute(
+            "SELECT value FROM index_info WHERE key = 'complete'").fetchone() is not None
+
+    def existing(self, measurement: str, min_time: int, max_time: int) -> Set[SeriesKey]:
+        """Keys of a measurement written between two epoch-ns times (inclusive)."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT type, source, time FROM written_points"
+                " WHERE measurement = ? AND time BETWEEN ? AND ?",
+                (measurement, min_time, max_time)
+            ).fetchall()
+        return set(rows)
+
+    def add(self, measurement: str, keys: Iterable[SeriesKey]) -> None:
+        """Record written keys of a measurement."""
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO written_points (measurement, type, source, time) VALUES (?, ?, ?, ?)",
+                ((measurement, data_type, source, time_ns) for data_type, source, time_ns in keys)
+            )
+            self._connection.commit()
+
+    def count(self, measurement: Optional[str] = None) -> int:
+        """Number of indexed points, optionally for one measurement."""
+        with self._lock:
+            if measurement is None:
+                return self._connection.execute("SELECT COUNT(*) FROM written_points").fetchone()[0]
+            return self._connection.execute("SELECT COUNT(*) FROM written_points WHERE measurement = ?",
+                                            (measurement,)).fetchone()[0]
+
+    def clear(self) -> None:
+        """Remove every indexed key."""
+        with self._lock:
+            self._connection.execute("DELETE FROM written_points")
+            self._connection.execute("DELETE FROM index_info WHERE key = 'complete'")
+            self._connection.commit()
+            self.complete = False
+
+    def rebuild(self, writer, measurements: Iterable[str]) -> int:
+        """Cold start: repopulate the index from InfluxDB, one streaming query per measurement.
+
+        ``writer`` is the ``InfluxDBWriter`` whose database the index tracks.
+        Returns the number of indexed points.
+        """
+        self.clear()
+        total = 0
+        for measurement in sorted(set(measurements)):
+            count = 0
+            keys = []
+            for key in writer.iter_series_keys(measurement):
+                keys.append(key)
+                if len(keys) >= 50000:
+                    self.add(measurement, keys)
+                    count += len(keys)
+                    keys = []
+            self.add(measurement, keys)
+            count += len(keys)
+
+            logging.info(f"Indexed {count} existing {measurement} points")
+            total += count
+
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO index_info (key, value) VALUES ('complete', '1')")
+            self._connection.commit()
+            self.complete = True
+        return total
+
+    def close(self) -> None:
+        """Close the index database."""
+        with self._lock:
+            self._connection.close()
@@ -1,16 +1,23 @@
 from influxdb import InfluxDBClient
-from typing import Dict, List, Optional, Union, Set
+from influxdb.line_protocol import make_line
+from typing import Dict, Iterator, List, Optional, Tuple, Union, Set
+import gzip
 import logging
 from urllib.parse import urlparse
 import time
-from datetime import datetime, timedelta
-from ..config.manager import ConfigManager
+from ..config.manager import ConfigManager, TYPE_FIELD_NAMES
+from ..parsers.batch import ColumnarBatch, SeriesColumns, NANOSECONDS_PER_SECOND
+from .dedupe import SeriesIndex
+from .line_protocol import WRITE_PRECISION, LineProtocolSerializer, point_tag_value, point_time_ns
+from ..utils.performance import DatabaseOptimizer
 
 
 class InfluxDBWriter:
     """InfluxDB writer with configurable measurements and batching support."""
     
-    def __init__(self, url: str, username: str, password: str, database: str, config_manager: Optional[ConfigManager] = None):
+    def __init__(self, url: str, username: str, password: str, database: str, config_manager: Optional[ConfigManager] = None,
+                 write_workers: Optional[int] = None, dedupe_index_file: Optional[str] = None,
+                 upsert: bool = False):
         # Parse and validate URL
         try:
             parsed = urlparse(url)
@@ -27,95 +34,107 @@ class InfluxDBWriter:
             logging.error(f"Error parsing InfluxDB URL '{url}': {e}")
             raise ValueError(f"Invalid InfluxDB URL: {e}")
         
+        # Initialize configuration manager
+        self.config_manager = config_manager or ConfigManager()
+        
+        # Transport settings: one pooled keep-alive connection per concurrent writer
+        write_workers = write_workers or self.config_manager.get_write_workers()
+        self.transport = DatabaseOptimizer.optimize_influxdb_writes(
+            batch_size=self.config_manager.get_batch_size(),
+            parallel_writes=write_workers > 1,
+            write_workers=write_workers,
+            timeout_seconds=self.config_manager.get_write_timeout(),
+            compression=self.config_manager.is_write_compression_enabled(),
+            compression_level=self.config_manager.get_compression_level(),
+            retry_attempts=self.config_manager.get_max_retries()
+        )
+        
+        # Write bodies are compressed here rather than by the client, so the
+        # compression level is ours and the bytes on the wire are known
+        self.database = database
         self.client = InfluxDBClient(
             host=host,
             port=port,
             username=username,
             password=password,
-            database=database
+            database=database,
+            timeout=self.transport['timeout_seconds'],
+            retries=self.transport['retry_attempts'],
+            pool_size=self.transport['connection_pool_size']
         )
         
-        # Initialize configuration manager
-        self.config_manager = config_manager or ConfigManager()
+        # Database the points go to; local indexes and manifests are kept per target
+        self.target = f"{host}:{port}/{database}"
+        
+        # Points are sent as line protocol built from per-type templates
+        self.serializer = LineProtocolSerializer(self.config_manager)
+        
+        # Cache for duplicate detection: series keys loaded per measurement
+        self.existing_timestamps: Dict[str, Set[Tuple[str, str, int]]] = {}
+        
+        # Local index of written points; when set, it replaces duplicate queries
+        self.series_index = None
+        if dedupe_index_file:
+            self.series_index = SeriesIndex(dedupe_index_file, target=self.target)
+        self._series_identities: Dict[str, Tuple[Optional[str], bool]] = {}
+        
+        # Upsert mode: no duplicate checks. InfluxDB overwrites a point with the
+        # same measurement, tag set and timestamp, and prepared points always have
+        # the same tags and epoch-ns time, so re-imported points replace themselves.
+        self.upsert = upsert
         
-        # Cache for duplicate detection
-        self.existing_timestamps: Dict[str, Set[str]] = {}
+    def check_for_duplicates(self, measurement: str, start_time: int, end_time: int) -> Set[Tuple[str, str, int]]:
+        """Get the series keys stored in InfluxDB between two epoch-ns times (inclusive).
         
-    def check_for_duplicates(self, measurement: str, start_time: str, end_time: str) -> Set[str]:
-        """Check for existing timestamps in InfluxDB within the given time range."""
+        Keys are ``(type, source, epoch-ns time)``, so points of different types
+        that share a timestamp in one measurement are told apart. The whole
+        range is covered; results are streamed in chunks rather than capped.
+        """
         try:
-            # First check if measurement exists by trying to get any record
-            test_query = f'SHOW MEASUREMENTS WHERE "name" = \'{measurement}\''
-            test_result = self.client.query(test_query)
-            
-            if not test_result:
-                # Measurement doesn't exist yet, no duplicates
-                return set()
-            
-            # Query existing data points in the time range
-            # Use * to get all fields which avoids the "at least 1 non-time field" error
-            query = f"""
-            SELECT * FROM "{measurement}" 
-            WHERE time >= '{start_time}' AND time <= '{end_time}'
-            LIMIT 10000
-            """
-            
-            result = self.client.query(query)
-            existing_times = set()
-            
-            if result:
-                for point in result.get_points():
-                    existing_times.add(point['time'])
-                    
-            logging.debug(f"Found {len(existing_times)} existing records in {measurement} between {start_time} and {end_time}")
-            return existing_times
+            existing_keys = set(self.iter_series_keys(measurement, start_time, end_time))
+            logging.debug(f"Found {len(existing_keys)} existing records in {measurement} between {start_time} and {end_time}")
+            return existing_keys
             
         except Exception as e:
             logging.warning(f"Could not check for duplicates in {measurement}: {e}")
             return set()
     
+    def iter_series_keys(self, measurement: str, start_time: Optional[int] = None,
+                         end_time: Optional[int] = None) -> Iterator[Tuple[str, str, int]]:
+        """Yield ``(type, source, epoch-ns time)`` for the stored points of a measurement.
+        
+        Only the identity tags are selected, plus the fields because InfluxQL
+        needs at least one; the other tags (such as the device tags)
+        never cross the wire. Results are streamed in chunks, so memory does
+        not grow with the measurement.
+        """
+        query = f'SELECT *::field, "type"::tag, "source"::tag FROM "{measurement}"'
+        if start_time is not None and end_time is not None:
+            query += f' WHERE time >= {int(start_time)} AND time <= {int(end_time)}'
+        for result in self.client.query(query, epoch='ns', chunked=True, chunk_size=10000):
+            for point in result.get_points():
+                yield point.get('type') or '', point.get('source') or '', int(point['time'])
+    
     def load_existing_data_cache(self, data_points: List[Dict]) -> None:
-        """Load existing data cache for duplicate detection."""
+        """Load existing series keys around the time range of each measurement in ``data_points``."""
         if not data_points:
             return
-            
-        # Group by measurement
-        measurements_timeranges = {}
+        
+        # Time range per measurement, widened by the configured window
+        window = self.config_manager.get_duplicate_check_window() * 3600 * NANOSECONDS_PER_SECOND
+        ranges: Dict[str, List[int]] = {}
         for point in data_points:
-            measurement = point.get('measurement', '')
-            timestamp = point.get('time', '')
-            
-            if measurement not in measurements_timeranges:
-                measurements_timeranges[measurement] = {'min': timestamp, 'max': timestamp}
-            else:
-                if timestamp < measurements_timeranges[measurement]['min']:
-                    measurements_timeranges[measurement]['min'] = timestamp
-                if timestamp > measurements_timeranges[measurement]['max']:
-                    measurements_timeranges[measurement]['max'] = timestamp
-        
-        # Check each measurement for existing data
-        for measurement, timerange in measurements_timeranges.items():
-            # Add buffer to the time range
             try:
-                start_dt = datetime.fromisoformat(timerange['min'].replace('Z', '+00:00'))
-                end_dt = datetime.fromisoformat(timerange['max'].replace('Z', '+00:00'))
-                
-                # Add buffer hours
-                window_hours = self.config_manager.get_duplicate_check_window()
-                start_dt -= timedelta(hours=window_hours)
-                end_dt += timedelta(hours=window_hours)
-                
-                existing_times = self.check_for_duplicates(
-                    measurement,
-                    start_dt.isoformat(),
-                    end_dt.isoformat()
-                )
-                
-                self.existing_timestamps[measurement] = existing_times
-                
+                measurement, _, _, time_ns = self._point_key(point)
             except Exception as e:
-                logging.warning(f"Error processing time range for {measurement}: {e}")
-                self.existing_timestamps[measurement] = set()
+                logging.warning(f"Error processing time range for {point.get('measurement', '')}: {e}")
+                continue
+            bounds = ranges.setdefault(measurement, [time_ns, time_ns])
+            bounds[0] = min(bounds[0], time_ns)
+            bounds[1] = max(bounds[1], time_ns)
+        
+        for measurement, (min_time, max_time) in ranges.items():
+            self.existing_timestamps[measurement] = self.check_for_duplicates(measurement, min_time - window, max_time + window)
 
     def get_measurement_category(self, data_type: str) -> str:
         """Determine the measurement category for a given data type."""
@@ -123,18 +142,17 @@ class InfluxDBWriter:
         return category if category else 'other'
 
     def prepare_point(self, data_point: Dict[str, Union[str, Dict]]) -> Dict[str, Union[str, Dict]]:
-        """Prepare data point for InfluxDB storage."""
+        """Prepare data point for InfluxDB storage; its time is in ``WRITE_PRECISION`` units."""
         data_type = data_point.get('type', '')
-        category = self.get_measurement_category(data_type)
         
-        # Get measurement configuration
-        measurement_config = self.config_manager.get_measurement_config(category)
-        if not measurement_config:
-            raise ValueError(f"No configuration found for category: {category}")
+        # Get the precompiled plan for this type; unlisted types use the 'other' category
+        plan = self.config_manager.get_type_plan(data_type) or self.config_manager.build_type_plan(data_type, 'other')
+        if not plan:
+            raise ValueError("No configuration found for category: other")
         
         point = {
-            "measurement": measurement_config.measurement_name,
-            "time": data_point['time'],
+            "measurement": plan.measurement_name,
+            "time": point_time_ns(data_point) // NANOSECONDS_PER_SECOND,
             "tags": {
                 "type": data_type
             },
@@ -142,19 +160,17 @@ class InfluxDBWriter:
         }
 
         # Add configured tags, filtering out empty/None values
-        source_tags = data_point.get('tags', {})
-        for tag_name in measurement_config.tags:
-            tag_value = source_tags.get(tag_name)
-            if tag_value is not None and str(tag_value).strip():  # Skip empty strings and None
-                point['tags'][tag_name] = str(tag_value).strip()
+        for tag_name in plan.tags:
+            tag_value = point_tag_value(data_point, tag_name)
+            if tag_value:
+                point['tags'][tag_name] = tag_value
 
         # Handle fields - use dynamic mapping based on data type
         source_fields = data_point.get('fields', {})
         
         # For most cases, map 'value' field to a type-specific name
         if 'value' in source_fields:
-            field_name = self._get_field_name_for_type(data_type)
-            point['fields'][field_name] = source_fields['value']
+            point['fields'][plan.field_name] = source_fields['value']
         
         # Map other fields directly
         for field_name, value in source_fields.items():
@@ -167,50 +183,39 @@ class InfluxDBWriter:
         
         return point
     
+    def prepare_line(self, data_point: Dict[str, Union[str, Dict]]) -> str:
+        """Prepare data point as an InfluxDB line protocol string."""
+        line = self.serializer.point_line(data_point)
+        if line is None:
+            # Non-numeric fields: let the client format the prepared point
+            point = self.prepare_point(data_point)
+            line = make_line(point['measurement'], tags=point['tags'], fields=point['fields'], time=point['time'],
+                             precision=WRITE_PRECISION)
+        return line
+    
     def _get_field_name_for_type(self, data_type: str) -> str:
         """Get appropriate field name for a data type."""
-        # Map common data types to meaningful field names
-        type_field_mapping = {
-            'HKQuantityTypeIdentifierHeartRate': 'heart_rate',
-            'HKQuantityTypeIdentifierRestingHeartRate': 'resting_heart_rate',
-            'HKQuantityTypeIdentifierHeartRateVariabilitySDNN': 'hrv_sdnn',
-            'HKQuantityTypeIdentifierBodyMass': 'weight',
-            'HKQuantityTypeIdentifierHeight': 'height',
-            'HKQuantityTypeIdentifierActiveEnergyBurned': 'active_energy',
-            'HKQuantityTypeIdentifierBasalEnergyBurned': 'basal_energy',
-            'HKQuantityTypeIdentifierStepCount': 'steps',
-            'HKQuantityTypeIdentifierDistanceWalkingRunning': 'distance',
-            'HKQuantityTypeIdentifierFlightsClimbed': 'flights',
-            'HKQuantityTypeIdentifierOxygenSaturation': 'oxygen_saturation',
-            'HKQuantityTypeIdentifierRespiratoryRate': 'respiratory_rate',
-            'HKQuantityTypeIdentifierVO2Max': 'vo2_max',
-            'HKQuantityTypeIdentifierWalkingSpeed': 'walking_speed',
-            'HKQuantityTypeIdentifierRunningSpeed': 'running_speed',
-            'HKQuantityTypeIdentifierAppleExerciseTime': 'exercise_time',
-            'HKQuantityTypeIdentifierAppleStandTime': 'stand_time',
-        }
-        
-        return type_field_mapping.get(data_type, 'value')
+        plan = self.config_manager.get_type_plan(data_type)
+        return plan.field_name if plan else TYPE_FIELD_NAMES.get(data_type, 'value')
     
     def is_duplicate(self, data_point: Dict) -> bool:
-        """Check if a data point is a duplicate."""
-        measurement = data_point.get('measurement', '')
-        timestamp = data_point.get('time', '')
+        """Check if a data point's series key is in the loaded duplicate cache."""
+        measurement, data_type, source, time_ns = self._point_key(data_point)
         
         if measurement in self.existing_timestamps:
-            return timestamp in self.existing_timestamps[measurement]
+            return (data_type, source, time_ns) in self.existing_timestamps[measurement]
         return False
 
     def write_point(self, data_point: Dict[str, Union[str, Dict]], max_retries: int = 3, skip_duplicates: bool = True) -> bool:
         """Write a single data point to InfluxDB with retry logic and duplicate checking."""
-        if skip_duplicates and self.is_duplicate(data_point):
+        if skip_duplicates and not self.upsert and self.is_duplicate(data_point):
             return True  # Skip duplicate, return success
             
-        point = self.prepare_point(data_point)
+        line = self.prepare_line(data_point)
         
         for attempt in range(max_retries):
             try:
-                self.client.write_points([point])
+                self.send_lines([line])
                 return True
                 
             except Exception as e:
@@ -228,28 +233,14 @@ class InfluxDBWriter:
         """Write multiple data points to InfluxDB using batching.
         Returns statistics about the write operation."""
         if not data_points:
-            return {'written': 0, 'duplicates': 0, 'errors': 0}
+            return self._empty_write_stats()
         
-        # Load existing data cache for duplicate detection
-        if skip_duplicates:
-            logging.info("Loading existing data cache for duplicate detection...")
-            self.load_existing_data_cache(data_points)
-        
-        stats = {'written': 0, 'duplicates': 0, 'errors': 0}
+        stats = self._empty_write_stats()
         prepared_points = []
+        prepared_keys = []
         
         # Filter duplicates and prepare points
-        for data_point in data_points:
-            if skip_duplicates and self.is_duplicate(data_point):
-                stats['duplicates'] += 1
-                continue
-                
-            try:
-                point = self.prepare_point(data_point)
-                prepared_points.append(point)
-            except Exception as e:
-                logging.error(f"Error preparing data point: {e}")
-                stats['errors'] += 1
+        self._prepare_point_lines(data_points, skip_duplicates, prepared_points, prepared_keys, stats)
         
         # Write in batches
         batch_size = self.config_manager.get_batch_size()
@@ -260,9 +251,12 @@ class InfluxDBWriter:
             batch = prepared_points[i:i + batch_size]
             batch_num = i // batch_size + 1
             
-            success = self._write_batch_with_retry(batch, batch_num, total_batches)
+            success = self._write_batch_with_retry(batch, batch_num, total_batches, stats)
             if success:
                 stats['written'] += len(batch)
+                if self.upsert:
+                    stats['upserted'] += len(batch)
+                self._record_written(prepared_keys[i:i + batch_size])
             else:
                 stats['errors'] += len(batch)
         
@@ -271,9 +265,9 @@ class InfluxDBWriter:
     def write_points_batch_streaming(self, data_points: List[Dict[str, Union[str, Dict]]], skip_duplicates: bool = True) -> Dict[str, int]:
         """Write data points with minimal memory footprint for streaming."""
         if not data_points:
-            return {'written': 0, 'duplicates': 0, 'errors': 0}
+            return self._empty_write_stats()
         
-        stats = {'written': 0, 'duplicates': 0, 'errors': 0}
+        stats = self._empty_write_stats()
         
         # For streaming, we check duplicates per small batch to minimize memory usage
         # Group by measurement for efficient duplicate checking
@@ -286,78 +280,217 @@ class InfluxDBWriter:
         
         # Process each measurement separately
         for measurement, points in measurements_data.items():
-            if skip_duplicates:
-                # Load minimal duplicate cache for this measurement and time range
-                self._load_streaming_duplicate_cache(measurement, points)
-            
             prepared_points = []
-            for data_point in points:
-                if skip_duplicates and self.is_duplicate(data_point):
-                    stats['duplicates'] += 1
-                    continue
-                
-                try:
-                    point = self.prepare_point(data_point)
-                    prepared_points.append(point)
-                except Exception as e:
-                    logging.error(f"Error preparing data point: {e}")
-                    stats['errors'] += 1
+            prepared_keys = []
+            self._prepare_point_lines(points, skip_duplicates, prepared_points, prepared_keys, stats)
             
             # Write prepared points for this measurement
-            if prepared_points:
-                try:
-                    self.client.write_points(prepared_points)
-                    stats['written'] += len(prepared_points)
-                    logging.debug(f"Wrote {len(prepared_points)} {measurement} points")
-                except Exception as e:
-                    logging.error(f"Error writing {measurement} batch: {e}")
-                    stats['errors'] += len(prepared_points)
+            if prepared_points and self._write_measurement_lines(measurement, prepared_points, stats):
+                self._record_written(prepared_keys)
         
         return stats
     
-    def _load_streaming_duplicate_cache(self, measurement: str, data_points: List[Dict]) -> None:
-        """Load duplicate cache for a specific measurement and small time range."""
-        if not data_points:
-            return
+    def write_batch_streaming(self, batch: ColumnarBatch, skip_duplicates: bool = True) -> Dict[str, int]:
+        """Write a ColumnarBatch, one request per measurement.
         
-        # Find time range for this small batch
-        timestamps = [point.get('time', '') for point in data_points if point.get('time')]
-        if not timestamps:
-            return
+        Same behaviour as ``write_points_batch_streaming``, but lines are
+        serialized straight from the batch columns, so no intermediate data
+        point dicts are created.
+        """
+        stats = self._empty_write_stats()
+        if not batch:
+            return stats
         
-        min_time = min(timestamps)
-        max_time = max(timestamps)
+        for measurement in batch.measurements():
+            self._write_series(measurement, batch.series_for(measurement), skip_duplicates, stats)
         
+        return stats
+    
+    def _write_measurement_lines(self, measurement: str, lines: List[str], stats: Dict[str, int]) -> bool:
+        """Write the lines of one measurement, counting them as written or errors."""
         try:
-            # Add small buffer (1 hour) to catch edge cases
-            start_dt = datetime.fromisoformat(min_time.replace('Z', '+00:00'))
-            end_dt = datetime.fromisoformat(max_time.replace('Z', '+00:00'))
-            
-            start_dt -= timedelta(hours=1)
-            end_dt += timedelta(hours=1)
-            
-            existing_times = self.check_for_duplicates(
-                measurement,
-                start_dt.isoformat(),
-                end_dt.isoformat()
-            )
+            line_bytes, wire_bytes = self.send_lines(lines)
+            stats['written'] += len(lines)
+            if self.upsert:
+                stats['upserted'] += len(lines)
+            stats['line_bytes'] += line_bytes
+            stats['wire_bytes'] += wire_bytes
+            logging.debug(f"Wrote {len(lines)} {measurement} points ({wire_bytes} bytes on the wire, {line_bytes} uncompressed)")
+            return True
+        except Exception as e:
+            logging.error(f"Error writing {measurement} batch: {e}")
+            stats['errors'] += len(lines)
+            return False
+    
+    def _series_identity(self, data_type: str) -> Tuple[Optional[str], bool]:
+        """Measurement a type is written to, and whether its ``source`` tag is written."""
+        identity = self._series_identities.get(data_type)
+        if identity is None:
+            plan = self.config_manager.get_type_plan(data_type) or self.config_manager.build_type_plan(data_type, 'other')
+            identity = (plan.measurement_name, 'source' in plan.tags) if plan else (None, False)
+            self._series_identities[data_type] = identity
+        return identity
+    
+    def _point_key(self, data_point: Dict) -> Tuple[Optional[str], str, str, int]:
+        """Series key of a data point: (measurement, type, source, epoch-ns time)."""
+        data_type = data_point.get('type', '')
+        measurement, keyed_source = self._series_identity(data_type)
+        source = ''
+        if keyed_source:
+            source = str(data_point.get('tags', {}).get('source') or '').strip()
+        return measurement, data_type, source, point_time_ns(data_point)
+    
+    def _existing_keys(self, measurement: str, min_time: int, max_time: int) -> Set[Tuple[str, str, int]]:
+        """Series keys already written to a measurement between two epoch-ns times.
+        
+        Read from the local dedupe index once it is complete, else from InfluxDB.
+        """
+        if self.series_index is not None and self.series_index.complete:
+            return self.series_index.existing(measurement, min_time, max_time)
+        
+        existing_keys = self.check_for_duplicates(measurement, min_time, max_time)
+        self.existing_timestamps[measurement] = existing_keys
+        return existing_keys
+    
+    def _load_existing_keys(self, keys: List[Tuple]) -> Set[Tuple]:
+        """Load the written keys in the time range of each measurement in ``keys``."""
+        ranges: Dict[str, List[int]] = {}
+        for measurement, _, _, time_ns in keys:
+            bounds = ranges.get(measurement)
+            if bounds is None:
+                ranges[measurement] = [time_ns, time_ns]
+            elif time_ns < bounds[0]:
+                bounds[0] = time_ns
+            elif time_ns > bounds[1]:
+                bounds[1] = time_ns
+        
+        existing = set()
+        for measurement, (min_time, max_time) in ranges.items():
+            existing.update((measurement,) + key for key in self._existing_keys(measurement, min_time, max_time))
+        return existing
+    
+    def _prepare_point_lines(self, data_points: List[Dict], skip_duplicates: bool,
+                             prepared_lines: List[str], prepared_keys: List[Tuple], stats: Dict[str, int]) -> None:
+        """Prepare lines for data points, skipping points whose series key was already written."""
+        keys = []
+        for data_point in data_points:
+            try:
+                keys.append(self._point_key(data_point))
+            except Exception:
+                keys.append(None)  # Reported when the line is prepared
+        
+        existing = set()
+        if skip_duplicates and not self.upsert:
+            existing = self._load_existing_keys([key for key in keys if key])
+        
+        for data_point, key in zip(data_points, keys):
+            if key in existing:
+                stats['duplicates'] += 1
+                continue
             
-            # Only store timestamps for this measurement
-            self.existing_timestamps[measurement] = existing_times
+            try:
+                prepared_lines.append(self.prepare_line(data_point))
+                prepared_keys.append(key)
+            except Exception as e:
+                logging.error(f"Error preparing data point: {e}")
+                stats['errors'] += 1
+    
+    def _record_written(self, keys: List[Optional[Tuple]]) -> None:
+        """Add the keys of written points to the dedupe index."""
+        if self.series_index is None:
+            return
+        grouped: Dict[str, List[Tuple[str, str, int]]] = {}
+        for key in keys:
+            if key and key[0]:
+                grouped.setdefault(key[0], []).append(key[1:])
+        for measurement, series_keys in grouped.items():
+            self.series_index.add(measurement, series_keys)
+    
+    def _write_series(self, measurement: str, series_list: List[SeriesColumns],
+                      skip_duplicates: bool, stats: Dict[str, int]) -> None:
+        """Write one measurement of a ColumnarBatch, skipping rows whose series key was already written."""
+        # Series keys of every row, with the measurement the type is written to
+        series_keys = []
+        for columns in series_list:
+            data_type = columns.data_type
+            index_measurement, keyed_source = self._series_identity(data_type)
+            source_column = columns.tags.get('source') if keyed_source else None
+            if source_column is not None:
+                strings = columns.strings
+                keys = [(data_type, strings[source_id], time_ns)
+                        for source_id, time_ns in zip(source_column, columns.times)]
+            else:
+                keys = [(data_type, '', time_ns) for time_ns in columns.times]
+            series_keys.append((index_measurement, keys))
+        
+        existing: Dict[str, Set[Tuple[str, str, int]]] = {}
+        if skip_duplicates and not self.upsert:
+            for index_measurement, keys in series_keys:
+                if keys and index_measurement and index_measurement not in existing:
+                    times = [time_ns for columns in series_list for time_ns in columns.times]
+                    existing[index_measurement] = self._existing_keys(index_measurement, min(times), max(times))
+        
+        prepared_lines = []
+        prepared_keys = []
+        for columns, (index_measurement, keys) in zip(series_list, series_keys):
+            rows = None
+            seen = existing.get(index_measurement)
+            if seen:
+                rows = [row for row, key in enumerate(keys) if key not in seen]
+                stats['duplicates'] += len(keys) - len(rows)
+                keys = [keys[row] for row in rows]
             
-        except Exception as e:
-            logging.warning(f"Error loading streaming duplicate cache for {measurement}: {e}")
-            self.existing_timestamps[measurement] = set()
+            try:
+                prepared_lines.extend(self.serializer.series_lines(columns, rows))
+                prepared_keys.extend((index_measurement,) + key for key in keys)
+            except Exception as e:
+                logging.error(f"Error preparing {len(keys)} {columns.data_type} points: {e}")
+                stats['errors'] += len(keys)
+        
+        if prepared_lines and self._write_measurement_lines(measurement, prepared_lines, stats):
+            self._record_written(prepared_keys)
+    
+    def send_lines(self, lines: List[str]) -> Tuple[int, int]:
+        """POST line protocol to the write endpoint, gzip-compressed if enabled.
+        
+        Returns ``(line_bytes, wire_bytes)``: the body size before and after
+        compression.
+        """
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+        headers = {'Content-Type': 'application/octet-stream', 'Accept': 'text/plain'}
+        data = body
+        if self.transport['compression']:
+            data = gzip.compress(body, compresslevel=self.transport['compression_level'])
+            headers['Content-Encoding'] = 'gzip'
+        
+        self.client.request(
+            url='write',
+            method='POST',
+            params={'db': self.database, 'precision': WRITE_PRECISION},
+            data=data,
+            expected_response_code=204,
+            headers=headers
+        )
+        return len(body), len(data)
+    
+    @staticmethod
+    def _empty_write_stats() -> Dict[str, int]:
+        """Counters returned by the batch write methods."""
+        return {'written': 0, 'duplicates': 0, 'upserted': 0, 'errors': 0, 'line_bytes': 0, 'wire_bytes': 0}
     
-    def _write_batch_with_retry(self, batch: List[Dict], batch_num: int, total_batches: int) -> bool:
+    def _write_batch_with_retry(self, batch: List[str], batch_num: int, total_batches: int,
+                                stats: Optional[Dict[str, int]] = None) -> bool:
         """Write a single batch with retry logic."""
         max_retries = self.config_manager.get_max_retries()
         retry_delay_base = self.config_manager.get_retry_delay_base()
         
         for attempt in range(max_retries):
             try:
-                self.client.write_points(batch)
-                logging.info(f"Successfully wrote batch {batch_num}/{total_batches} ({len(batch)} points)")
+                line_bytes, wire_bytes = self.send_lines(batch)
+                if stats is not None:
+                    stats['line_bytes'] += line_bytes
+                    stats['wire_bytes'] += wire_bytes
+                logging.info(f"Successfully wrote batch {batch_num}/{total_batches} ({len(batch)} points, {wire_bytes} bytes)")
                 return True
                 
             except Exception as e:
@@ -379,4 +512,6 @@ class InfluxDBWriter:
         
     def close(self) -> None:
         """Close the InfluxDB client connection."""
-        self.client.close() 
\ No newline at end of file
+        self.client.close()
+        if self.series_index is not None:
+            self.series_index.close() 
\ No newline at end of file
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, timezone
+from itertools import repeat
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..config.manager import ConfigManager, TypePlan
+from ..parsers.batch import (NANOSECONDS_PER_SECOND, UTC_OFFSET_TAG, SeriesColumns, format_utc_offset,
+                             to_epoch_ns)
+
+# Precision of the line timestamps; Apple times are whole seconds
+WRITE_PRECISION = 's'
+
+
+def escape_key(value: Any) -> str:
+    """Escape a measurement, tag key, tag value or field key like the influxdb client does."""
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace(' ', '\\ ')
+            .replace(',', '\\,')
+            .replace('=', '\\=')
+            .replace('\n', '\\n'))
+
+
+def quote_string_field(value: str) -> str:
+    """Quote a string field value like the influxdb client does."""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+def _point_datetime(data_point: Dict[str, Any]) -> datetime:
+    """Datetime of a point whose time is an ISO string or datetime (naive times are UTC, as in the client)."""
+    dt = data_point['time']
+    if isinstance(dt, str):
+        dt = datetime.fromisoformat(dt.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def point_time_ns(data_point: Dict[str, Any]) -> int:
+    """Epoch-ns time of a parser-style data point."""
+    time_ns = data_point['time']
+    return time_ns if isinstance(time_ns, int) else to_epoch_ns(_point_datetime(data_point))
+
+
+def point_utc_offset(data_point: Dict[str, Any]) -> int:
+    """UTC offset in seconds a parser-style data point was recorded in."""
+    utc_offset = data_point.get('utc_offset')
+    if utc_offset is None:
+        utc_offset = 0 if isinstance(data_point['time'], int) else int(
+            _point_datetime(data_point).utcoffset().total_seconds())
+    return utc_offset
+
+
+def point_tag_value(data_point: Dict[str, Any], name: str) -> str:
+    """Value of a plan tag for a parser-style data point ('' when unset)."""
+    if name == UTC_OFFSET_TAG:
+        return format_utc_offset(point_utc_offset(data_point))
+    value = data_point.get('tags', {}).get(name)
+    return str(value).strip() if value is not None else ''
+
+
+def _format_literal(text: str) -> str:
+    """Protect a literal piece of a line template from str.format."""
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+# str.format placeholders for field values, by kind ('i' integer, 'd' float,
+# 's' string, filled in already quoted)
+_FIELD_PLACEHOLDERS = {'i': '{}i', 'd': '{!r}', 's': '{}'}
+
+_FIELD_KINDS = {'q': 'i', 'd': 'd', 'I': 's'}
+
+
+class LineTemplate:
+    """Precompiled line layout for one data type and field set.
+
+    The measurement, field keys and field value formatting are fixed when the
+    template is built. The escaped, sorted tag set is compiled into a format
+    string once per distinct combination of tag values, so writing a point is
+    a single ``str.format`` call.
+    """
+
+    def __init__(self, plan: TypePlan, fields: Tuple[Tuple[str, str], ...]):
+        self.data_type = plan.data_type
+        self.measurement_name = plan.measurement_name
+        self.tag_names = tuple(plan.tags)
+        self.measurement = _format_literal(escape_key(plan.measurement_name))
+
+        # Mapped 'value' first, so a field of the same name overrides it
+        kinds = dict(fields)
+        mapped: Dict[str, str] = {}
+        if 'value' in kinds:
+            mapped[plan.field_name] = 'value'
+        for name in kinds:
+            if name != 'value':
+                mapped[name] = name
+
+        # Source fields in output (sorted key) order
+        self.field_sources = tuple(mapped[key] for key in sorted(mapped))
+        if mapped:
+            self.fields = ','.join(
+                f"{_format_literal(escape_key(key))}={_FIELD_PLACEHOLDERS[kinds[mapped[key]]]}"
+                for key in sorted(mapped))
+        else:
+            self.fields = 'value=1i'  # Default value for category-type records
+
+        self._formats: Dict[Tuple[str, ...], str] = {}
+
+    def line_format(self, tag_values: Tuple[str, ...]) -> str:
+        """Return the format string for a point with the given plan tag values.
+
+        Fill it with the field values in ``field_sources`` order followed by the
+        time in ``WRITE_PRECISION``.
+        """
+        line_format = self._formats.get(tag_values)
+        if line_format is None:
+            tags = {'type': self.data_type}
+            for name, value in zip(self.tag_names, tag_values):
+                if value:
+                    tags[name] = value
+
+            tag_set = ''.join(
+                f",{escape_key(key)}={escape_key(value)}"
+                for key, value in sorted(tags.items()) if key and value)
+            line_format = self._formats[tag_values] = (
+                f"{self.measurement}{_format_literal(tag_set)} {self.fields} {{}}")
+        return line_format
+
+
+class LineProtocolSerializer:
+    """Turns points into InfluxDB line protocol using per-type templates.
+
+    Produces exactly the lines ``InfluxDBClient.write_points`` would produce
+    for the points built by ``InfluxDBWriter.prepare_point`` with
+    ``time_precision=WRITE_PRECISION``, without the intermediate dicts.
+    """
+
+    def __init__(self, config_manager: ConfigManager):
+        self.config_manager = config_manager
+        self._templates: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], LineTemplate] = {}
+
+    def template(self, data_type: str, fields: Tuple[Tuple[str, str], ...]) -> LineTemplate:
+        """Return the template for a data type and its (field name, kind) pairs."""
+        key = (data_type, fields)
+        template = self._templates.get(key)
+        if template is None:
+            plan = (self.config_manager.get_type_plan(data_type)
+                    or self.config_manager.build_type_plan(data_type, 'other'))
+            if not plan:
+                raise ValueError("No configuration found for category: other")
+            template = self._templates[key] = LineTemplate(plan, fields)
+        return template
+
+    def series_lines(self, columns: SeriesColumns, rows: Optional[Iterable[int]] = None) -> List[str]:
+        """Serialize a column group, or the given rows of it."""
+        if rows is not None:
+            columns = columns.select(list(rows))
+
+        fields = tuple((name, _FIELD_KINDS[column.typecode]) for name, column in columns.fields.items())
+        template = self.template(columns.data_type, fields)
+
+        # Templates are cached by tag value; ids are only meaningful per string table.
+        # The UTC offset tag takes its ids from the offsets column.
+        strings = columns.strings
+        tag_columns = []
+        decoders = []
+        for name in template.tag_names:
+            if name == UTC_OFFSET_TAG:
+                tag_columns.append(columns.offsets)
+                decoders.append(format_utc_offset)
+            else:
+                column = columns.tags.get(name)
+                tag_columns.append(column if column is not None else repeat(0))
+                decoders.append(strings.__getitem__)
+        id_rows = zip(*tag_columns) if tag_columns else repeat(())
+
+        value_columns = []
+        for name in template.field_sources:
+            column = columns.fields[name]
+            if column.typecode == 'I':
+                quoted = {i: quote_string_field(strings[i]) for i in set(column)}
+                column = map(quoted.__getitem__, column)
+            value_columns.append(column)
+        value_rows = zip(*value_columns, (time_ns // NANOSECONDS_PER_SECOND for time_ns in columns.times))
+
+        formats: Dict[Tuple[int, ...], str] = {}
+        lines = []
+        append = lines.append
+        for ids, values in zip(id_rows, value_rows):
+            line_format = formats.get(ids)
+            if line_format is None:
+                line_format = formats[ids] = template.line_format(
+                    tuple(decode(i) for decode, i in zip(decoders, ids)))
+            append(line_format.format(*values))
+        return lines
+
+    def series_cardinality(self) -> Dict[str, int]:
+        """Number of distinct series (type and tag values) serialized per measurement."""
+        series: Dict[str, Set[Tuple[str, Tuple[str, ...]]]] = {}
+        for template in list(self._templates.values()):
+            # Templates with other field sets of the same type share its series
+            keys = series.setdefault(template.measurement_name, set())
+            keys.update((template.data_type, tag_values) for tag_values in list(template._formats))
+        return {measurement: len(keys) for measurement, keys in series.items()}
+
+    def point_line(self, data_point: Dict[str, Any]) -> Optional[str]:
+        """Serialize one parser-style data point.
+
+        Returns None for points with fields that are neither numbers nor
+        strings, which have no template.
+        """
+        source_fields = data_point.get('fields', {})
+        kinds = []
+        for name, value in source_fields.items():
+            if isinstance(value, str):
+                kinds.append((name, 's'))
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                return None
+            else:
+                kinds.append((name, 'i' if isinstance(value, int) else 'd'))
+        template = self.template(data_point.get('type', ''), tuple(kinds))
+
+        tag_values = tuple(point_tag_value(data_point, name) for name in template.tag_names)
+
+        values = [quote_string_field(value) if isinstance(value, str) else value
+                  for value in (source_fields[name] for name in template.field_sources)]
+        return template.line_format(tag_values).format(
+            *values, point_time_ns(data_point) // NANOSECONDS_PER_SECOND)
+
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class WriteBehindPipeline:
+    """Writes batches on background threads while the caller keeps parsing.
+
+    Batches are numbered as they are submitted and handed to ``workers``
+    writer threads through a bounded queue; ``submit`` blocks while
+    ``max_pending`` batches are waiting, so parsing cannot run arbitrarily
+    far ahead of the database. Several batches can be in flight at once.
+
+    Results are acknowledged strictly in submission order: ``acknowledged``
+    only returns batches for which every earlier batch has completed too, so
+    a checkpoint taken from the returned contexts never skips unwritten data.
+    """
+
+    def __init__(self, write: Callable[[Any], Dict[str, int]], workers: int = 4,
+                 max_pending: Optional[int] = None):
+        self._write = write
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending or workers * 2)
+        self._condition = threading.Condition()
+        self._contexts: Dict[int, Any] = {}
+        self._results: Dict[int, Tuple[Optional[Dict[str, int]], Optional[BaseException]]] = {}
+        self._next_sequence = 0
+        self._next_ack = 0
+        self._closed = False
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f"influxdb-writer-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Batches submitted but not yet acknowledged."""
+        return self._next_sequence - self._next_ack
+
+    def submit(self, batch: Any, context: Any = None) -> int:
+        """Queue a batch for writing; blocks while the queue is full.
+
+        ``context`` is returned with the batch's write stats once it is
+        acknowledged. Returns the batch sequence number.
+        """
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        self._contexts[sequence] = context
+        self._queue.put((sequence, batch))
+        return sequence
+
+    def acknowledged(self, wait: bool = False) -> List[Tuple[Any, Dict[str, int]]]:
+        """Return ``(context, stats)`` for newly completed batches, in submission order.
+
+        With ``wait`` this blocks until every submitted batch has completed. A
+        batch whose write raised re-raises its exception here, once the batches
+        before it have been returned by an earlier call.
+        """
+        acknowledged = []
+        with self._condition:
+            while True:
+                while self._next_ack in self._results:
+                    stats, error = self._results[self._next_ack]
+                    if error is not None:
+                        if acknowledged:
+                            # Hand back the written prefix first; raise on the next call
+                            return acknowledged
+                        raise error
+                    del self._results[self._next_ack]
+                    acknowledged.append((self._contexts.pop(self._next_ack), stats))
+                    self._next_ack += 1
+
+                if not wait or self._next_ack == self._next_sequence:
+                    return acknowledged
+                self._condition.wait()
+
+    def close(self) -> None:
+        """Stop the writer threads; batches still queued are not written."""
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        """Writer thread loop."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            sequence, batch = item
+            if self._closed:
+                continue
+
+            stats, error = None, None
+            try:
+                stats = self._write(batch)
+            except BaseException as e:  # Includes interrupts raised by the writer
+                logging.error(f"Error writing batch {sequence}: {e!r}")
+                error = e
+
+            with self._condition:
+                self._results[sequence] = (stats, error)
+                self._condition.notify_all()
+
+    def __enter__(self) -> 'WriteBehindPipeline':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
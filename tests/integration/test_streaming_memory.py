@@ -0,0 +1,157 @@
+"""Memory regression test for streaming imports."""
+
+import importlib.util
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from apple_health_importer.utils.performance import MemoryOptimizer
+
+
+SRC_PATH = Path(__file__).parent.parent.parent / "src"
+
+LXML_AVAILABLE = importlib.util.find_spec("lxml") is not None
+
+# Large enough that per-element leaks show up as hundreds of MB
+RECORD_COUNT = 2_000_000
+
+# Streams an export through a whole import, writing to a stub that serializes the
+# batches instead of sending them. With changed days the export is imported twice,
+# so the second run holds back waiting day buckets. Prints the number of points
+# written and left unchanged, and the peak RSS in MB
+IMPORT_SCRIPT = textwrap.dedent("""
+    import logging
+    import resource
+    import sys
+
+    from apple_health_importer.config.manager import ConfigManager
+    from apple_health_importer.parsers.health_data import HealthDataParser
+    from apple_health_importer.parsers.streaming import StreamingHealthDataProcessor
+    from apple_health_importer.tracking.tracker import ImportTracker
+    from apple_health_importer.validation.validator import HealthDataValidator
+    from apple_health_importer.writers.line_protocol import LineProtocolSerializer
+
+    logging.disable(logging.WARNING)
+    export_file, engine, changed_days = sys.argv[1], sys.argv[2], sys.argv[3] == "changed-days"
+
+    config_manager = ConfigManager("missing_measurements_config.yaml")
+
+
+    class SerializingWriter:
+        # Stands in for InfluxDBWriter: builds the line protocol of each batch and drops it
+        target = "localhost:8086/memory"
+
+        def __init__(self):
+            self.serializer = LineProtocolSerializer(config_manager)
+
+        def write_batch_streaming(self, batch):
+            written = sum(len(self.serializer.series_lines(columns)) for columns in batch.series.values())
+            return {'written': written, 'duplicates': 0, 'errors': 0}
+
+
+    tracker = ImportTracker("import_history.json")
+    for _ in range(2 if changed_days else 1):
+        processor = StreamingHealthDataProcessor(
+            HealthDataParser("UTC"), HealthDataValidator(config_manager), SerializingWriter(), tracker,
+            config_manager, engine=engine
+        )
+        stats = processor.process_file_streaming(export_file, force=True, changed_days=changed_days)
+        print(stats['written'], stats['unchanged'])
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(peak / (1024 * 1024 if sys.platform == "darwin" else 1024))
+""")
+
+
+def write_export(path: Path, records: int) -> int:
+    """Write a synthetic export; returns the number of Record/Workout/ActivitySummary elements."""
+    elements = 0
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<HealthData locale="en_US">\n')
+        f.write(' <ExportDate value="2024-01-01 00:00:00 +0000"/>\n')
+        for i in range(records):
+            seconds = i % 86400
+            date = (f"2024-01-{1 + (i // 86400) % 28:02d} "
+                    f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d} +0200")
+            dates = f'creationDate="{date}" startDate="{date}" endDate="{date}"'
+
+            if i % 100 == 0:
+                # Nested metadata and beat-to-beat lists are freed with their record
+                beats = "".join(f'   <InstantaneousBeatsPerMinute bpm="{60 + k}" time="12:00:{k:02d}.00"/>\n'
+                                for k in range(20))
+                f.write(f' <Record type="HKQuantityTypeIdentifierHeartRateVariabilitySDNN" sourceName="Watch" '
+                        f'unit="ms" {dates} value="{40 + i % 30}">\n'
+                        f'  <MetadataEntry key="HKMetadataKeyDevicePlacementSide" value="1"/>\n'
+                        f'  <HeartRateVariabilityMetadataList>\n{beats}  </HeartRateVariabilityMetadataList>\n'
+                        f' </Record>\n')
+                elements += 1
+            elif i % 100 == 1:
+                # Correlations are not imported themselves, but their records are
+                f.write(f' <Correlation type="HKCorrelationTypeIdentifierBloodPressure" sourceName="Cuff" {dates}>\n'
+                        f'  <Record type="HKQuantityTypeIdentifierBloodPressureSystolic" sourceName="Cuff" '
+                        f'unit="mmHg" {dates} value="120"/>\n'
+                        f'  <Record type="HKQuantityTypeIdentifierBloodPressureDiastolic" sourceName="Cuff" '
+                        f'unit="mmHg" {dates} value="80"/>\n'
+                        f' </Correlation>\n')
+                elements += 2
+            else:
+                f.write(f' <Record type="HKQuantityTypeIdentifierHeartRate" sourceName="Watch" '
+                        f'unit="count/min" {dates} value="{60 + i % 50}">\n'
+                        f'  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="{i % 3}"/>\n'
+                        f' </Record>\n')
+                elements += 1
+
+        for day in range(1, 29):
+            f.write(f' <Workout workoutActivityType="HKWorkoutActivityTypeRunning" duration="30" durationUnit="min" '
+                    f'sourceName="Watch" startDate="2024-01-{day:02d} 07:00:00 +0200" '
+                    f'endDate="2024-01-{day:02d} 07:30:00 +0200">\n'
+                    f'  <WorkoutEvent type="HKWorkoutEventTypeSegment" date="2024-01-{day:02d} 07:10:00 +0200"/>\n'
+                    f' </Workout>\n'
+                    f' <ActivitySummary dateComponents="2024-01-{day:02d}" activeEnergyBurned="500" '
+                    f'activeEnergyBurnedGoal="600" activeEnergyBurnedUnit="Cal"/>\n')
+            elements += 2
+        f.write('</HealthData>\n')
+    return elements
+
+
+@pytest.fixture(scope="module")
+def large_export(tmp_path_factory):
+    """A multi-million-record export (about 600 MB)."""
+    path = tmp_path_factory.mktemp("memory") / "export.xml"
+    elements = write_export(path, RECORD_COUNT)
+    yield path, elements
+    path.unlink()
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(sys.platform == "win32", reason="needs the resource module")
+@pytest.mark.parametrize("engine, mode", [
+    pytest.param("lxml", "plain", marks=pytest.mark.skipif(not LXML_AVAILABLE, reason="lxml is not installed")),
+    ("stdlib", "plain"),
+    ("expat", "plain"),
+    ("expat", "changed-days"),
+])
+def test_import_peak_memory_is_within_the_estimate(large_export, tmp_path, engine, mode):
+    """A whole import of a large export peaks below MemoryOptimizer's estimate."""
+    path, elements = large_export
+
+    # A fresh interpreter, so the peak RSS is the import's alone, with its own import history
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT, str(path), engine, mode],
+        capture_output=True, text=True, check=True, cwd=str(tmp_path),
+        env={**os.environ, "PYTHONPATH": str(SRC_PATH)}
+    )
+    *runs, peak_mb = result.stdout.splitlines()
+    written, unchanged = map(int, runs[0].split())
+
+    # HRV and blood pressure types are unknown to the default configuration
+    assert written == elements - 3 * (RECORD_COUNT // 100) and unchanged == 0
+    if mode == "changed-days":
+        assert runs[1].split() == ["0", str(written)]
+
+    ceiling = MemoryOptimizer.estimate_streaming_memory(changed_days=mode == "changed-days")
+    assert float(peak_mb) < ceiling, f"peak RSS {float(peak_mb):.0f} MB, estimated {ceiling:.0f} MB"
@@ -0,0 +1,91 @@
+"""Tests for holding back the points of (type, day) buckets unchanged since the last import."""
+
+from apple_health_importer.parsers.day_buckets import DayBuckets
+
+
+DAY_NS = 86400 * 1_000_000_000
+
+
+def point(data_type, day, minute, value=1.0):
+    """A point ``minute`` minutes into day ``day`` of 2024-01, recorded at UTC+2."""
+    return {
+        'measurement': 'health',
+        'type': data_type,
+        'time': 1704060000 * 1_000_000_000 + (day - 1) * DAY_NS + minute * 60_000_000_000,
+        'utc_offset': 7200,
+        'fields': {'value': value},
+        'tags': {'source': 'Watch'},
+    }
+
+
+def interleaved(days=3, per_day=4):
+    """Two types alternating point by point, then repeats of one type, as correlations do."""
+    points = []
+    for day in range(1, days + 1):
+        for minute in range(per_day):
+            points.append(point('A', day, minute))
+            points.append(point('B', day, minute, value=2.0))
+    points.extend(point('A', day, 30) for day in range(1, days + 1))
+    return points
+
+
+def run(points, previous, **kwargs):
+    """Released points and the manifest of streaming ``points`` through buckets."""
+    buckets = DayBuckets(previous, **kwargs)
+    released = []
+    for data_point in points:
+        released.extend(buckets.add(data_point, lambda: None))
+    released.extend(buckets.flush())
+    return released, buckets
+
+
+def test_unchanged_interleaved_export_writes_nothing():
+    """Buckets closed by another type's points still match on their complete digest."""
+    points = interleaved()
+    released, first = run(points, {})
+    assert released == points
+
+    released, second = run(points, first.manifest())
+    assert released == []
+    assert second.unchanged == len(points)
+    assert second.manifest() == first.manifest()
+
+
+def test_only_changed_bucket_is_written():
+    points = interleaved()
+    _, first = run(points, {})
+
+    changed = [dict(p, fields={'value': 9.0}) if p['type'] == 'B' and p['time'] == points[3]['time'] else p
+               for p in points]
+    released, _ = run(changed, first.manifest())
+
+    assert {(p['type'], p['time'] // DAY_NS) for p in released} == {('B', points[3]['time'] // DAY_NS)}
+    assert len(released) == 4
+
+
+def test_waiting_buckets_are_released_past_the_limit():
+    """Buckets short of the last import's points are not held without bound."""
+    points = interleaved(days=5)
+    _, first = run(points, {})
+
+    # Without the repeats every bucket of A stays short of its previous count
+    without_repeats = points[:-5]
+    buckets = DayBuckets(first.manifest(), max_waiting=6)
+    released, peak = [], 0
+    for data_point in without_repeats:
+        released.extend(buckets.add(data_point, lambda: None))
+        peak = max(peak, buckets._waiting_points)
+    assert peak <= 6 + 1
+    assert released  # Before the end of the export
+
+    released.extend(buckets.flush())
+    assert released == [p for p in without_repeats if p['type'] == 'A']
+    assert buckets.unchanged == 20
+
+
+def test_manifest_excludes_buckets():
+    _, buckets = run(interleaved(days=2), {})
+    day = '2024-01-01'
+    assert day in buckets.manifest()['A']
+    assert day not in buckets.manifest(exclude={('A', day)})['A']
+    assert day in buckets.manifest(exclude={('A', day)})['B']
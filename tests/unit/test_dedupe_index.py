@@ -0,0 +1,42 @@
+"""Tests for the local index of written points."""
+
+from apple_health_importer.writers.dedupe import SeriesIndex
+
+
+class StoredKeys:
+    """Stands in for InfluxDBWriter when rebuilding: the series keys stored per measurement."""
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def iter_series_keys(self, measurement):
+        return iter(self.keys.get(measurement, []))
+
+
+def test_index_is_complete_once_rebuilt(tmp_path):
+    index_file = str(tmp_path / "dedupe_index.sqlite")
+    index = SeriesIndex(index_file, target="localhost:8086/health")
+    assert not index.complete
+
+    stored = StoredKeys({'heart_rate': [('HKQuantityTypeIdentifierHeartRate', 'Watch', 1_000_000_000)]})
+    assert index.rebuild(stored, ['heart_rate', 'steps']) == 1
+    assert index.complete
+    index.close()
+
+    reopened = SeriesIndex(index_file, target="localhost:8086/health")
+    assert reopened.complete
+    assert reopened.existing('heart_rate', 0, 2_000_000_000) == {('HKQuantityTypeIdentifierHeartRate', 'Watch', 1_000_000_000)}
+    reopened.close()
+
+
+def test_index_for_another_target_starts_incomplete(tmp_path):
+    """An index emptied for another database must not report that nothing was written."""
+    index_file = str(tmp_path / "dedupe_index.sqlite")
+    index = SeriesIndex(index_file, target="localhost:8086/health")
+    index.rebuild(StoredKeys({'heart_rate': [('HKQuantityTypeIdentifierHeartRate', 'Watch', 1)]}), ['heart_rate'])
+    index.close()
+
+    other = SeriesIndex(index_file, target="localhost:8086/other")
+    assert not other.complete
+    assert other.count() == 0
+    other.close()
@@ -0,0 +1,89 @@
+"""Tests for turning HKDevice descriptions into device tags."""
+
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import pytest
+from influxdb.line_protocol import make_line
+
+from apple_health_importer.config.manager import ConfigManager, expand_device_tags
+from apple_health_importer.parsers.batch import ColumnarBatch
+from apple_health_importer.parsers.health_data import HealthDataParser
+from apple_health_importer.writers.influxdb import InfluxDBWriter
+from apple_health_importer.writers.line_protocol import WRITE_PRECISION, LineProtocolSerializer
+
+
+CONFIG_PATH = Path(__file__).parent.parent.parent / "config" / "measurements_config_comprehensive.yaml"
+
+WATCH = ("<<HKDevice: 0x283a8c0f0>, name:Apple Watch, manufacturer:Apple Inc., model:Watch, "
+         "hardware:Watch6,1, software:9.1, creation date:2022-11-05 10:00:00 +0000>")
+
+
+@pytest.fixture
+def parser():
+    return HealthDataParser("UTC")
+
+
+@pytest.mark.parametrize("device, tags, software", [
+    (WATCH, {'device_name': 'Apple Watch', 'device_model': 'Watch', 'hardware': 'Watch6,1'}, '9.1'),
+    # Missing properties are left out
+    ("<<HKDevice: 0x1>, name:iPhone>", {'device_name': 'iPhone'}, None),
+    ("<<HKDevice: 0x1>, manufacturer:Withings, software:2.0>", {}, '2.0'),
+    ("<<HKDevice: 0x1>, name:, model:Scale>", {'device_model': 'Scale'}, None),
+    # Values may contain commas and spaces
+    ("<<HKDevice: 0x1>, name:Mikko’s Watch, model:Body, Cardio, hardware:1>",
+     {'device_name': 'Mikko’s Watch', 'device_model': 'Body, Cardio', 'hardware': '1'}, None),
+    # Truncated or malformed: no tags carry the object address
+    ("<<HKDevice: 0x1>, name:Trunc, model:Wat", {'device_name': 'Trunc', 'device_model': 'Wat'}, None),
+    ("<<HKDevice: 0x1>>", {}, None),
+    ("<<HKDevice: 0x1>, >", {}, None),
+    ("<<HKDevice garbage", {}, None),
+    # Plain device names
+    ("Polar H10", {'device_name': 'Polar H10'}, None),
+    ("   ", {}, None),
+])
+def test_parse_device(parser, device, tags, software):
+    assert parser.parse_device(device) == (tags, software)
+
+
+def test_device_address_does_not_split_the_cache(parser):
+    """Records of one device differ only in the object address and share a cache entry."""
+    other = WATCH.replace("0x283a8c0f0", "0x283a8c4b0")
+    assert parser.parse_device(other) is parser.parse_device(WATCH)
+
+    # A plain name that reads like HKDevice properties is still a plain name
+    assert parser.parse_device("name:iPhone>") == ({'device_name': 'name:iPhone>'}, None)
+
+
+def test_expand_device_tags():
+    assert expand_device_tags(['source', 'device']) == ['source', 'device_name', 'device_model', 'hardware']
+    assert expand_device_tags(['device_name', 'device', 'source']) == [
+        'device_name', 'device_model', 'hardware', 'source']
+    assert expand_device_tags(['source']) == ['source']
+
+
+def test_device_values_are_escaped_like_the_client(parser):
+    """Tag and string field escaping matches ``make_line`` on both serializer paths."""
+    record = ET.fromstring(
+        '<Record type="HKQuantityTypeIdentifierHeartRate" sourceName="My Watch" unit="count/min" '
+        'device="&lt;&lt;HKDevice: 0x1&gt;, name:A=B c,d\\e, model:Watch, hardware:Watch6,1, '
+        'software:9.1 &quot;beta&quot;&gt;" '
+        'startDate="2024-01-01 08:00:00 +0000" endDate="2024-01-01 08:00:00 +0000" value="61"/>'
+    )
+    data_point = parser.parse_heart_rate(record)
+    assert data_point['tags']['device_name'] == 'A=B c,d\\e'
+    assert data_point['fields']['software_version'] == '9.1 "beta"'
+
+    config_manager = ConfigManager(str(CONFIG_PATH))
+    point = InfluxDBWriter("http://localhost:8086", "u", "p", "db", config_manager).prepare_point(data_point)
+    expected = make_line(point['measurement'], tags=point['tags'], fields=point['fields'],
+                         time=point['time'], precision=WRITE_PRECISION)
+
+    serializer = LineProtocolSerializer(config_manager)
+    batch = ColumnarBatch()
+    batch.append(data_point)
+    (columns,) = batch.series.values()
+
+    assert serializer.point_line(data_point) == expected
+    assert serializer.series_lines(columns) == [expected]
+    assert 'device_name=A\\=B\\ c\\,d\\\\e' in expected
@@ -0,0 +1,148 @@
+"""Differential tests: every XML engine must produce the same elements and points."""
+
+import gzip
+from pathlib import Path
+
+import pytest
+
+from apple_health_importer.config.manager import ConfigManager
+from apple_health_importer.parsers import engines
+from apple_health_importer.parsers.engines import LXML_AVAILABLE, iter_health_elements
+from apple_health_importer.parsers.health_data import HealthDataParser
+from apple_health_importer.parsers.source import ExportReader
+from apple_health_importer.parsers.streaming import StreamingHealthDataProcessor
+from apple_health_importer.validation.validator import HealthDataValidator
+
+
+CONFIG_PATH = Path(__file__).parent.parent.parent / "config" / "measurements_config_comprehensive.yaml"
+
+ENGINES = [
+    pytest.param("lxml", marks=pytest.mark.skipif(not LXML_AVAILABLE, reason="lxml is not installed")),
+    "stdlib",
+    "expat",
+]
+
+# Shaped like a Health app export: internal DTD, nested metadata, correlations,
+# workouts with children, escaped characters and several UTC offsets
+SAMPLE_EXPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation|Workout|ActivitySummary)*)>
+<!ATTLIST HealthData locale CDATA #REQUIRED>
+<!ELEMENT Record ((MetadataEntry|HeartRateVariabilityMetadataList)*)>
+<!ATTLIST Record
+  type          CDATA #REQUIRED
+  unit          CDATA #IMPLIED
+  sourceName    CDATA #REQUIRED
+  value         CDATA #IMPLIED
+>
+]>
+<HealthData locale="fi_FI">
+ <ExportDate value="2024-02-01 08:00:00 +0200"/>
+ <Me HKCharacteristicTypeIdentifierDateOfBirth="1980-01-01"/>
+ <Record type="HKQuantityTypeIdentifierHeartRate" sourceName="Mikon Apple&#160;Watch" sourceVersion="10.2" device="&lt;&lt;HKDevice: 0x283d1c0f0&gt;, name:Apple Watch, manufacturer:Apple Inc., model:Watch, hardware:Watch6,2, software:10.2&gt;" unit="count/min" creationDate="2024-01-05 10:01:12 +0200" startDate="2024-01-05 10:00:00 +0200" endDate="2024-01-05 10:00:00 +0200" value="72">
+  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="1"/>
+ </Record>
+ <Record type="HKQuantityTypeIdentifierHeartRate" sourceName="Polar &amp; Co" unit="count/min" creationDate="2024-01-05 23:30:00 -0500" startDate="2024-01-05 23:30:00 -0500" endDate="2024-01-05 23:30:00 -0500" value="88.5"/>
+ <Record type="HKQuantityTypeIdentifierHeartRateVariabilitySDNN" sourceName="Watch" unit="ms" creationDate="2024-01-06 07:00:00 +0200" startDate="2024-01-06 06:58:00 +0200" endDate="2024-01-06 07:00:00 +0200" value="41.25">
+  <MetadataEntry key="HKAlgorithmVersion" value="2"/>
+  <HeartRateVariabilityMetadataList>
+   <InstantaneousBeatsPerMinute bpm="61" time="6.58.01,20 ap."/>
+   <InstantaneousBeatsPerMinute bpm="63" time="6.58.02,15 ap."/>
+  </HeartRateVariabilityMetadataList>
+ </Record>
+ <Record type="HKQuantityTypeIdentifierStepCount" sourceName="iPhone" unit="count" creationDate="2024-01-06 12:10:00 +0200" startDate="2024-01-06 12:00:00 +0200" endDate="2024-01-06 12:10:00 +0200" value="1034"/>
+ <Record type="HKQuantityTypeIdentifierBodyMass" sourceName="Withings" unit="kg" creationDate="2024-01-07 07:00:00 +0200" startDate="2024-01-07 07:00:00 +0200" endDate="2024-01-07 07:00:00 +0200" value="81.3"/>
+ <Record type="HKCategoryTypeIdentifierSleepAnalysis" sourceName="Watch" creationDate="2024-01-07 07:05:00 +0200" startDate="2024-01-06 23:40:00 +0200" endDate="2024-01-07 06:55:00 +0200" value="HKCategoryValueSleepAnalysisAsleepCore">
+  <MetadataEntry key="HKTimeZone" value="Europe/Helsinki"/>
+ </Record>
+ <Record type="HKQuantityTypeIdentifierHeartRate" sourceName="Watch" unit="count/min" creationDate="2024-01-08 10:00:00 +0200" startDate="not a date" endDate="2024-01-08 10:00:00 +0200" value="70"/>
+ <Record type="HKQuantityTypeIdentifierUnknownToTheImporter" sourceName="Watch" unit="count" creationDate="2024-01-08 10:00:00 +0200" startDate="2024-01-08 10:00:00 +0200" endDate="2024-01-08 10:00:00 +0200" value="3"/>
+ <Correlation type="HKCorrelationTypeIdentifierBloodPressure" sourceName="Omron" creationDate="2024-01-08 09:00:00 +0200" startDate="2024-01-08 09:00:00 +0200" endDate="2024-01-08 09:00:00 +0200">
+  <MetadataEntry key="HKWasUserEntered" value="1"/>
+  <Record type="HKQuantityTypeIdentifierBloodPressureSystolic" sourceName="Omron" unit="mmHg" creationDate="2024-01-08 09:00:00 +0200" startDate="2024-01-08 09:00:00 +0200" endDate="2024-01-08 09:00:00 +0200" value="121"/>
+  <Record type="HKQuantityTypeIdentifierBloodPressureDiastolic" sourceName="Omron" unit="mmHg" creationDate="2024-01-08 09:00:00 +0200" startDate="2024-01-08 09:00:00 +0200" endDate="2024-01-08 09:00:00 +0200" value="79"/>
+ </Correlation>
+ <Workout workoutActivityType="HKWorkoutActivityTypeRunning" duration="31.5" durationUnit="min" totalDistance="5.2" totalDistanceUnit="km" totalEnergyBurned="410" totalEnergyBurnedUnit="kcal" sourceName="Watch" creationDate="2024-01-09 18:40:00 +0200" startDate="2024-01-09 18:05:00 +0200" endDate="2024-01-09 18:36:30 +0200">
+  <MetadataEntry key="HKIndoorWorkout" value="0"/>
+  <WorkoutEvent type="HKWorkoutEventTypeSegment" date="2024-01-09 18:05:00 +0200" duration="10" durationUnit="min"/>
+  <WorkoutStatistics type="HKQuantityTypeIdentifierHeartRate" startDate="2024-01-09 18:05:00 +0200" endDate="2024-01-09 18:36:30 +0200" average="151" unit="count/min"/>
+  <WorkoutRoute sourceName="Watch" creationDate="2024-01-09 18:40:00 +0200" startDate="2024-01-09 18:05:00 +0200" endDate="2024-01-09 18:36:30 +0200">
+   <FileReference path="/workout-routes/route_2024-01-09_6.36pm.gpx"/>
+  </WorkoutRoute>
+ </Workout>
+ <ActivitySummary dateComponents="2024-01-09" activeEnergyBurned="612.5" activeEnergyBurnedGoal="600" activeEnergyBurnedUnit="kcal" appleMoveTime="0" appleMoveTimeGoal="0" appleExerciseTime="48" appleExerciseTimeGoal="30" appleStandHours="11" appleStandHoursGoal="12"/>
+ <ActivitySummary dateComponents="2024-01-10" activeEnergyBurned="0" activeEnergyBurnedGoal="600" activeEnergyBurnedUnit="kcal" appleExerciseTime="0" appleExerciseTimeGoal="30" appleStandHours="0" appleStandHoursGoal="12"/>
+</HealthData>
+"""
+
+
+@pytest.fixture(scope="module")
+def sample_exports(tmp_path_factory):
+    """The sample export as plain XML and gzip-compressed XML."""
+    directory = tmp_path_factory.mktemp("engines")
+    plain = directory / "export.xml"
+    plain.write_text(SAMPLE_EXPORT, encoding="utf-8")
+    compressed = directory / "export.xml.gz"
+    with gzip.open(compressed, "wb") as f:
+        f.write(SAMPLE_EXPORT.encode("utf-8"))
+    return {"xml": str(plain), "gzip": str(compressed)}
+
+
+@pytest.fixture(scope="module")
+def config_manager():
+    return ConfigManager(str(CONFIG_PATH))
+
+
+def snapshot(element):
+    """Tag, attributes and children of an element, as plain Python values."""
+    return (element.tag, dict(element.attrib), [snapshot(child) for child in element])
+
+
+def stream_elements(path, engine):
+    """Snapshots of the elements an engine yields, taken before they are cleared."""
+    if path.endswith(".gz"):
+        with ExportReader(path) as reader:
+            return [snapshot(element) for element in iter_health_elements(reader, engine)]
+    return [snapshot(element) for element in iter_health_elements(path, engine)]
+
+
+def convert_export(path, engine, config_manager):
+    """Data points and stats of streaming an export through the processor."""
+    processor = StreamingHealthDataProcessor(
+        HealthDataParser("Europe/Helsinki"), HealthDataValidator(config_manager), None, None,
+        config_manager, engine=engine
+    )
+    with ExportReader(path) as reader:
+        points = [processor.convert_element(element_type, element)
+                  for element_type, element, _ in processor.stream_xml_elements(reader)]
+    return points, processor.total_stats
+
+
+@pytest.mark.parametrize("export_format", ["xml", "gzip"])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engines_yield_identical_elements(sample_exports, engine, export_format):
+    """Each engine yields the same elements, attributes and nested children as ElementTree."""
+    expected = stream_elements(sample_exports["xml"], "stdlib")
+
+    assert [tag for tag, _, _ in expected].count("Record") == 10
+    assert stream_elements(sample_exports[export_format], engine) == expected
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engines_produce_identical_points(sample_exports, config_manager, engine):
+    """Converting each engine's elements gives the same data points and stats."""
+    expected_points, expected_stats = convert_export(sample_exports["xml"], "stdlib", config_manager)
+    points, stats = convert_export(sample_exports["xml"], engine, config_manager)
+
+    assert sum(point is not None for point in expected_points) == 8
+    assert points == expected_points
+    assert stats == expected_stats
+
+
+def test_expat_engine_handles_chunk_boundaries(sample_exports, monkeypatch):
+    """Elements split across expat feed chunks come out whole."""
+    expected = stream_elements(sample_exports["xml"], "stdlib")
+
+    for chunk_bytes in (1, 7, 64):
+        monkeypatch.setattr(engines, "EXPAT_CHUNK_BYTES", chunk_bytes)
+        assert stream_elements(sample_exports["xml"], "expat") == expected
@@ -0,0 +1,151 @@
+"""Differential tests: reading the indexed blocks a filter selects gives the same elements as a full scan."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytz
+
+from apple_health_importer.parsers import export_index
+from apple_health_importer.parsers.engines import iter_health_elements
+from apple_health_importer.parsers.export_index import ExportIndex
+from apple_health_importer.parsers.filters import ElementFilter
+from apple_health_importer.parsers.source import BlockReader
+
+
+HELSINKI = pytz.timezone("Europe/Helsinki")
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+STEPS = "HKQuantityTypeIdentifierStepCount"
+SYSTOLIC = "HKQuantityTypeIdentifierBloodPressureSystolic"
+DIASTOLIC = "HKQuantityTypeIdentifierBloodPressureDiastolic"
+
+# UTC offsets by day of January 2024: home, a trip west, and a stay in UTC
+OFFSETS = {day: "+0200" for day in range(1, 6)}
+OFFSETS.update({day: "-0700" for day in range(6, 11)})
+OFFSETS.update({day: "+0000" for day in range(11, 16)})
+
+
+def apple_date(day, hour, minute=0):
+    """Apple's date layout for a local time on a day of January 2024."""
+    return f"2024-01-{day:02d} {hour:02d}:{minute:02d}:00 {OFFSETS[day]}"
+
+
+def record(data_type, date, value, indent=" "):
+    return (f'{indent}<Record type="{data_type}" sourceName="Watch" unit="x" '
+            f'creationDate="{date}" startDate="{date}" endDate="{date}" value="{value}"/>\n')
+
+
+def write_export(path):
+    """An export shaped like the Health app's, with each type's records grouped together."""
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<HealthData locale="en_US">\n'
+                ' <ExportDate value="2024-02-01 08:00:00 +0200"/>\n'
+                ' <Me HKCharacteristicTypeIdentifierBiologicalSex="HKBiologicalSexNotSet"/>\n')
+        for day in OFFSETS:
+            for hour in range(0, 24, 3):
+                f.write(record(HEART_RATE, apple_date(day, hour), 60 + hour))
+        for day in OFFSETS:
+            f.write(record(STEPS, apple_date(day, 12), 1000 + day))
+        for day in OFFSETS:
+            # Blood pressure records are repeated inside their correlation
+            date = apple_date(day, 8)
+            f.write(record(SYSTOLIC, date, 120) + record(DIASTOLIC, date, 80))
+            f.write(f' <Correlation type="HKCorrelationTypeIdentifierBloodPressure" sourceName="Cuff" '
+                    f'startDate="{date}" endDate="{date}">\n'
+                    + record(SYSTOLIC, date, 120, indent="  ") + record(DIASTOLIC, date, 80, indent="  ")
+                    + ' </Correlation>\n')
+        for day in OFFSETS:
+            f.write(f' <Workout workoutActivityType="HKWorkoutActivityTypeRunning" duration="30" '
+                    f'durationUnit="min" sourceName="Watch" startDate="{apple_date(day, 7)}" '
+                    f'endDate="{apple_date(day, 7, 30)}">\n'
+                    f'  <WorkoutEvent type="HKWorkoutEventTypeSegment" date="{apple_date(day, 7, 10)}"/>\n'
+                    f' </Workout>\n')
+        for day in OFFSETS:
+            f.write(f' <ActivitySummary dateComponents="2024-01-{day:02d}" activeEnergyBurned="{400 + day}" '
+                    f'activeEnergyBurnedGoal="600" activeEnergyBurnedUnit="Cal"/>\n')
+        f.write('</HealthData>\n')
+    return str(path)
+
+
+def local(day, hour=0):
+    return HELSINKI.localize(datetime(2024, 1, day, hour))
+
+
+def epoch_ns(day, hour):
+    """Epoch ns of ``apple_date(day, hour)``."""
+    when = datetime.strptime(apple_date(day, hour), "%Y-%m-%d %H:%M:%S %z")
+    return int(when.timestamp()) * 1_000_000_000
+
+
+FILTERS = {
+    "types": ElementFilter(types=[HEART_RATE, "HKActivitySummary"]),
+    "excluded types": ElementFilter(exclude_types=[HEART_RATE, STEPS]),
+    # The range edges fall inside the trip west, in another offset than the bounds
+    "since and until": ElementFilter(since=local(7, 3), until=local(9, 21), tz=HELSINKI),
+    # Activity summaries of the days the bounds fall on are kept
+    "days at the edges": ElementFilter(since=local(4, 23), until=local(12, 1), tz=HELSINKI),
+    "watermarks": ElementFilter().with_watermarks({
+        HEART_RATE: epoch_ns(13, 6), SYSTOLIC: epoch_ns(14, 8), DIASTOLIC: epoch_ns(15, 8),
+        "HKWorkoutTypeIdentifier": epoch_ns(15, 7) + 1, STEPS: epoch_ns(2, 12)}),
+    "types and watermarks": ElementFilter(types=[SYSTOLIC], since=local(3), tz=HELSINKI).with_watermarks(
+        {SYSTOLIC: epoch_ns(12, 8)}),
+    "nothing": ElementFilter(since=datetime(2025, 1, 1, tzinfo=timezone.utc)),
+}
+
+
+@pytest.fixture
+def indexed_export(tmp_path, monkeypatch):
+    """The export and its index, with a block per top-level element."""
+    monkeypatch.setattr(export_index, "INDEX_BLOCK_BYTES", 100)
+    path = write_export(tmp_path / "export.xml")
+    index = ExportIndex.build(path, "hash")
+    index.save(path)
+    assert len(index.blocks) == 15 * 8 + 15 + 15 * 2 + 15 + 15
+    return path, ExportIndex.load(path, "hash")
+
+
+def accepted(source, element_filter):
+    """(tag, attributes) of the elements the filter accepts, in order."""
+    return [(element.tag, dict(element.attrib)) for element in iter_health_elements(source, "stdlib")
+            if element_filter.accepts(element)]
+
+
+@pytest.mark.parametrize("name", list(FILTERS))
+@pytest.mark.parametrize("max_range_bytes", [None, 1500])
+def test_indexed_blocks_hold_every_accepted_element(indexed_export, name, max_range_bytes):
+    path, index = indexed_export
+    element_filter = FILTERS[name]
+
+    expected = accepted(path, element_filter)
+    ranges = index.select(element_filter.may_accept, max_range_bytes)
+    with BlockReader(path, ranges) as reader:
+        assert accepted(reader, element_filter) == expected
+
+    if max_range_bytes is not None:
+        assert len(ranges) >= len(index.select(element_filter.may_accept))
+    if name == "nothing":
+        assert expected == [] and ranges == []
+    elif name != "excluded types":
+        # Selective filters skip part of the export
+        assert sum(end - start for start, end in ranges) < index.total_bytes
+
+
+def test_index_counts_elements(indexed_export):
+    _, index = indexed_export
+    # Nested correlation records are counted with the top-level ones
+    assert index.element_counts == {"Record": 15 * 8 + 15 + 15 * 4, "Workout": 15, "ActivitySummary": 15}
+
+
+def test_stale_index_is_not_loaded(indexed_export):
+    path, _ = indexed_export
+    assert ExportIndex.load(path, "another hash") is None
+
+
+def test_activity_summaries_of_edge_days_are_kept(indexed_export):
+    """A summary's day overlaps the range in the filter's timezone whatever the UTC offset."""
+    path, index = indexed_export
+    element_filter = FILTERS["days at the edges"]
+    with BlockReader(path, index.select(element_filter.may_accept)) as reader:
+        days = [attributes["dateComponents"] for tag, attributes in accepted(reader, element_filter)
+                if tag == "ActivitySummary"]
+    assert days == [f"2024-01-{day:02d}" for day in range(4, 13)]
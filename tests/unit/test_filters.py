@@ -0,0 +1,123 @@
+"""Tests for rejecting export elements by time on their raw date strings."""
+
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytz
+
+from apple_health_importer.parsers.filters import ElementFilter
+
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+STEPS = "HKQuantityTypeIdentifierStepCount"
+
+LOS_ANGELES = pytz.timezone("America/Los_Angeles")
+
+SINCE = datetime(2024, 3, 10, 12, 0, tzinfo=timezone.utc)
+UNTIL = datetime(2024, 3, 11, 6, 30, tzinfo=timezone.utc)
+
+OFFSETS = {"+0300": timedelta(hours=3), "+0000": timedelta(0), "-0700": timedelta(hours=-7)}
+
+SECOND = timedelta(seconds=1)
+
+
+def apple_date(when, offset):
+    """Apple's layout for a UTC time, written in a "+HHMM" offset."""
+    local = when.astimezone(timezone.utc).replace(tzinfo=None) + OFFSETS[offset]
+    return f"{local:%Y-%m-%d %H:%M:%S} {offset}"
+
+
+def record(start_date, data_type=HEART_RATE):
+    return ET.Element("Record", type=data_type, startDate=start_date, endDate=start_date, value="60")
+
+
+def summary(day):
+    return ET.Element("ActivitySummary", dateComponents=day, activeEnergyBurned="400")
+
+
+def epoch_ns(when):
+    return int(when.timestamp()) * 1_000_000_000
+
+
+@pytest.mark.parametrize("offset", list(OFFSETS))
+def test_since_is_inclusive_and_until_exclusive(offset):
+    """The bounds hold in every UTC offset, whatever local day they fall on there."""
+    element_filter = ElementFilter(since=SINCE, until=UNTIL)
+
+    assert not element_filter.accepts(record(apple_date(SINCE - SECOND, offset)))
+    assert element_filter.accepts(record(apple_date(SINCE, offset)))
+    assert element_filter.accepts(record(apple_date(UNTIL - SECOND, offset)))
+    assert not element_filter.accepts(record(apple_date(UNTIL, offset)))
+
+
+def test_bounds_in_another_timezone():
+    """Bounds given in a local timezone compare with dates written in any offset."""
+    since = LOS_ANGELES.localize(datetime(2024, 3, 10, 5, 0))  # 12:00 UTC
+    element_filter = ElementFilter(since=since, tz=LOS_ANGELES)
+
+    for offset in OFFSETS:
+        assert not element_filter.accepts(record(apple_date(SINCE - SECOND, offset)))
+        assert element_filter.accepts(record(apple_date(SINCE, offset)))
+
+
+@pytest.mark.parametrize("fraction_ns", [0, 1, 999_999_999])
+@pytest.mark.parametrize("offset", list(OFFSETS))
+def test_watermark_keeps_the_next_whole_second(offset, fraction_ns):
+    """Points at or before the mark are rejected; Apple times are whole seconds."""
+    mark = SINCE + timedelta(hours=2)
+    element_filter = ElementFilter().with_watermarks({HEART_RATE: epoch_ns(mark) + fraction_ns})
+
+    assert not element_filter.accepts(record(apple_date(mark - SECOND, offset)))
+    assert not element_filter.accepts(record(apple_date(mark, offset)))
+    assert element_filter.accepts(record(apple_date(mark + SECOND, offset)))
+
+    # Other types have no mark
+    assert element_filter.accepts(record(apple_date(mark, offset), STEPS))
+
+
+def test_watermark_and_since_use_the_later_bound():
+    element_filter = ElementFilter(types=[HEART_RATE, STEPS], since=SINCE, until=UNTIL)
+    marked = element_filter.with_watermarks({HEART_RATE: epoch_ns(SINCE + timedelta(hours=1)),
+                                             STEPS: epoch_ns(SINCE - timedelta(hours=1))})
+
+    assert not marked.accepts(record(apple_date(SINCE + timedelta(hours=1), "+0300")))
+    assert marked.accepts(record(apple_date(SINCE + timedelta(hours=1, seconds=1), "+0300")))
+    assert marked.accepts(record(apple_date(SINCE, "-0700"), STEPS))
+    assert not marked.accepts(record(apple_date(UNTIL, "-0700"), STEPS))
+
+    # The copy keeps the other conditions; the original has no marks
+    assert not marked.accepts(record(apple_date(SINCE + timedelta(hours=2), "+0000"), "HKOther"))
+    assert element_filter.accepts(record(apple_date(SINCE, "+0300")))
+
+
+@pytest.mark.parametrize("start_date", [
+    "2024-03-01T08:00:00Z",
+    "2024-03-01 08:00:00 +03:00",
+    "2024-03-01 08:00:00 UTC",
+    "2024-03-01 08:00:00 +0x00",
+    "2024-03-01",
+    "",
+])
+def test_dates_in_other_layouts_are_left_to_the_parser(start_date):
+    """Dates far outside the range are kept when they do not have Apple's layout."""
+    element_filter = ElementFilter(since=SINCE, until=UNTIL).with_watermarks({HEART_RATE: epoch_ns(UNTIL)})
+    assert element_filter.accepts(record(start_date))
+
+
+def test_activity_summaries_of_the_days_at_the_edges():
+    """A summary is kept when its day in ``tz`` overlaps ``[since, until)``."""
+    # 2024-01-10 21:00 to 2024-01-13 00:00 in Los Angeles (UTC-8)
+    element_filter = ElementFilter(since=datetime(2024, 1, 11, 5, 0, tzinfo=timezone.utc),
+                                   until=LOS_ANGELES.localize(datetime(2024, 1, 13, 0, 0)), tz=LOS_ANGELES)
+    kept = [day for day in range(8, 16) if element_filter.accepts(summary(f"2024-01-{day:02d}"))]
+    assert kept == [10, 11, 12]
+
+    # A second into a day overlaps it
+    element_filter = ElementFilter(until=LOS_ANGELES.localize(datetime(2024, 1, 13, 0, 0, 1)), tz=LOS_ANGELES)
+    assert element_filter.accepts(summary("2024-01-13"))
+    assert not element_filter.accepts(summary("2024-01-14"))
+
+    # Summaries are filtered by type like any other element, and odd dates pass
+    assert not ElementFilter(types=[HEART_RATE], since=SINCE).accepts(summary("2024-03-10"))
+    assert ElementFilter(since=SINCE).accepts(summary("1/3/2024"))
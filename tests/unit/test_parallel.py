@@ -0,0 +1,109 @@
+"""Parsing an export in worker processes gives the same points as a single-process import."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from apple_health_importer.config.manager import ConfigManager
+from apple_health_importer.parsers.health_data import HealthDataParser
+from apple_health_importer.parsers.streaming import ProgressCheckpoint, StreamingHealthDataProcessor
+from apple_health_importer.tracking.tracker import ImportTracker
+from apple_health_importer.validation.validator import HealthDataValidator
+
+
+CONFIG_PATH = Path(__file__).parent.parent.parent / "config" / "measurements_config_comprehensive.yaml"
+
+
+class RecordingWriter:
+    """Stands in for InfluxDBWriter and keeps the points of every batch."""
+
+    target = "localhost:8086/health"
+
+    def __init__(self):
+        self.points = []
+
+    def write_batch_streaming(self, batch):
+        points = list(batch.iter_points())
+        self.points.extend(points)
+        return {'written': len(points), 'duplicates': 0, 'errors': 0}
+
+
+def write_export(path):
+    """An export of several days of records, blood pressure correlations, workouts and summaries."""
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<HealthData locale="en_US">\n'
+                ' <ExportDate value="2024-02-01 08:00:00 +0200"/>\n')
+        for day in range(1, 11):
+            for hour in range(24):
+                date = f"2024-01-{day:02d} {hour:02d}:00:00 +0200"
+                f.write(f' <Record type="HKQuantityTypeIdentifierHeartRate" sourceName="Watch {day % 3}" '
+                        f'unit="count/min" startDate="{date}" endDate="{date}" value="{60 + hour}"/>\n'
+                        f' <Record type="HKQuantityTypeIdentifierStepCount" sourceName="iPhone" unit="count" '
+                        f'startDate="{date}" endDate="{date}" value="{100 * day + hour}"/>\n')
+            date = f"2024-01-{day:02d} 08:00:00 +0200"
+            f.write(f' <Correlation type="HKCorrelationTypeIdentifierBloodPressure" sourceName="Cuff" '
+                    f'startDate="{date}" endDate="{date}">\n'
+                    f'  <Record type="HKQuantityTypeIdentifierBloodPressureSystolic" sourceName="Cuff" '
+                    f'unit="mmHg" startDate="{date}" endDate="{date}" value="{115 + day}"/>\n'
+                    f'  <Record type="HKQuantityTypeIdentifierBloodPressureDiastolic" sourceName="Cuff" '
+                    f'unit="mmHg" startDate="{date}" endDate="{date}" value="{75 + day}"/>\n'
+                    f' </Correlation>\n'
+                    f' <Workout workoutActivityType="HKWorkoutActivityTypeRunning" duration="30" '
+                    f'durationUnit="min" totalDistance="5" totalDistanceUnit="km" sourceName="Watch" '
+                    f'startDate="2024-01-{day:02d} 07:00:00 +0200" endDate="2024-01-{day:02d} 07:30:00 +0200"/>\n'
+                    f' <ActivitySummary dateComponents="2024-01-{day:02d}" activeEnergyBurned="{400 + day}" '
+                    f'activeEnergyBurnedGoal="600" activeEnergyBurnedUnit="Cal"/>\n')
+        f.write('</HealthData>\n')
+    return str(path)
+
+
+def point_key(point):
+    return json.dumps(point, sort_keys=True, default=str)
+
+
+@pytest.fixture
+def import_export():
+    """Import an export with a fresh tracker; returns the processor, its stats and the written points."""
+    config_manager = ConfigManager(str(CONFIG_PATH))
+
+    def run(export, state_dir, jobs=None):
+        state_dir.mkdir()
+        writer = RecordingWriter()
+        processor = StreamingHealthDataProcessor(
+            HealthDataParser("Europe/Helsinki"), HealthDataValidator(config_manager), writer,
+            ImportTracker(str(state_dir / "import_history.json")), config_manager,
+            process_batch_size=50, engine="stdlib", write_workers=2
+        )
+        processor.checkpoint = ProgressCheckpoint(str(state_dir / "import_progress.json"))
+        if jobs is None:
+            stats = processor.process_file_streaming(export)
+        else:
+            stats = processor.process_file_parallel(export, jobs)
+        return processor, stats, writer.points
+
+    return run
+
+
+def test_parallel_import_writes_the_same_points(tmp_path, import_export, monkeypatch):
+    export = write_export(tmp_path / "export.xml")
+    # Small ranges, so each worker parses several and results queue up in file order
+    monkeypatch.setattr(StreamingHealthDataProcessor, "PARALLEL_RANGE_BYTES", 4096)
+
+    single, single_stats, single_points = import_export(export, tmp_path / "single")
+    parallel, parallel_stats, parallel_points = import_export(export, tmp_path / "parallel", jobs=3)
+
+    assert len(single_points) == single_stats['written'] > 10 * 24 * 2
+    assert parallel_stats['written'] == single_stats['written']
+    assert sorted(map(point_key, parallel_points)) == sorted(map(point_key, single_points))
+
+    # Counters merged from the workers match the single process's
+    for key in ('errors', 'validation_errors', 'unknown_types', 'filtered'):
+        assert parallel_stats[key] == single_stats[key], key
+    assert parallel.element_counts == single.element_counts
+
+    # Each range interns its own tag values; the tables' sizes are added up
+    assert single_stats['string_tables'] == 1
+    assert parallel_stats['string_tables'] > 3
+    assert parallel_stats['tag_values'] > single_stats['tag_values'] > 1
+    assert not (tmp_path / "parallel" / "import_progress.json").exists()
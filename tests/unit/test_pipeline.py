@@ -0,0 +1,80 @@
+"""Tests for writing batches on background threads with in-order acknowledgement."""
+
+import threading
+
+import pytest
+
+from apple_health_importer.writers.pipeline import WriteBehindPipeline
+
+
+class GatedWrites:
+    """A write function whose calls block until their batch is released; some batches raise."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.gates = {}
+        self.lock = threading.Lock()
+
+    def gate(self, batch):
+        with self.lock:
+            return self.gates.setdefault(batch, threading.Event())
+
+    def release(self, *batches):
+        for batch in batches:
+            self.gate(batch).set()
+
+    def __call__(self, batch):
+        assert self.gate(batch).wait(timeout=5)
+        if batch in self.fail:
+            raise ConnectionError(f"batch {batch} failed")
+        return {'written': 1, 'errors': 0}
+
+
+def wait_for_results(pipeline, count):
+    """Block until ``count`` writes have completed, acknowledged or not."""
+    with pipeline._condition:
+        assert pipeline._condition.wait_for(lambda: len(pipeline._results) >= count, timeout=5)
+
+
+def test_acknowledged_in_submission_order():
+    """Batches completing out of order are only acknowledged once every earlier one has."""
+    writes = GatedWrites()
+    with WriteBehindPipeline(writes, workers=3) as pipeline:
+        for batch in range(3):
+            pipeline.submit(batch, context=f"after {batch}")
+
+        writes.release(2)
+        wait_for_results(pipeline, 1)
+        assert pipeline.acknowledged() == []
+        assert pipeline.pending == 3
+
+        writes.release(0)
+        wait_for_results(pipeline, 2)
+        assert [context for context, _ in pipeline.acknowledged()] == ["after 0"]
+
+        writes.release(1)
+        assert [context for context, _ in pipeline.acknowledged(wait=True)] == ["after 1", "after 2"]
+        assert pipeline.pending == 0
+
+
+def test_failed_write_raises_after_the_written_prefix():
+    """The batches before a failed write are returned first; the failure is raised on the next call."""
+    writes = GatedWrites(fail={1})
+    with WriteBehindPipeline(writes, workers=2) as pipeline:
+        for batch in range(4):
+            pipeline.submit(batch, context=batch)
+
+        # Batches after the failed one complete first
+        writes.release(3, 2, 1)
+        wait_for_results(pipeline, 3)
+        assert pipeline.acknowledged() == []
+
+        writes.release(0)
+        assert [context for context, _ in pipeline.acknowledged(wait=True)] == [0]
+        with pytest.raises(ConnectionError, match="batch 1 failed"):
+            pipeline.acknowledged(wait=True)
+
+        # Nothing after the failed batch is ever acknowledged
+        with pytest.raises(ConnectionError):
+            pipeline.acknowledged()
+        assert pipeline.pending == 3
@@ -0,0 +1,220 @@
+"""Streaming imports whose writes fail: watermarks, manifests and checkpoints."""
+
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from apple_health_importer.config.manager import ConfigManager
+from apple_health_importer.parsers.health_data import HealthDataParser
+from apple_health_importer.parsers.streaming import ProgressCheckpoint, StreamingHealthDataProcessor
+from apple_health_importer.tracking.tracker import ImportTracker
+from apple_health_importer.validation.validator import HealthDataValidator
+
+
+CONFIG_PATH = Path(__file__).parent.parent.parent / "config" / "measurements_config_comprehensive.yaml"
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+
+START = datetime(2024, 1, 1, 8, 0, tzinfo=timezone.utc)
+
+
+class FlakyWriter:
+    """Stands in for InfluxDBWriter; the calls numbered in ``fail`` come back with write errors
+    and the one numbered ``raise_on`` raises."""
+
+    def __init__(self, fail=(), raise_on=None, target="localhost:8086/health"):
+        self.target = target
+        self.fail = set(fail)
+        self.raise_on = raise_on
+        self.calls = 0
+        self.points = []
+
+    def write_batch_streaming(self, batch):
+        self.calls += 1
+        points = list(batch.iter_points())
+        if self.calls == self.raise_on:
+            raise ConnectionError("InfluxDB went away")
+        if self.calls in self.fail:
+            return {'written': 0, 'duplicates': 0, 'errors': len(points)}
+        self.points.extend(points)
+        return {'written': len(points), 'duplicates': 0, 'errors': 0}
+
+
+def write_export(path, records, step=1):
+    """An export of one heart rate record every ``step`` minutes from START."""
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<HealthData locale="en_US">\n')
+        for i in range(records):
+            date = (START + timedelta(minutes=i * step)).strftime("%Y-%m-%d %H:%M:%S +0000")
+            f.write(f' <Record type="{HEART_RATE}" sourceName="Watch" unit="count/min" '
+                    f'startDate="{date}" endDate="{date}" value="{60 + i % 40}"/>\n')
+        f.write('</HealthData>\n')
+    return str(path)
+
+
+def minute_ns(minute):
+    """Epoch ns of the record written ``minute`` minutes after START."""
+    return int((START + timedelta(minutes=minute)).timestamp()) * 1_000_000_000
+
+
+@pytest.fixture(scope="module")
+def config_manager():
+    return ConfigManager(str(CONFIG_PATH))
+
+
+@pytest.fixture
+def make_processor(tmp_path, config_manager):
+    """Processors sharing one tracker and checkpoint file, writing through ``writer``."""
+    tracker = ImportTracker(str(tmp_path / "import_history.json"))
+
+    def make(writer, batch_size=10):
+        processor = StreamingHealthDataProcessor(
+            HealthDataParser("UTC"), HealthDataValidator(config_manager), writer, tracker,
+            config_manager, process_batch_size=batch_size, checkpoint_interval=batch_size,
+            engine="stdlib", write_workers=1
+        )
+        processor.checkpoint = ProgressCheckpoint(str(tmp_path / "import_progress.json"))
+        return processor
+
+    return make
+
+
+def test_watermark_stays_below_failed_batch(tmp_path, make_processor):
+    """A later successful batch does not move the watermark past a failed one."""
+    export = write_export(tmp_path / "export.xml", 30)
+
+    make_processor(FlakyWriter(fail={2})).process_file_streaming(export)
+
+    tracker = make_processor(None).tracker
+    assert tracker.get_type_watermarks()[HEART_RATE] == minute_ns(10) - 1
+    assert not tracker.is_file_already_imported(export)
+
+    # The next incremental run retries the failed points
+    retry = FlakyWriter()
+    make_processor(retry).process_file_streaming(export, incremental=True)
+
+    assert sorted(point['time'] for point in retry.points) == [minute_ns(i) for i in range(10, 30)]
+    assert tracker.get_type_watermarks()[HEART_RATE] == minute_ns(29)
+    assert tracker.is_file_already_imported(export)
+
+
+def test_days_of_failed_writes_are_written_again(tmp_path, make_processor):
+    """The manifest leaves out the days of failed batches, so --changed-days does not skip them."""
+    export = write_export(tmp_path / "export.xml", 48, step=60)
+
+    failing = FlakyWriter(fail={1})
+    make_processor(failing).process_file_streaming(export, changed_days=True)
+    assert failing.calls > 1
+
+    retry = FlakyWriter()
+    stats = make_processor(retry).process_file_streaming(export, force=True, changed_days=True)
+    assert sorted(point['time'] for point in failing.points + retry.points) == [
+        minute_ns(i * 60) for i in range(48)]
+    assert stats['unchanged'] == len(failing.points)
+
+    again = FlakyWriter()
+    make_processor(again).process_file_streaming(export, force=True, changed_days=True)
+    assert again.points == []
+
+
+def test_day_digests_are_kept_per_target(tmp_path, make_processor):
+    """A --changed-days import into another database writes every day."""
+    export = write_export(tmp_path / "export.xml", 48, step=60)
+    make_processor(FlakyWriter()).process_file_streaming(export, changed_days=True)
+
+    other = FlakyWriter(target="localhost:8086/other")
+    make_processor(other).process_file_streaming(export, force=True, changed_days=True)
+    assert len(other.points) == 48
+
+    tracker = make_processor(None).tracker
+    assert tracker.get_day_digests("localhost:8086/health") == tracker.get_day_digests("localhost:8086/other")
+    assert list(tmp_path.glob("import_manifest.json*")) == [tmp_path / "import_manifest.json"]
+
+
+def test_manifest_without_targets_is_ignored(tmp_path, make_processor):
+    """Manifests from before digests were kept per target could belong to any database."""
+    (tmp_path / "import_manifest.json").write_text(json.dumps({HEART_RATE: {"2024-01-01": "16:0"}}))
+    assert make_processor(None).tracker.get_day_digests("localhost:8086/health") == {}
+
+
+def test_resume_after_failed_write(tmp_path, make_processor):
+    """A resumed import writes exactly the points after the last acknowledged batch."""
+    export = write_export(tmp_path / "export.xml", 45)
+
+    interrupted = FlakyWriter(raise_on=3)
+    with pytest.raises(ConnectionError):
+        make_processor(interrupted).process_file_streaming(export)
+
+    checkpoint = ProgressCheckpoint(str(tmp_path / "import_progress.json"))
+    assert checkpoint.can_resume(make_processor(None).tracker.get_file_hash(export))
+    assert checkpoint.get_resume_position()['records'] == 20
+    assert checkpoint.get_resume_offset() is not None
+
+    resumed = FlakyWriter()
+    stats = make_processor(resumed).process_file_streaming(export)
+
+    # Batches after the failed one may have been written too; those are written again
+    assert sorted(point['time'] for point in resumed.points) == [minute_ns(i) for i in range(20, 45)]
+    assert {point['time'] for point in interrupted.points} >= {minute_ns(i) for i in range(20)}
+    assert stats['written'] == 45
+    assert not (tmp_path / "import_progress.json").exists()
+
+
+def test_resume_from_count_only_checkpoint(tmp_path, make_processor):
+    """Checkpoints without a byte offset resume by re-parsing and skipping by count."""
+    export = write_export(tmp_path / "export.xml", 25)
+    file_hash = make_processor(None).tracker.get_file_hash(export)
+    ProgressCheckpoint(str(tmp_path / "import_progress.json")).save_checkpoint(
+        file_hash, {'records': 10, 'workouts': 0, 'activities': 0}, {'written': 10})
+
+    checkpoint = ProgressCheckpoint(str(tmp_path / "import_progress.json"))
+    assert checkpoint.get_resume_offset() is None
+    assert checkpoint.get_resume_stats() == {'written': 10}
+
+    resumed = FlakyWriter()
+    stats = make_processor(resumed).process_file_streaming(export)
+
+    assert [point['time'] for point in resumed.points] == [minute_ns(i) for i in range(10, 25)]
+    assert stats['written'] == 25
+
+
+@pytest.mark.parametrize("failed_batch", [1, 2])
+def test_resume_after_failed_batch_and_interruption(tmp_path, make_processor, failed_batch):
+    """The checkpoint never passes a batch acknowledged with write errors."""
+    export = write_export(tmp_path / "export.xml", 60)
+
+    interrupted = FlakyWriter(fail={failed_batch}, raise_on=4)
+    with pytest.raises(ConnectionError):
+        make_processor(interrupted).process_file_streaming(export)
+
+    checkpoint = ProgressCheckpoint(str(tmp_path / "import_progress.json"))
+    assert checkpoint.get_resume_position()['records'] == (failed_batch - 1) * 10
+
+    resumed = FlakyWriter()
+    make_processor(resumed).process_file_streaming(export)
+
+    written = {point['time'] for point in interrupted.points + resumed.points}
+    assert written == {minute_ns(i) for i in range(60)}
+    tracker = make_processor(None).tracker
+    assert tracker.is_file_already_imported(export)
+    assert tracker.get_type_watermarks()[HEART_RATE] == minute_ns(59)
+
+
+def test_incremental_import_keeps_checkpoints_without_an_index(tmp_path, make_processor):
+    """Watermark filters read the whole export unless an index was built with --build-index."""
+    make_processor(FlakyWriter()).process_file_streaming(write_export(tmp_path / "first.xml", 30))
+
+    export = write_export(tmp_path / "export.xml", 60)
+    interrupted = FlakyWriter(raise_on=2)
+    with pytest.raises(ConnectionError):
+        make_processor(interrupted).process_file_streaming(export, incremental=True)
+
+    assert not (tmp_path / "export.xml.index.json").exists()
+    checkpoint = ProgressCheckpoint(str(tmp_path / "import_progress.json"))
+    assert checkpoint.get_resume_position()['records'] == 40
+
+    resumed = FlakyWriter()
+    make_processor(resumed).process_file_streaming(export, incremental=True)
+    assert sorted(point['time'] for point in resumed.points) == [minute_ns(i) for i in range(40, 60)]